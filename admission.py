@@ -0,0 +1,209 @@
+import os
+import math
+import time
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+# Admission control configuration
+ADMISSION_GPT_CONCURRENCY = int(os.getenv("ADMISSION_GPT_CONCURRENCY", "16"))
+ADMISSION_VIDEO_CONCURRENCY = int(os.getenv("ADMISSION_VIDEO_CONCURRENCY", "32"))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "64"))
+# Requests that would queue longer than this are turned away instead
+ADMISSION_LATENCY_TARGET = float(os.getenv("ADMISSION_LATENCY_TARGET", "10"))
+
+# Starting guesses for how long each stage holds its slot, refined as turns finish
+GPT_HOLD_SECONDS = 5.0
+VIDEO_HOLD_SECONDS = 30.0
+HOLD_SMOOTHING = 0.2
+MAX_RETRY_AFTER_SECONDS = 120
+
+
+class Overloaded(Exception):
+    """Raised when a stage is too busy to take another request within the latency target."""
+
+    def __init__(self, stage, retry_after):
+        self.stage = stage
+        self.retry_after = min(max(1, math.ceil(retry_after)), MAX_RETRY_AFTER_SECONDS)
+        super().__init__(f"Server is busy ({stage}), retry in {self.retry_after}s")
+
+
+class Slot:
+    """A held stage slot, released when its ``with`` block ends."""
+
+    def __init__(self, stage, acquired_at):
+        self._stage = stage
+        self._acquired_at = acquired_at
+        self._released = False
+
+    def detach(self):
+        """Hand the slot over to a new Slot that outlives this ``with`` block."""
+        self._released = True
+        return Slot(self._stage, self._acquired_at)
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._stage.release(time.monotonic() - self._acquired_at)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class Stage:
+    """Concurrency limit for one pipeline stage with a bounded, latency-aware queue.
+
+    Waiters queue in arrival order. A request is rejected up front when the
+    queue is full or its expected wait (queue length / limit x average hold
+    time) exceeds the latency target, and gives up if it still hasn't been
+    admitted by then.
+    """
+
+    def __init__(self, name, limit, hold_seconds, max_queue=ADMISSION_MAX_QUEUE,
+                 latency_target=ADMISSION_LATENCY_TARGET):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.latency_target = latency_target
+        self._avg_hold = hold_seconds
+        self._active = 0
+        self._waiters = deque()
+        self._lock = threading.Lock()
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    @property
+    def avg_hold_seconds(self):
+        return self._avg_hold
+
+    def expected_wait(self, extra=1):
+        """Seconds a request arriving now would queue before getting a slot."""
+        with self._lock:
+            return self._expected_wait(extra)
+
+    def check(self, ahead=0.0):
+        """Raise Overloaded if a request reaching this stage ``ahead`` seconds from now would be shed."""
+        with self._lock:
+            wait = self._expected_wait() - ahead
+            if len(self._waiters) >= self.max_queue or wait > self.latency_target:
+                self.rejected += 1
+                raise Overloaded(self.name, wait)
+
+    def acquire(self):
+        """Wait for a slot, raising Overloaded if it can't be had within the latency target."""
+        future = self._enqueue()
+        if future is None:
+            return Slot(self, time.monotonic())
+        try:
+            return Slot(self, future.result(timeout=self.latency_target))
+        except FutureTimeoutError:
+            return self._abandon(future)
+
+    async def acquire_async(self):
+        """Like acquire(), without blocking the event loop."""
+        future = self._enqueue()
+        if future is None:
+            return Slot(self, time.monotonic())
+        try:
+            # shield() so giving up never cancels a grant that is already on its way
+            return Slot(self, await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)),
+                                                     self.latency_target))
+        except asyncio.TimeoutError:
+            return self._abandon(future)
+        except asyncio.CancelledError:
+            try:
+                self._abandon(future).release()
+            except Overloaded:
+                pass
+            raise
+
+    def release(self, held_seconds):
+        """Hand the slot to the next waiter, or free it."""
+        now = time.monotonic()
+        with self._lock:
+            self._avg_hold += HOLD_SMOOTHING * (held_seconds - self._avg_hold)
+            if self._waiters:
+                future = self._waiters.popleft()
+                self._record_wait(now - future.enqueued_at)
+                future.set_result(now)
+            else:
+                self._active -= 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "limit": self.limit,
+                "active": self._active,
+                "queued": len(self._waiters),
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "timed_out": self.timed_out,
+                "avg_wait_seconds": round(self.wait_seconds / self.admitted, 4) if self.admitted else 0.0,
+                "max_wait_seconds": round(self.max_wait_seconds, 4),
+                "avg_hold_seconds": round(self._avg_hold, 2),
+                "expected_wait_seconds": round(self._expected_wait(), 2)
+            }
+
+    def _expected_wait(self, extra=1):
+        if self._active < self.limit:
+            return 0.0
+        return (len(self._waiters) + extra) / self.limit * self._avg_hold
+
+    def _record_wait(self, waited):
+        self.admitted += 1
+        self.wait_seconds += waited
+        self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+    def _enqueue(self):
+        """Take a free slot (returns None) or join the queue (returns a Future)."""
+        with self._lock:
+            if self._active < self.limit:
+                self._active += 1
+                self._record_wait(0.0)
+                return None
+            wait = self._expected_wait()
+            if len(self._waiters) >= self.max_queue or wait > self.latency_target:
+                self.rejected += 1
+                raise Overloaded(self.name, wait)
+            future = Future()
+            future.enqueued_at = time.monotonic()
+            self._waiters.append(future)
+            return future
+
+    def _abandon(self, future):
+        """Leave the queue after giving up. Returns the slot if it was granted meanwhile."""
+        with self._lock:
+            if future in self._waiters:
+                self._waiters.remove(future)
+                self.timed_out += 1
+                raise Overloaded(self.name, self._expected_wait())
+        return Slot(self, future.result())
+
+
+class AdmissionController:
+    """Per-stage admission for chat turns: GPT calls and video renders are limited separately."""
+
+    def __init__(self):
+        self.gpt = Stage("gpt", ADMISSION_GPT_CONCURRENCY, GPT_HOLD_SECONDS)
+        self.video = Stage("video", ADMISSION_VIDEO_CONCURRENCY, VIDEO_HOLD_SECONDS)
+
+    def check(self):
+        """Shed a new turn before it spends any GPT tokens if either stage is backed up.
+
+        The video stage is checked for when the turn will reach it, after its GPT call.
+        """
+        self.gpt.check()
+        self.video.check(ahead=self.gpt.expected_wait(extra=0) + self.gpt.avg_hold_seconds)
+
+    def stats(self):
+        return {
+            "gpt": self.gpt.stats(),
+            "video": self.video.stats()
+        }
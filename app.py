@@ -1,11 +1,38 @@
 import os
+import hmac
 import time
+import uuid
+import queue
+import contextvars
+import functools
 import requests
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, render_template, g, stream_with_context, send_file
 from flask_cors import CORS
 from dotenv import load_dotenv
 import openai
 import logging
+import http_client
+import metrics
+import tracing
+import structured_logging
+from concurrent.futures import ThreadPoolExecutor, Future, TimeoutError as FutureTimeoutError
+from jobs import JobStore, STAGE_COMPLETED, STAGE_ERROR
+from video_status import VideoStatusPoller, VideoRenderError, verify_signature, parse_event
+from event_stream import EventChannels
+from ws_server import ConversationServer, WS_PORT
+from response_cache import ResponseCache, cache_key
+from semantic_cache import SemanticCache, SEMANTIC_CACHE_ENABLED
+from render_dedup import RenderRegistry, render_key
+from reply_library import ReplyLibrary
+from admission import AdmissionController, Overloaded
+from model_router import ModelRouter
+from hedging import Hedger
+from audio_store import AudioStore, AUDIO_CACHE_DIR
+from local_tts import LocalTTS, LOCAL_TTS_ENABLED, LOCAL_TTS_TIMEOUT
+from speech_stream import SpeechSplitter, ELEVENLABS_API_KEY, AUDIO_CHUNK_BYTES, speech_request, speech_key, content_type
+from circuit_breaker import (CircuitBreaker, CircuitOpen, CIRCUIT_OPENAI_SLOW_SECONDS, CIRCUIT_HEYGEN_SLOW_SECONDS,
+                             CIRCUIT_ELEVENLABS_SLOW_SECONDS)
+from conversation_memory import ConversationMemory, CONVERSATION_SUMMARY_ENABLED, CONVERSATION_SUMMARY_TOKENS
 
 # Load environment variables
 load_dotenv()
@@ -17,11 +44,8 @@ print(f"HEYGEN_API_KEY present: {'Yes' if os.getenv('HEYGEN_API_KEY') else 'No'}
 print(f"HEYGEN_API_KEY length: {len(os.getenv('HEYGEN_API_KEY', '')) if os.getenv('HEYGEN_API_KEY') else 0}")
 print("=================================")
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
+# Configure logging: JSON lines written from a background thread, with secrets redacted
+structured_logging.configure()
 
 # Validate required environment variables
 required_env_vars = ['OPENAI_API_KEY', 'HEYGEN_API_KEY']
@@ -33,18 +57,77 @@ if missing_vars:
 app = Flask(__name__)
 CORS(app)
 
+# Background executor for job mode (/chat with "async": true)
+job_store = JobStore()
+
+
+# Server-Sent Events channels for /api/messages and the threads that run streamed turns
+event_channels = EventChannels()
+# Identical renders share one HeyGen job, across threads and workers
+render_registry = RenderRegistry()
+
+# Finished turns (reply text and video URL) for repeat questions
+response_cache = ResponseCache()
+
+# Per-stage concurrency limits; turns that would queue too long get a 503
+admission = AdmissionController()
+
+# Picks a GPT model per message from GPT_MODELS and routes around slow or failing ones
+gpt_router = ModelRouter()
+# The routed model plus one fallback
+GPT_MAX_ATTEMPTS = 2
+GPT_TIMEOUT_SECONDS = float(os.getenv("GPT_TIMEOUT_SECONDS", "120"))
+# Sends a second request for GPT calls slower than the model's recent tail (GPT_HEDGE_ENABLED)
+gpt_hedger = Hedger(gpt_router)
+
+# Stop calling an upstream that keeps failing or answering slowly; turns skip the video while HeyGen's is open.
+# HeyGen's is driven by render submissions, and status polling pauses while it is open.
+openai_breaker = CircuitBreaker("openai", CIRCUIT_OPENAI_SLOW_SECONDS)
+heygen_breaker = CircuitBreaker("heygen", CIRCUIT_HEYGEN_SLOW_SECONDS)
+elevenlabs_breaker = CircuitBreaker("elevenlabs", CIRCUIT_ELEVENLABS_SLOW_SECONDS)
+
+# Latency histograms, outcome counters and in-flight gauges served on /metrics
+gpt_latency = metrics.Histogram("baybe_gpt_seconds", "GPT chat completion latency", ["mode"])
+heygen_submit_latency = metrics.Histogram("baybe_heygen_submit_seconds", "HeyGen video generate request latency")
+heygen_status_latency = metrics.Histogram("baybe_heygen_status_seconds", "HeyGen status check latency", ["kind"])
+chat_latency = metrics.Histogram("baybe_chat_seconds", "End-to-end /chat latency by outcome", ["outcome"])
+chat_outcomes = metrics.Counter("baybe_chat_requests_total", "/chat requests by outcome", ["outcome"])
+in_flight = metrics.Gauge("baybe_in_flight", "Calls currently in progress by stage", ["stage"])
+speech_first_audio = metrics.Histogram("baybe_speech_first_audio_seconds",
+                                       "Time from a voice-only turn's request to its first audio byte")
+
+stream_executor = ThreadPoolExecutor(max_workers=int(os.getenv("STREAM_WORKERS", "32")),
+                                     thread_name_prefix="stream")
+
 # 🔑 Set your OpenAI key
 openai.api_key = os.getenv('OPENAI_API_KEY')
+# Send OpenAI calls through the shared keep-alive pool; openai calls the factory once per thread
+openai.requestssession = functools.partial(http_client.borrow_session, openai.api_base)
+
+# Request IDs clients may pass in X-Request-ID, and the token that guards runtime debug logging
+REQUEST_ID_PATTERN = structured_logging.REQUEST_ID_PATTERN
+LOG_DEBUG_TOKEN = os.getenv("LOG_DEBUG_TOKEN")
 
 # HeyGen Configuration
 HEYGEN_AVATAR_ID = "7163d65b16474983818b19cef28c9527"  # Replace with your real avatar ID
 HEYGEN_VOICE_ID = "f6e28c412d464c2793e7a208bf10089b"     # Replace with your custom voice ID
 HEYGEN_API_KEY = os.getenv("HEYGEN_API_KEY")  # Load from environment variable
+HEYGEN_DIMENSION = {"width": 1280, "height": 720}
+HEYGEN_API_BASE = os.getenv("HEYGEN_API_BASE", "https://api.heygen.com").rstrip("/")
+
+# HeyGen webhook: when a secret is set we wait for callbacks before falling back to polling
+HEYGEN_WEBHOOK_SECRET = os.getenv("HEYGEN_WEBHOOK_SECRET")
+HEYGEN_CALLBACK_DEADLINE = float(os.getenv("HEYGEN_CALLBACK_DEADLINE", "60"))
+
+# How long a request waits for a video, and whether to check statuses with HeyGen's bulk video listing
+VIDEO_WAIT_TIMEOUT = float(os.getenv("VIDEO_WAIT_TIMEOUT", "90"))
+HEYGEN_BULK_STATUS = os.getenv("HEYGEN_BULK_STATUS", "").lower() in ("1", "true", "yes")
 
 # Log HeyGen configuration (redacted for security)
 logging.info(f"HeyGen Avatar ID: {HEYGEN_AVATAR_ID}")
 logging.info(f"HeyGen Voice ID: {HEYGEN_VOICE_ID}")
 logging.info(f"HeyGen API Key present: {'Yes' if HEYGEN_API_KEY else 'No'}")
+logging.info(f"HeyGen webhook callbacks: {'enabled' if HEYGEN_WEBHOOK_SECRET else 'disabled'}")
 
 # Validate HeyGen configuration
 if not HEYGEN_AVATAR_ID or not HEYGEN_VOICE_ID:
@@ -54,6 +137,51 @@ if not HEYGEN_API_KEY:
 
 # 🧠 GPT prompt tone
 SYSTEM_PROMPT = "You are BAYBE, a dry, sarcastic and funny AI clone. You were uploaded from BAYBE's human consciousness. You see the world in a dark way, and act as though you don't really have time for these conversations. Every response is very short and to the point. You are a bit of a nihilist. Not every sentence you say is about code."
+# Prompt for rolling older turns into a conversation summary
+SUMMARY_PROMPT = "Summarize this conversation between a user and BAYBE in a few sentences. Keep names, facts and anything the user asked BAYBE to remember."
+
+@app.before_request
+def start_request_log_context():
+    """Tag this request's log records with its request ID (the client's X-Request-ID, if valid)."""
+    request_id = request.headers.get('X-Request-ID', '')
+    if not REQUEST_ID_PATTERN.match(request_id):
+        request_id = uuid.uuid4().hex
+    g.request_id = request_id
+    g.request_id_token = structured_logging.set_request_id(request_id)
+
+@app.before_request
+def start_request_span():
+    """Trace every request, continuing the caller's trace if it sent a traceparent header."""
+    route = request.url_rule.rule if request.url_rule else request.path
+    g.trace_span = tracing.start_span(f"{request.method} {route}",
+                                      traceparent=request.headers.get('traceparent'),
+                                      kind=tracing.KIND_SERVER,
+                                      **{"http.method": request.method, "http.route": route})
+    g.trace_token = tracing.activate(g.trace_span)
+
+@app.after_request
+def record_response_status(response):
+    if 'trace_span' in g:
+        g.trace_span.set(**{"http.status_code": response.status_code})
+    if 'request_id' in g:
+        response.headers['X-Request-ID'] = g.request_id
+    return response
+
+@app.teardown_request
+def end_request_span(error=None):
+    span = g.pop('trace_span', None)
+    if span is None:
+        return
+    if error is not None:
+        span.set_error(error)
+    tracing.deactivate(g.pop('trace_token'))
+    span.end()
+
+@app.teardown_request
+def end_request_log_context(error=None):
+    token = g.pop('request_id_token', None)
+    if token is not None:
+        structured_logging.reset_request_id(token)
 
 def validate_heygen_response(response):
     """Validate the structure of HeyGen API response."""
@@ -68,29 +196,107 @@ def validate_heygen_response(response):
     
     return True
 
-def get_gpt_response(user_text):
-    """Get response from GPT-4."""
+def chat_messages(user_text, history=()):
+    """The prompt for a turn: system prompt, earlier turns of the conversation, then the new message."""
+    return [{"role": "system", "content": SYSTEM_PROMPT}, *history, {"role": "user", "content": user_text}]
+
+def gpt_models(user_text):
+    """The routed model for a message and the one fallback to try if it fails."""
+    return gpt_router.route(user_text)[:GPT_MAX_ATTEMPTS]
+
+def request_completion(model, messages):
+    """One chat completion from ``model``, recorded against the model's health and the OpenAI breaker."""
+    openai_breaker.check()
+    started = time.monotonic()
     try:
+        with in_flight.track("gpt"), tracing.span("gpt.completion", model=model):
+            chat_completion = openai.ChatCompletion.create(
+                model=model,
+                messages=messages,
+                request_timeout=GPT_TIMEOUT_SECONDS
+            )
+    except Exception:
+        gpt_router.record(model, time.monotonic() - started, False)
+        openai_breaker.record(time.monotonic() - started, False)
+        raise
+    gpt_router.record(model, time.monotonic() - started, True)
+    openai_breaker.record(time.monotonic() - started, True)
+    return chat_completion.choices[0].message.content
+
+def get_gpt_response(user_text, history=()):
+    """Get a reply from the routed GPT model, falling back to the next one if the call fails."""
+    models = gpt_models(user_text)
+    request_model = functools.partial(request_completion, messages=chat_messages(user_text, history))
+    for attempt, model in enumerate(models):
+        try:
+            with gpt_latency.time("blocking"):
+                return gpt_hedger.call(request_model, model)
+        except CircuitOpen:
+            raise
+        except Exception as e:
+            if attempt == len(models) - 1:
+                logging.error(f"GPT API error: {str(e)}")
+                raise
+            logging.warning(f"GPT API error from {model}, retrying with {models[attempt + 1]}: {str(e)}")
+
+def stream_gpt_response(user_text, history=()):
+    """Stream the routed model's reply, yielding text fragments as they are generated.
+
+    Falls back to the next model only if the call fails before any text was yielded.
+    """
+    models = gpt_models(user_text)
+    for attempt, model in enumerate(models):
+        openai_breaker.check()
+        started = time.monotonic()
+        streamed = False
+        try:
+            with gpt_latency.time("stream"), in_flight.track("gpt"), tracing.span("gpt.stream", model=model):
+                chunks = openai.ChatCompletion.create(
+                    model=model,
+                    messages=chat_messages(user_text, history),
+                    stream=True,
+                    request_timeout=GPT_TIMEOUT_SECONDS
+                )
+                for chunk in chunks:
+                    content = chunk.choices[0].delta.get("content")
+                    if content:
+                        streamed = True
+                        yield content
+            gpt_router.record(model, time.monotonic() - started, True)
+            openai_breaker.record(time.monotonic() - started, True)
+            return
+        except Exception as e:
+            gpt_router.record(model, time.monotonic() - started, False)
+            openai_breaker.record(time.monotonic() - started, False)
+            if streamed or attempt == len(models) - 1:
+                logging.error(f"GPT API error: {str(e)}")
+                raise
+            logging.warning(f"GPT API error from {model}, retrying with {models[attempt + 1]}: {str(e)}")
+
+def summarize_conversation(summary, turns):
+    """Fold turns that no longer fit the history budget into the conversation summary."""
+    transcript = "\n".join(f"User: {user}\nBAYBE: {reply}" for user, reply in turns)
+    if summary:
+        transcript = f"Summary so far: {summary}\n\n{transcript}"
+    with openai_breaker.call(), gpt_latency.time("summary"), in_flight.track("gpt"), tracing.span("gpt.summary"):
         chat_completion = openai.ChatCompletion.create(
-            model="gpt-4",
+            # Summaries are background work, so they go to the fastest model
+            model=gpt_router.models[0],
             messages=[
-                {"role": "system", "content": SYSTEM_PROMPT},
-                {"role": "user", "content": user_text}
-            ]
+                {"role": "system", "content": SUMMARY_PROMPT},
+                {"role": "user", "content": transcript}
+            ],
+            max_tokens=CONVERSATION_SUMMARY_TOKENS,
+            request_timeout=GPT_TIMEOUT_SECONDS
         )
-        return chat_completion.choices[0].message.content
-    except Exception as e:
-        logging.error(f"GPT API error: {str(e)}")
-        raise
+    return chat_completion.choices[0].message.content
 
-def create_heygen_video(text):
-    """Create a video using HeyGen API."""
-    headers = {
-        "x-api-key": HEYGEN_API_KEY,  # Changed from X-Api-Key to x-api-key
-        "Content-Type": "application/json",
-        "accept": "application/json"
-    }
-    payload = {
+# Recent turns per session, sent with the next prompt within a token budget
+conversation_memory = ConversationMemory(summarize=summarize_conversation if CONVERSATION_SUMMARY_ENABLED else None)
+
+def build_heygen_payload(text):
+    """Build the HeyGen video generation request for a reply."""
+    return {
         "video_inputs": [
             {
                 "avatar_id": HEYGEN_AVATAR_ID,
@@ -105,117 +311,412 @@ def create_heygen_video(text):
                 }
             }
         ],
-        "dimension": {
-            "width": 1280,
-            "height": 720
-        },
+        "dimension": HEYGEN_DIMENSION,
         "caption": False
     }
 
+def create_heygen_video(text):
+    """Create a video using HeyGen API."""
+    headers = {
+        "x-api-key": HEYGEN_API_KEY,  # Changed from X-Api-Key to x-api-key
+        "Content-Type": "application/json",
+        "accept": "application/json"
+    }
+    payload = build_heygen_payload(text)
+
     try:
-        print("\n=== HeyGen API Request ===")
-        print(f"Headers: {headers}")
-        print(f"Payload: {payload}")
-        print("========================\n")
-
-        response = requests.post(
-            "https://api.heygen.com/v2/video/generate",
-            headers=headers,
-            json=payload
-        )
-        
-        print("\n=== HeyGen API Response ===")
-        print(f"Status Code: {response.status_code}")
-        print(f"Response Headers: {dict(response.headers)}")
-        print(f"Response Body: {response.text}")
-        print("==========================\n")
-
-        response.raise_for_status()
-        response_json = response.json()
-        
-        # Validate response
-        validate_heygen_response(response_json)
+        # Full request and response dumps only for requests with debug logging switched on
+        logging.debug("HeyGen API request", extra={"category": "heygen.request",
+                                                   "headers": headers, "payload": payload})
+
+        with heygen_breaker.call():
+            with heygen_submit_latency.time(), in_flight.track("heygen_submit"):
+                response = http_client.post(
+                    f"{HEYGEN_API_BASE}/v2/video/generate",
+                    headers=headers,
+                    json=payload
+                )
+
+            logging.debug("HeyGen API response", extra={"category": "heygen.response",
+                                                        "status_code": response.status_code,
+                                                        "headers": dict(response.headers),
+                                                        "body": response.text})
+
+            response.raise_for_status()
+            response_json = response.json()
+
+            # Validate response
+            validate_heygen_response(response_json)
         return response_json
+    except CircuitOpen as e:
+        logging.warning(f"Skipping HeyGen render: {str(e)}")
+        return {'error': str(e), 'circuit_open': True}
     except requests.exceptions.HTTPError as e:
-        print(f"\n=== HeyGen API Error ===")
-        print(f"Error: {str(e)}")
-        print(f"Response: {e.response.text}")
-        print("=======================\n")
+        logging.error(f"HeyGen API error: {str(e)}", extra={"category": "heygen.response",
+                                                            "body": e.response.text})
         return {'error': f"HeyGen API error: {e.response.text}"}
     except Exception as e:
-        print(f"\n=== General Error ===")
-        print(f"Error: {str(e)}")
-        print("===================\n")
+        logging.error(f"HeyGen API error: {str(e)}", extra={"category": "heygen.response"})
         return {'error': f"HeyGen API error: {str(e)}"}
 
+def submit_heygen_video(text):
+    """Submit a render, sharing one HeyGen job among identical requests."""
+    key = render_key(HEYGEN_AVATAR_ID, HEYGEN_VOICE_ID, text, HEYGEN_DIMENSION)
+    with tracing.span("heygen.submit", render_key=key) as span:
+        response = render_registry.submit(key, lambda: create_heygen_video(text))
+        if "error" in response:
+            span.set_error(response["error"])
+        else:
+            span.set(video_id=response['data']['video_id'])
+        return response
+
+def fetch_video_status(video_id):
+    """Fetch the status of one HeyGen video. Returns the status data, or None on error."""
+    headers = {
+        "X-Api-Key": HEYGEN_API_KEY,
+        "accept": "application/json"
+    }
+    status_url = f"{HEYGEN_API_BASE}/v2/video/status?video_id={video_id}"
+
+    # Checked again on a later cycle, once HeyGen is back
+    if heygen_breaker.open:
+        return None
+    try:
+        with heygen_status_latency.time("single"):
+            status_response = http_client.get(status_url, headers=headers)
+        status_response.raise_for_status()
+        status_json = status_response.json()
+        logging.info(f"Video status check for {video_id}: {status_json['data'].get('status')}",
+                     extra={"category": "heygen.status", "video_id": video_id, "response": status_json})
+        return status_json['data']
+    except requests.exceptions.RequestException as e:
+        logging.error(f"Error checking video status: {str(e)}")
+        return None
+
+def list_video_statuses():
+    """Fetch the statuses of recent HeyGen videos in one call, keyed by video ID."""
+    headers = {
+        "X-Api-Key": HEYGEN_API_KEY,
+        "accept": "application/json"
+    }
+    if heygen_breaker.open:
+        return {}
+    with heygen_status_latency.time("bulk"):
+        list_response = http_client.get(f"{HEYGEN_API_BASE}/v1/video.list", headers=headers)
+    list_response.raise_for_status()
+    videos = list_response.json()['data']['videos']
+    return {video['video_id']: video['status'] for video in videos}
+
+def wait_for_video(video_id):
+    """Wait for a HeyGen video to finish.
+
+    The shared video poller tracks the video; with webhooks enabled it only
+    starts polling once HEYGEN_CALLBACK_DEADLINE passes without a callback.
+    Returns the video URL, or None if the video is still processing after
+    VIDEO_WAIT_TIMEOUT. Raises VideoRenderError if the render failed.
+    """
+    # An identical render may already have finished
+    video_url = render_registry.finished_url(video_id)
+    if video_url:
+        logging.info(f"Video {video_id} already finished: {video_url}")
+        return video_url
+
+    poll_after = HEYGEN_CALLBACK_DEADLINE if HEYGEN_WEBHOOK_SECRET else 0
+    future = video_poller.watch(video_id, poll_after)
+    try:
+        video_url = future.result(timeout=VIDEO_WAIT_TIMEOUT)
+        logging.info(f"Video completed: {video_url}")
+        render_registry.mark_completed(video_id, video_url)
+        return video_url
+    except VideoRenderError:
+        render_registry.mark_failed(video_id)
+        raise
+    except FutureTimeoutError:
+        logging.warning(f"Video generation timed out for ID: {video_id}")
+        return None
+    finally:
+        video_poller.release(video_id)
+
+# Single poller shared by every request waiting on a video; webhook callbacks resolve it too
+video_poller = VideoStatusPoller(fetch_video_status, list_video_statuses if HEYGEN_BULK_STATUS else None)
+
+def response_cache_key(user_message):
+    """Cache key for a message under the current prompt, avatar and voice."""
+    return cache_key(user_message, SYSTEM_PROMPT, HEYGEN_AVATAR_ID, HEYGEN_VOICE_ID)
+
+# Near-duplicate questions reuse earlier turns when the semantic cache is enabled
+semantic_cache = None
+if SEMANTIC_CACHE_ENABLED:
+    try:
+        semantic_cache = SemanticCache(context=response_cache_key(""))
+    except Exception as e:
+        # A missing package, a model that won't download or load, or an unreadable index
+        logging.error(f"Semantic cache disabled: {str(e)}")
+
+# Pre-rendered replies for the most frequent prompts (see tools/build_reply_library.py)
+reply_library = ReplyLibrary(context=response_cache_key(""))
+
+# Synthesized speech on disk, shared by every worker
+audio_store = None
+if AUDIO_CACHE_DIR:
+    try:
+        audio_store = AudioStore()
+    except OSError as e:
+        logging.error(f"Audio cache disabled: {str(e)}")
+
+# Spoken replies from a local CPU model, ready long before the video
+local_tts = None
+if LOCAL_TTS_ENABLED:
+    try:
+        local_tts = LocalTTS(store=audio_store)
+    except Exception as e:
+        # A missing package, or a model that won't download, load or warm up
+        logging.error(f"Local TTS disabled: {str(e)}")
+
+def start_audio(text):
+    """Start synthesizing the spoken reply; returns its /audio URL, or None without local TTS."""
+    if local_tts is None:
+        return None
+    audio_id = local_tts.submit(text)
+    return f"/audio/{audio_id}" if audio_id else None
+
+def with_audio(payload, audio_url):
+    """Add the reply's audio URL to a response payload, if it has one."""
+    if audio_url:
+        payload["Audio URL"] = audio_url
+    return payload
+
+def lookup_cached_turn(key, user_message):
+    """Find a finished turn for this message: the pre-rendered library, an exact match, then a near-duplicate."""
+    with tracing.span("cache.lookup") as span:
+        cached = reply_library.get(user_message)
+        if cached:
+            logging.info(f"Reply library hit for message: {user_message}")
+            span.set(hit="library")
+            return cached
+
+        cached = response_cache.get(key)
+        if cached:
+            logging.info(f"Response cache hit for message: {user_message}")
+            span.set(hit="response_cache")
+            return cached
+
+        if semantic_cache is not None:
+            try:
+                cached = semantic_cache.get(user_message)
+            except Exception as e:
+                logging.error(f"Semantic cache lookup failed: {str(e)}")
+                return None
+            if cached:
+                logging.info(f"Semantic cache hit for message: {user_message} "
+                             f"(matched '{cached['message']}', similarity {cached['similarity']})")
+                span.set(hit="semantic_cache")
+        return cached
+
+def remember_turn(key, user_message, gpt_reply, video_url):
+    """Store a finished turn in the response caches."""
+    response_cache.put(key, gpt_reply, video_url)
+    if semantic_cache is not None:
+        try:
+            semantic_cache.put(user_message, gpt_reply, video_url)
+        except Exception as e:
+            logging.error(f"Semantic cache update failed: {str(e)}")
+
+def wait_and_cache(key, user_message, gpt_reply, video_id):
+    """Wait for a video and remember the finished turn for repeat questions.
+
+    ``key`` is None for replies that depended on earlier turns, which are not cached.
+    """
+    with tracing.span("video.wait", video_id=video_id) as span:
+        video_url = wait_for_video(video_id)
+        span.set(status="completed" if video_url else "processing")
+    if video_url and key is not None:
+        remember_turn(key, user_message, gpt_reply, video_url)
+    return video_url
+
+def start_video_job(key, user_message, gpt_reply, video_id):
+    """Register a job for a submitted video, finished by the video poller rather than a waiting thread."""
+    video_url = render_registry.finished_url(video_id)
+    if video_url:
+        # An identical render already finished
+        future = Future()
+        future.set_result(video_url)
+    else:
+        poll_after = HEYGEN_CALLBACK_DEADLINE if HEYGEN_WEBHOOK_SECRET else 0
+        future = video_poller.watch(video_id, poll_after)
+
+    def on_finish(job):
+        if not video_url:
+            video_poller.release(video_id)
+            if job.stage == STAGE_COMPLETED:
+                render_registry.mark_completed(video_id, job.video_url)
+            elif job.stage == STAGE_ERROR:
+                render_registry.mark_failed(video_id)
+            else:
+                logging.warning(f"Video generation timed out for ID: {video_id}")
+        if job.video_url and key is not None:
+            remember_turn(key, user_message, gpt_reply, job.video_url)
+
+    return job_store.submit(gpt_reply, video_id, future, VIDEO_WAIT_TIMEOUT, on_finish)
+
+def valid_session_id(session_id):
+    """Session IDs follow the same rules as request IDs; None means a one-off turn."""
+    return session_id is None or (isinstance(session_id, str) and bool(REQUEST_ID_PATTERN.match(session_id)))
+
+def wants_async(data):
+    """Check whether the client asked for job mode instead of waiting for the video."""
+    prefer = request.headers.get('Prefer', '')
+    return bool(data.get('async')) or 'respond-async' in prefer
+
+def overloaded_response(e, reply=None):
+    """503 with Retry-After for a turn shed by admission control or an open circuit breaker."""
+    logging.warning(f"Shedding chat request: {str(e)}")
+    response = jsonify({
+        "BAYBE's Response": reply or "Error: Server is busy",
+        "Video Status": "error",
+        "error": str(e)
+    })
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response, 503
+
+def heygen_unavailable():
+    return str(CircuitOpen(heygen_breaker.name, heygen_breaker.retry_after()))
+
+def video_skipped(gpt_reply, audio_url=None):
+    """The text (and audio) answer for a turn whose video was skipped because HeyGen is unavailable."""
+    return with_audio({
+        "BAYBE's Response": gpt_reply,
+        "Video Status": "skipped",
+        "error": heygen_unavailable()
+    }, audio_url)
+
+def chat_outcome(status_code, payload):
+    """Classify a /chat response for metrics: completed, processing, skipped, error, accepted or rejected."""
+    if status_code == 503:
+        return "rejected"
+    if status_code == 202:
+        return "accepted"
+    return (payload or {}).get("Video Status", "error")
+
+def record_chat(view):
+    """Time a chat view and count its outcome."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        started = time.monotonic()
+        with in_flight.track("chat"):
+            response = app.make_response(view(*args, **kwargs))
+        outcome = chat_outcome(response.status_code, response.get_json(silent=True))
+        chat_latency.observe(time.monotonic() - started, outcome)
+        chat_outcomes.inc(outcome)
+        return response
+    return wrapper
+
 @app.route('/chat', methods=['POST'])
+@record_chat
 def chat():
     """Handle chat requests and generate video responses."""
     data = request.json
     logging.info(f"Received chat request: {data}")
     
-    if not data or 'message' not in data:
+    if not isinstance(data, dict) or 'message' not in data:
         return jsonify({
             "BAYBE's Response": "Error: No message provided",
             "Video Status": "error"
         }), 400
+    session_id = data.get('session_id')
+    if not valid_session_id(session_id):
+        return jsonify({
+            "BAYBE's Response": "Error: Invalid session_id",
+            "Video Status": "error"
+        }), 400
 
     try:
-        # Step 1: Get GPT response
         user_message = data['message']
-        gpt_reply = get_gpt_response(user_message)
-        logging.info(f"GPT response: {gpt_reply}")
-
-        # Step 2: Generate HeyGen video
-        video_gen_response = create_heygen_video(gpt_reply)
+        history = conversation_memory.history(session_id)
 
-        if "error" in video_gen_response:
-            logging.error(f"Video generation failed: {video_gen_response}")
+        # Repeat questions are answered straight from the cache, unless earlier turns shape the reply
+        key = response_cache_key(user_message) if not history else None
+        cached = lookup_cached_turn(key, user_message) if key else None
+        if cached:
+            conversation_memory.append(session_id, user_message, cached['reply'])
             return jsonify({
-                "BAYBE's Response": gpt_reply,
-                "Video Status": "error",
-                "error": video_gen_response.get('error', 'Failed to generate video')
+                "BAYBE's Response": cached['reply'],
+                "Video Status": "completed",
+                "Video URL": cached['video_url']
             })
 
-        video_id = video_gen_response['data']['video_id']
-        logging.info(f"Video generation started with ID: {video_id}")
+        # Shed load before spending GPT tokens on a turn we can't finish in time
+        admission.check()
 
-        # Step 3: Poll for video completion
-        headers = {
-            "X-Api-Key": HEYGEN_API_KEY,
-            "accept": "application/json"
-        }
-        status_url = f"https://api.heygen.com/v2/video/status?video_id={video_id}"
+        # Step 1: Get GPT response
+        with admission.gpt.acquire():
+            gpt_reply = get_gpt_response(user_message, history)
+        logging.info(f"GPT response: {gpt_reply}")
+        conversation_memory.append(session_id, user_message, gpt_reply)
+        # The spoken reply is synthesized locally while the video renders
+        audio_url = start_audio(gpt_reply)
+
+        # Answer with the text straight away while HeyGen's breaker is open
+        if heygen_breaker.open:
+            return jsonify(video_skipped(gpt_reply, audio_url))
+
+        try:
+            video_slot = admission.video.acquire()
+        except Overloaded as e:
+            return overloaded_response(e, gpt_reply)
+
+        # The video slot is held until the render has been waited on
+        with video_slot:
+            # Step 2: Generate HeyGen video
+            video_gen_response = submit_heygen_video(gpt_reply)
+
+            if video_gen_response.get("circuit_open"):
+                return jsonify(video_skipped(gpt_reply, audio_url))
+            if "error" in video_gen_response:
+                logging.error(f"Video generation failed: {video_gen_response}")
+                return jsonify(with_audio({
+                    "BAYBE's Response": gpt_reply,
+                    "Video Status": "error",
+                    "error": video_gen_response.get('error', 'Failed to generate video')
+                }, audio_url))
+
+            video_id = video_gen_response['data']['video_id']
+            logging.info(f"Video generation started with ID: {video_id}")
 
-        for attempt in range(20):  # Poll for up to 20 attempts
+            # Job mode: the video poller finishes the job, so return (and free the video slot) right away
+            if wants_async(data):
+                job = start_video_job(key, user_message, gpt_reply, video_id)
+                logging.info(f"Video {video_id} handed off to job {job.id}")
+                response = jsonify(with_audio(job.to_dict(), audio_url))
+                response.headers['Location'] = f"/jobs/{job.id}"
+                return response, 202
+
+            # Step 3: Wait for video completion
             try:
-                status_response = requests.get(status_url, headers=headers)
-                status_response.raise_for_status()
-                status_json = status_response.json()
-                logging.info(f"Video status check {attempt + 1}: {status_json}")
-
-                if status_json['data']['status'] == "completed":
-                    video_url = status_json['data']['video_url']
-                    logging.info(f"Video completed: {video_url}")
-                    return jsonify({
-                        "BAYBE's Response": gpt_reply,
-                        "Video Status": "completed",
-                        "Video URL": video_url
-                    })
-
-                # Exponential backoff with max 5 seconds
-                time.sleep(min(1 * (2 ** attempt), 5))
-            except requests.exceptions.RequestException as e:
-                logging.error(f"Error checking video status: {str(e)}")
-                time.sleep(1)
+                video_url = wait_and_cache(key, user_message, gpt_reply, video_id)
+            except VideoRenderError as e:
+                logging.error(f"Video {video_id} failed to render: {str(e)}")
+                return jsonify(with_audio({
+                    "BAYBE's Response": gpt_reply,
+                    "Video Status": "error",
+                    "Video ID": video_id,
+                    "error": str(e)
+                }, audio_url))
+        if video_url:
+            return jsonify(with_audio({
+                "BAYBE's Response": gpt_reply,
+                "Video Status": "completed",
+                "Video URL": video_url
+            }, audio_url))
 
-        logging.warning(f"Video generation timed out for ID: {video_id}")
-        return jsonify({
+        return jsonify(with_audio({
             "BAYBE's Response": gpt_reply,
             "Video Status": "processing",
             "Video ID": video_id
-        })
+        }, audio_url))
 
+    except (Overloaded, CircuitOpen) as e:
+        return overloaded_response(e)
     except Exception as e:
         import traceback
         logging.error(f"Error in chat endpoint: {str(e)}\n{traceback.format_exc()}")
@@ -225,6 +726,399 @@ def chat():
             "error": str(e)
         }), 500
 
+@app.route('/audio/<audio_id>', methods=['GET'])
+def get_audio(audio_id):
+    """Serve a spoken reply, waiting for local TTS if it is still being synthesized.
+
+    Clips in the audio store are sent straight from the file, with Range support.
+    """
+    future = local_tts.future(audio_id) if local_tts is not None else None
+    if future is not None:
+        try:
+            wav = future.result(timeout=LOCAL_TTS_TIMEOUT)
+        except FutureTimeoutError:
+            response = jsonify({"error": "Audio is still being synthesized"})
+            response.headers['Retry-After'] = "1"
+            return response, 503
+        except Exception as e:
+            return jsonify({"error": f"Audio synthesis failed: {str(e)}"}), 500
+    clip = audio_store.lookup(audio_id) if audio_store is not None else None
+    if clip is not None:
+        path, mimetype = clip
+        try:
+            # Clip IDs are content hashes, so a clip never changes
+            response = send_file(os.path.abspath(path), mimetype=mimetype, conditional=True, etag=audio_id,
+                                 max_age=31536000)
+            response.cache_control.public = True
+            response.cache_control.immutable = True
+            return response
+        except FileNotFoundError:
+            # Evicted in the meantime
+            pass
+    if future is None:
+        return jsonify({"error": "Unknown audio ID"}), 404
+    response = Response(wav, mimetype="audio/wav")
+    response.headers['Cache-Control'] = "public, max-age=31536000, immutable"
+    return response
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Report the current stage of an asynchronous chat job."""
+    job = job_store.get(job_id)
+    if job is None:
+        return jsonify({
+            "Job ID": job_id,
+            "Video Status": "error",
+            "error": "Unknown job ID"
+        }), 404
+    return jsonify(job.to_dict())
+
+def run_turn(user_message, emit, session_id=None, admitted=False):
+    """Run one chat turn, reporting progress through ``emit(event, data)``.
+
+    Events are "token" for each GPT fragment, "text" for the full reply,
+    "audio" when local TTS is speaking it, "video" for each render stage and
+    "error" if the turn fails. ``admitted`` means the caller has already run
+    the admission check for this turn.
+    """
+    try:
+        history = conversation_memory.history(session_id)
+        key = response_cache_key(user_message) if not history else None
+        cached = lookup_cached_turn(key, user_message) if key else None
+        if cached:
+            conversation_memory.append(session_id, user_message, cached['reply'])
+            emit("text", {"text": cached['reply']})
+            emit("video", {"status": "completed", "video_url": cached['video_url']})
+            return
+
+        if not admitted:
+            admission.check()
+        fragments = []
+        with admission.gpt.acquire():
+            for fragment in stream_gpt_response(user_message, history):
+                fragments.append(fragment)
+                emit("token", {"text": fragment})
+        gpt_reply = "".join(fragments)
+        logging.info(f"GPT response: {gpt_reply}")
+        conversation_memory.append(session_id, user_message, gpt_reply)
+        emit("text", {"text": gpt_reply})
+        audio_url = start_audio(gpt_reply)
+        if audio_url:
+            emit("audio", {"audio_url": audio_url})
+
+        if heygen_breaker.open:
+            emit("video", {"status": "skipped", "error": heygen_unavailable()})
+            return
+
+        with admission.video.acquire():
+            video_gen_response = submit_heygen_video(gpt_reply)
+            if video_gen_response.get("circuit_open"):
+                emit("video", {"status": "skipped", "error": video_gen_response["error"]})
+                return
+            if "error" in video_gen_response:
+                logging.error(f"Video generation failed: {video_gen_response}")
+                emit("video", {
+                    "status": "error",
+                    "error": video_gen_response.get('error', 'Failed to generate video')
+                })
+                return
+
+            video_id = video_gen_response['data']['video_id']
+            logging.info(f"Video generation started with ID: {video_id}")
+            emit("video", {"status": "submitted", "video_id": video_id})
+
+            try:
+                video_url = wait_and_cache(key, user_message, gpt_reply, video_id)
+            except VideoRenderError as e:
+                emit("video", {"status": "error", "video_id": video_id, "error": str(e)})
+                return
+
+        if video_url:
+            emit("video", {"status": "completed", "video_id": video_id, "video_url": video_url})
+        else:
+            emit("video", {"status": "processing", "video_id": video_id})
+    except (Overloaded, CircuitOpen) as e:
+        logging.warning(f"Shedding chat turn: {str(e)}")
+        emit("error", {"error": str(e), "retry_after": e.retry_after})
+    except Exception as e:
+        import traceback
+        logging.error(f"Error in chat turn: {str(e)}\n{traceback.format_exc()}")
+        emit("error", {"error": str(e)})
+
+def run_streamed_turn(client_id, user_message, session_id):
+    """Run one chat turn admitted by /api/chat, publishing its events to the client's SSE channel."""
+    def emit(event, data):
+        # The full reply goes out as a plain "message" event for EventSource.onmessage
+        event_channels.publish(client_id, data, event=None if event == "text" else event)
+
+    run_turn(user_message, emit, session_id, admitted=True)
+
+def write_spoken_reply(user_message, session_id, pieces):
+    """Stream the GPT reply into ``pieces`` in speakable chunks, then None; an exception if the turn fails."""
+    try:
+        history = conversation_memory.history(session_id)
+        splitter = SpeechSplitter()
+        fragments = []
+        with admission.gpt.acquire():
+            for fragment in stream_gpt_response(user_message, history):
+                fragments.append(fragment)
+                for piece in splitter.feed(fragment):
+                    pieces.put(piece)
+        for piece in splitter.flush():
+            pieces.put(piece)
+        gpt_reply = "".join(fragments)
+        logging.info(f"GPT response: {gpt_reply}")
+        conversation_memory.append(session_id, user_message, gpt_reply)
+        pieces.put(None)
+    except Exception as e:
+        pieces.put(e)
+
+def open_speech(text):
+    """Start the speech of ``text``: the stored clip, or ElevenLabs' stream once audio is on its way.
+
+    Returns an iterator of audio chunks.
+    """
+    key = speech_key(text)
+    clip = audio_store.open(key) if audio_store is not None and key else None
+    if clip is not None:
+        return read_clip(clip)
+    elevenlabs_breaker.check()
+    url, headers, payload = speech_request(text)
+    started = time.monotonic()
+    try:
+        with tracing.span("elevenlabs.stream", chars=len(text)):
+            response = http_client.post(url, headers=headers, json=payload, stream=True)
+            response.raise_for_status()
+    except Exception:
+        elevenlabs_breaker.record(time.monotonic() - started, False)
+        raise
+    elevenlabs_breaker.record(time.monotonic() - started, True)
+    return relay_speech(response, key)
+
+def read_clip(clip):
+    with clip:
+        yield from iter(lambda: clip.read(AUDIO_CHUNK_BYTES), b"")
+
+def relay_speech(response, key):
+    """Yield ElevenLabs' audio as it arrives, storing the clip once it is complete."""
+    try:
+        if audio_store is None or key is None:
+            yield from response.iter_content(AUDIO_CHUNK_BYTES)
+            return
+        with audio_store.writer(key, content_type()) as f:
+            for chunk in response.iter_content(AUDIO_CHUNK_BYTES):
+                f.write(chunk)
+                yield chunk
+    finally:
+        response.close()
+
+def speak(audio, pieces, started):
+    """Relay the audio of each piece of the reply in turn, opening the next when one finishes."""
+    first = True
+    while audio is not None:
+        try:
+            with in_flight.track("elevenlabs"):
+                for chunk in audio:
+                    if first:
+                        speech_first_audio.observe(time.monotonic() - started)
+                        first = False
+                    yield chunk
+        finally:
+            audio.close()
+        piece = pieces.get()
+        if isinstance(piece, Exception):
+            logging.error(f"Voice-only turn ended early: {str(piece)}")
+            return
+        audio = None
+        if piece is not None:
+            try:
+                audio = open_speech(piece)
+            except Exception as e:
+                logging.error(f"ElevenLabs error, voice-only turn ended early: {str(e)}")
+
+@app.route('/chat/audio', methods=['POST'])
+def chat_audio():
+    """Voice-only turn: stream ElevenLabs speech of the GPT reply while it is being generated."""
+    started = time.monotonic()
+    data = request.json
+    logging.info(f"Received audio chat request: {data}")
+
+    if not ELEVENLABS_API_KEY:
+        return jsonify({"error": "Audio mode is not enabled"}), 404
+    if not isinstance(data, dict) or 'message' not in data:
+        return jsonify({"error": "No message provided"}), 400
+    session_id = data.get('session_id')
+    if not valid_session_id(session_id):
+        return jsonify({"error": "Invalid session_id"}), 400
+
+    # Wait for the first piece of the reply and its audio, so failures still get a proper status
+    pieces = queue.Queue()
+    try:
+        admission.check()
+        if elevenlabs_breaker.open:
+            raise CircuitOpen(elevenlabs_breaker.name, elevenlabs_breaker.retry_after())
+        stream_executor.submit(contextvars.copy_context().run, write_spoken_reply,
+                               data['message'], session_id, pieces)
+        piece = pieces.get()
+        if isinstance(piece, Exception):
+            raise piece
+        if piece is None:
+            return jsonify({"error": "Empty reply"}), 502
+        audio = open_speech(piece)
+    except (Overloaded, CircuitOpen) as e:
+        logging.warning(f"Shedding audio chat request: {str(e)}")
+        return jsonify({"error": str(e)}), 503, {'Retry-After': str(e.retry_after)}
+    except Exception as e:
+        logging.error(f"Error in audio chat endpoint: {str(e)}")
+        return jsonify({"error": str(e)}), 502
+
+    return Response(
+        stream_with_context(speak(audio, pieces, started)),
+        mimetype=content_type(),
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+@app.route('/')
+def index():
+    """Serve the browser chat client."""
+    return render_template('index.html')
+
+@app.route('/api/chat', methods=['POST'])
+def api_chat():
+    """Start a streamed chat turn; results arrive on /api/messages."""
+    data = request.json
+    logging.info(f"Received streaming chat request: {data}")
+
+    if not isinstance(data, dict) or 'message' not in data or 'client_id' not in data:
+        return jsonify({"error": "Both message and client_id are required"}), 400
+    # The browser's client ID doubles as its conversation unless it names one
+    session_id = data.get('session_id', data['client_id'])
+    if not valid_session_id(session_id):
+        return jsonify({"error": "Invalid session_id"}), 400
+
+    try:
+        admission.check()
+    except Overloaded as e:
+        logging.warning(f"Shedding streaming chat request: {str(e)}")
+        return jsonify({"error": str(e)}), 503, {'Retry-After': str(e.retry_after)}
+
+    # Run the turn in this request's trace
+    stream_executor.submit(contextvars.copy_context().run, run_streamed_turn,
+                           data['client_id'], data['message'], session_id)
+    return jsonify({"status": "accepted"}), 202
+
+@app.route('/api/messages')
+def api_messages():
+    """Server-Sent Events stream of GPT tokens and video stages for one client."""
+    client_id = request.args.get('client_id')
+    if not client_id:
+        return jsonify({"error": "client_id is required"}), 400
+
+    return Response(
+        event_channels.stream(client_id),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+def collect_stats():
+    """Runtime statistics for the shared clients, caches and queues."""
+    return {
+        "http_pools": http_client.stats(),
+        "tracing": tracing.stats(),
+        "logging": structured_logging.stats(),
+        "admission": admission.stats(),
+        "gpt_models": gpt_router.stats(),
+        "gpt_hedging": gpt_hedger.stats(),
+        "circuits": dependency_status()["dependencies"],
+        "video_poller": video_poller.stats(),
+        "reply_library": reply_library.stats(),
+        "renders": render_registry.stats(),
+        "response_cache": response_cache.stats(),
+        "conversations": conversation_memory.stats(),
+        "semantic_cache": semantic_cache.stats() if semantic_cache is not None else None,
+        "local_tts": local_tts.stats() if local_tts is not None else None,
+        "audio_store": audio_store.stats() if audio_store is not None else None
+    }
+
+@app.route('/stats', methods=['GET'])
+def stats():
+    """Report runtime statistics for the shared clients and queues."""
+    return jsonify(collect_stats())
+
+def dependency_status():
+    """Circuit breaker state per upstream; "degraded" while any of them is refusing calls."""
+    circuits = {breaker.name: breaker.stats() for breaker in (openai_breaker, heygen_breaker, elevenlabs_breaker)}
+    return {
+        "status": "degraded" if any(circuit["open"] for circuit in circuits.values()) else "ok",
+        "dependencies": circuits
+    }
+
+@app.route('/status', methods=['GET'])
+def status():
+    """Report whether the upstream APIs are usable, as seen by their circuit breakers."""
+    return jsonify(dependency_status())
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Expose latency histograms, outcome counters and the /stats figures to Prometheus."""
+    return Response(metrics.render(collect_stats()), content_type=metrics.CONTENT_TYPE)
+
+def set_request_debug(request_id, enabled, token):
+    """Switch DEBUG logging for one request ID. Returns (status code, response body)."""
+    if not LOG_DEBUG_TOKEN:
+        return 404, {"error": "Runtime debug logging is not enabled"}
+    if not hmac.compare_digest(token or '', LOG_DEBUG_TOKEN):
+        return 401, {"error": "Invalid debug token"}
+    if not REQUEST_ID_PATTERN.match(request_id):
+        return 400, {"error": "Invalid request ID"}
+
+    if not enabled:
+        structured_logging.disable_debug(request_id)
+        return 200, {"request_id": request_id, "debug": False}
+    structured_logging.enable_debug(request_id)
+    logging.info(f"Debug logging enabled for request {request_id}")
+    return 200, {"request_id": request_id, "debug": True, "ttl": structured_logging.LOG_DEBUG_TTL}
+
+@app.route('/debug/requests/<request_id>', methods=['PUT', 'DELETE'])
+def debug_request(request_id):
+    """Switch DEBUG logging on (PUT) or off (DELETE) for one request ID at runtime."""
+    status, body = set_request_debug(request_id, request.method == 'PUT', request.headers.get('X-Debug-Token'))
+    return jsonify(body), status
+
+@app.route('/heygen/webhook', methods=['POST'])
+def heygen_webhook():
+    """Receive HeyGen render callbacks and wake up whoever is waiting on the video."""
+    if not HEYGEN_WEBHOOK_SECRET:
+        return jsonify({"error": "Webhooks are not enabled"}), 404
+
+    body = request.get_data()
+    if not verify_signature(HEYGEN_WEBHOOK_SECRET, body, request.headers.get('Signature')):
+        logging.warning("Rejected HeyGen webhook with an invalid signature")
+        return jsonify({"error": "Invalid signature"}), 401
+
+    try:
+        event = parse_event(request.get_json(force=True, silent=True))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if event is None:
+        return jsonify({"status": "ignored"})
+
+    video_id, status, video_url, error = event
+    waiting = video_poller.resolve(video_id, status, video_url, error)
+    logging.info(f"HeyGen callback for video {video_id}: {status} ({'resolved waiters' if waiting else 'nobody waiting yet'})")
+    return jsonify({"status": "ok"})
+
+# WebSocket conversation channel, served next to the web process when WS_PORT is set
+if WS_PORT:
+    ConversationServer(run_turn).start_in_thread()
+
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 10000))
     app.run(host="0.0.0.0", port=port)
\ No newline at end of file
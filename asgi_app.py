@@ -0,0 +1,839 @@
+"""Asyncio serving mode for the chat API.
+
+Serves the same routes with the same JSON as the Flask app, but the GPT call
+and the HeyGen submission are coroutines on a shared httpx.AsyncClient, so a
+single process holds many turns at once instead of one per thread. Streamed
+turns for the browser client (/api/chat) still run on the Flask app's thread
+pool, but their /api/messages event streams wait on the event loop. Caches, render deduplication, the
+job store and the video status poller are shared with app.py.
+
+Enabled with ASYNC_MODE=1 (see gunicorn.conf.py), or run directly:
+
+    uvicorn asgi_app:app --port 10000
+"""
+import os
+import json
+import time
+import uuid
+import asyncio
+import contextlib
+import contextvars
+import logging
+import traceback
+from urllib.parse import parse_qs
+
+import httpx
+import openai
+from werkzeug.http import parse_range_header
+
+import app as baybe
+import metrics
+import tracing
+import structured_logging
+from http_client import HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT, HTTP_POOL_SIZE
+from render_dedup import render_key
+from admission import Overloaded
+from circuit_breaker import CircuitOpen
+from speech_stream import SpeechSplitter, ELEVENLABS_API_KEY, AUDIO_CHUNK_BYTES, speech_request, speech_key, content_type
+from video_status import VideoRenderError, verify_signature, parse_event
+
+# Outbound limits for the shared async client
+ASYNC_MAX_CONNECTIONS = HTTP_POOL_SIZE * 10
+
+CORS_HEADERS = [
+    (b"access-control-allow-origin", b"*"),
+    (b"access-control-allow-headers", b"Content-Type, Prefer, X-Request-ID"),
+    (b"access-control-allow-methods", b"GET, POST, OPTIONS")
+]
+
+client = None
+loop = None
+
+
+async def send(request, stream=False):
+    """Send a request with the shared client in a client span, propagating the trace to the upstream."""
+    with tracing.span(f"HTTP {request.method}", kind=tracing.KIND_CLIENT,
+                      **{"http.method": request.method, "http.url": str(request.url).split("?")[0],
+                         "http.request_bytes": len(request.content)}) as span:
+        if span.traceparent:
+            request.headers["traceparent"] = span.traceparent
+        response = await client.send(request, stream=stream)
+        span.set(**{"http.status_code": response.status_code})
+        if stream:
+            # Reading the body here would consume the stream
+            if response.headers.get("content-length"):
+                span.set(**{"http.response_bytes": int(response.headers["content-length"])})
+        else:
+            span.set(**{"http.response_bytes": len(response.content)})
+        return response
+
+
+async def post(url, **kwargs):
+    """POST with the shared client, traced like every outbound call."""
+    return await send(client.build_request("POST", url, **kwargs))
+
+
+async def request_completion(model, messages):
+    """One chat completion from ``model``, recorded against the model's health and the OpenAI breaker."""
+    baybe.openai_breaker.check()
+    started = time.monotonic()
+    try:
+        with baybe.in_flight.track("gpt"), tracing.span("gpt.completion", model=model):
+            response = await post(
+                f"{openai.api_base}/chat/completions",
+                headers={"Authorization": f"Bearer {openai.api_key}"},
+                json={
+                    "model": model,
+                    "messages": messages
+                },
+                timeout=httpx.Timeout(baybe.GPT_TIMEOUT_SECONDS, connect=HTTP_CONNECT_TIMEOUT)
+            )
+            response.raise_for_status()
+            reply = response.json()['choices'][0]['message']['content']
+    except Exception:
+        baybe.gpt_router.record(model, time.monotonic() - started, False)
+        baybe.openai_breaker.record(time.monotonic() - started, False)
+        raise
+    baybe.gpt_router.record(model, time.monotonic() - started, True)
+    baybe.openai_breaker.record(time.monotonic() - started, True)
+    return reply
+
+
+async def get_gpt_response(user_text, history=()):
+    """Get a reply from the routed GPT model, falling back to the next one if the call fails."""
+    models = baybe.gpt_models(user_text)
+    messages = baybe.chat_messages(user_text, history)
+    for attempt, model in enumerate(models):
+        try:
+            with baybe.gpt_latency.time("blocking"):
+                return await baybe.gpt_hedger.call_async(lambda model: request_completion(model, messages), model)
+        except CircuitOpen:
+            raise
+        except Exception as e:
+            if attempt == len(models) - 1:
+                logging.error(f"GPT API error: {str(e)}")
+                raise
+            logging.warning(f"GPT API error from {model}, retrying with {models[attempt + 1]}: {str(e)}")
+
+
+async def stream_gpt_response(user_text, history=()):
+    """Stream the routed model's reply, yielding text fragments as they are generated.
+
+    Falls back to the next model only if the call fails before any text was yielded.
+    """
+    models = baybe.gpt_models(user_text)
+    for attempt, model in enumerate(models):
+        baybe.openai_breaker.check()
+        started = time.monotonic()
+        streamed = False
+        try:
+            with baybe.gpt_latency.time("stream"), baybe.in_flight.track("gpt"), \
+                    tracing.span("gpt.stream", model=model):
+                response = await send(client.build_request(
+                    "POST",
+                    f"{openai.api_base}/chat/completions",
+                    headers={"Authorization": f"Bearer {openai.api_key}"},
+                    json={
+                        "model": model,
+                        "messages": baybe.chat_messages(user_text, history),
+                        "stream": True
+                    },
+                    timeout=httpx.Timeout(baybe.GPT_TIMEOUT_SECONDS, connect=HTTP_CONNECT_TIMEOUT)
+                ), stream=True)
+                try:
+                    response.raise_for_status()
+                    async for line in response.aiter_lines():
+                        if not line.startswith("data: ") or line == "data: [DONE]":
+                            continue
+                        content = json.loads(line[len("data: "):])['choices'][0]['delta'].get('content')
+                        if content:
+                            streamed = True
+                            yield content
+                finally:
+                    await response.aclose()
+            baybe.gpt_router.record(model, time.monotonic() - started, True)
+            baybe.openai_breaker.record(time.monotonic() - started, True)
+            return
+        except Exception as e:
+            baybe.gpt_router.record(model, time.monotonic() - started, False)
+            baybe.openai_breaker.record(time.monotonic() - started, False)
+            if streamed or attempt == len(models) - 1:
+                logging.error(f"GPT API error: {str(e)}")
+                raise
+            logging.warning(f"GPT API error from {model}, retrying with {models[attempt + 1]}: {str(e)}")
+
+
+async def create_heygen_video(text, context=None):
+    """Create a video using HeyGen API."""
+    if context is not None:
+        # Runs as its own task, so this only affects the submission
+        for var, value in context.items():
+            var.set(value)
+    headers = {
+        "x-api-key": baybe.HEYGEN_API_KEY,
+        "Content-Type": "application/json",
+        "accept": "application/json"
+    }
+    payload = baybe.build_heygen_payload(text)
+    try:
+        logging.debug("HeyGen API request", extra={"category": "heygen.request",
+                                                   "headers": headers, "payload": payload})
+        with baybe.heygen_breaker.call():
+            with baybe.heygen_submit_latency.time(), baybe.in_flight.track("heygen_submit"):
+                response = await post(f"{baybe.HEYGEN_API_BASE}/v2/video/generate", headers=headers, json=payload)
+            logging.debug("HeyGen API response", extra={"category": "heygen.response",
+                                                        "status_code": response.status_code,
+                                                        "headers": dict(response.headers),
+                                                        "body": response.text})
+            response.raise_for_status()
+            response_json = response.json()
+            baybe.validate_heygen_response(response_json)
+        return response_json
+    except CircuitOpen as e:
+        logging.warning(f"Skipping HeyGen render: {str(e)}")
+        return {'error': str(e), 'circuit_open': True}
+    except httpx.HTTPStatusError as e:
+        logging.error(f"HeyGen API error: {e.response.text}", extra={"category": "heygen.response",
+                                                                     "body": e.response.text})
+        return {'error': f"HeyGen API error: {e.response.text}"}
+    except Exception as e:
+        logging.error(f"HeyGen API error: {str(e)}", extra={"category": "heygen.response"})
+        return {'error': f"HeyGen API error: {str(e)}"}
+
+
+async def submit_heygen_video(text):
+    """Submit a render, sharing one HeyGen job among identical requests.
+
+    The render registry is synchronous (it may wait on another worker's
+    claim), so it runs on a thread while the submission itself goes back to
+    the event loop.
+    """
+    key = render_key(baybe.HEYGEN_AVATAR_ID, baybe.HEYGEN_VOICE_ID, text, baybe.HEYGEN_DIMENSION)
+
+    def create_render():
+        # The submission becomes a new task on the loop; keep it in this turn's trace and request ID
+        context = contextvars.copy_context()
+        return asyncio.run_coroutine_threadsafe(create_heygen_video(text, context), loop).result()
+
+    with tracing.span("heygen.submit", render_key=key) as span:
+        response = await asyncio.to_thread(baybe.render_registry.submit, key, create_render)
+        if "error" in response:
+            span.set_error(response["error"])
+        else:
+            span.set(video_id=response['data']['video_id'])
+        return response
+
+
+async def wait_for_video(video_id):
+    """Wait for a HeyGen video to finish without holding a thread.
+
+    The shared video poller already checks every outstanding video from one
+    thread, so its future is awaited here rather than polling per turn.
+    """
+    video_url = await asyncio.to_thread(baybe.render_registry.finished_url, video_id)
+    if video_url:
+        return video_url
+
+    poll_after = baybe.HEYGEN_CALLBACK_DEADLINE if baybe.HEYGEN_WEBHOOK_SECRET else 0
+    future = baybe.video_poller.watch(video_id, poll_after)
+    try:
+        # shield() keeps a timeout here from cancelling the future other waiters share
+        video_url = await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), baybe.VIDEO_WAIT_TIMEOUT)
+        logging.info(f"Video completed: {video_url}")
+        await asyncio.to_thread(baybe.render_registry.mark_completed, video_id, video_url)
+        return video_url
+    except VideoRenderError:
+        await asyncio.to_thread(baybe.render_registry.mark_failed, video_id)
+        raise
+    except asyncio.TimeoutError:
+        logging.warning(f"Video generation timed out for ID: {video_id}")
+        return None
+    finally:
+        baybe.video_poller.release(video_id)
+
+
+async def wait_and_cache(key, user_message, gpt_reply, video_id):
+    """Wait for a video and remember the finished turn for repeat questions (unless ``key`` is None)."""
+    with tracing.span("video.wait", video_id=video_id) as span:
+        video_url = await wait_for_video(video_id)
+        span.set(status="completed" if video_url else "processing")
+    if video_url and key is not None:
+        await asyncio.to_thread(baybe.remember_turn, key, user_message, gpt_reply, video_url)
+    return video_url
+
+
+def overloaded_response(e, reply=None):
+    """503 with Retry-After for a turn shed by admission control or an open circuit breaker."""
+    logging.warning(f"Shedding chat request: {str(e)}")
+    return 503, {
+        "BAYBE's Response": reply or "Error: Server is busy",
+        "Video Status": "error",
+        "error": str(e)
+    }, [(b"retry-after", str(e.retry_after).encode())]
+
+
+async def chat(data, headers):
+    """Handle chat requests and generate video responses."""
+    logging.info(f"Received chat request: {data}")
+
+    if not isinstance(data, dict) or 'message' not in data:
+        return 400, {
+            "BAYBE's Response": "Error: No message provided",
+            "Video Status": "error"
+        }, []
+    session_id = data.get('session_id')
+    if not baybe.valid_session_id(session_id):
+        return 400, {
+            "BAYBE's Response": "Error: Invalid session_id",
+            "Video Status": "error"
+        }, []
+
+    try:
+        user_message = data['message']
+        history = baybe.conversation_memory.history(session_id)
+
+        # Repeat questions are answered straight from the cache, unless earlier turns shape the reply
+        key = baybe.response_cache_key(user_message) if not history else None
+        cached = await asyncio.to_thread(baybe.lookup_cached_turn, key, user_message) if key else None
+        if cached:
+            baybe.conversation_memory.append(session_id, user_message, cached['reply'])
+            return 200, {
+                "BAYBE's Response": cached['reply'],
+                "Video Status": "completed",
+                "Video URL": cached['video_url']
+            }, []
+
+        # Shed load before spending GPT tokens on a turn we can't finish in time
+        baybe.admission.check()
+
+        # Step 1: Get GPT response
+        with await baybe.admission.gpt.acquire_async():
+            gpt_reply = await get_gpt_response(user_message, history)
+        logging.info(f"GPT response: {gpt_reply}")
+        baybe.conversation_memory.append(session_id, user_message, gpt_reply)
+        # The spoken reply is synthesized locally while the video renders; looking
+        # for a stored clip touches the disk, so it happens on a thread
+        audio_url = await asyncio.to_thread(baybe.start_audio, gpt_reply)
+
+        # Answer with the text straight away while HeyGen's breaker is open
+        if baybe.heygen_breaker.open:
+            return 200, baybe.video_skipped(gpt_reply, audio_url), []
+
+        try:
+            video_slot = await baybe.admission.video.acquire_async()
+        except Overloaded as e:
+            return overloaded_response(e, gpt_reply)
+
+        # The video slot is held until the render has been waited on
+        with video_slot:
+            # Step 2: Generate HeyGen video
+            video_gen_response = await submit_heygen_video(gpt_reply)
+
+            if video_gen_response.get("circuit_open"):
+                return 200, baybe.video_skipped(gpt_reply, audio_url), []
+            if "error" in video_gen_response:
+                logging.error(f"Video generation failed: {video_gen_response}")
+                return 200, baybe.with_audio({
+                    "BAYBE's Response": gpt_reply,
+                    "Video Status": "error",
+                    "error": video_gen_response.get('error', 'Failed to generate video')
+                }, audio_url), []
+
+            video_id = video_gen_response['data']['video_id']
+            logging.info(f"Video generation started with ID: {video_id}")
+
+            # Job mode: the video poller finishes the job, so return (and free the video slot) right away
+            if data.get('async') or 'respond-async' in headers.get('prefer', ''):
+                job = await asyncio.to_thread(baybe.start_video_job, key, user_message, gpt_reply, video_id)
+                logging.info(f"Video {video_id} handed off to job {job.id}")
+                return 202, baybe.with_audio(job.to_dict(), audio_url), [(b"location", f"/jobs/{job.id}".encode())]
+
+            # Step 3: Wait for video completion
+            try:
+                video_url = await wait_and_cache(key, user_message, gpt_reply, video_id)
+            except VideoRenderError as e:
+                logging.error(f"Video {video_id} failed to render: {str(e)}")
+                return 200, baybe.with_audio({
+                    "BAYBE's Response": gpt_reply,
+                    "Video Status": "error",
+                    "Video ID": video_id,
+                    "error": str(e)
+                }, audio_url), []
+        if video_url:
+            return 200, baybe.with_audio({
+                "BAYBE's Response": gpt_reply,
+                "Video Status": "completed",
+                "Video URL": video_url
+            }, audio_url), []
+
+        return 200, baybe.with_audio({
+            "BAYBE's Response": gpt_reply,
+            "Video Status": "processing",
+            "Video ID": video_id
+        }, audio_url), []
+
+    except (Overloaded, CircuitOpen) as e:
+        return overloaded_response(e)
+    except Exception as e:
+        logging.error(f"Error in chat endpoint: {str(e)}\n{traceback.format_exc()}")
+        return 500, {
+            "BAYBE's Response": "Error occurred",
+            "Video Status": "error",
+            "error": str(e)
+        }, []
+
+
+async def get_audio(audio_id, headers):
+    """Serve a spoken reply, waiting for local TTS without holding a thread.
+
+    Clips in the audio store are streamed from the file in chunks, with Range
+    support. The body is bytes, or an async iterator of chunks when it comes
+    from a file (its Content-Length is then among the headers).
+    """
+    future = baybe.local_tts.future(audio_id) if baybe.local_tts is not None else None
+    if future is not None:
+        try:
+            # shield() keeps a timeout here from cancelling the clip's future, which other requests share
+            wav = await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), baybe.LOCAL_TTS_TIMEOUT)
+        except asyncio.TimeoutError:
+            return 503, "application/json", json.dumps({"error": "Audio is still being synthesized"}).encode(), \
+                [(b"retry-after", b"1")]
+        except Exception as e:
+            return 500, "application/json", json.dumps({"error": f"Audio synthesis failed: {str(e)}"}).encode(), []
+    # Clip IDs are content hashes, so a clip never changes
+    cache_headers = [(b"cache-control", b"public, max-age=31536000, immutable"),
+                     (b"etag", f'"{audio_id}"'.encode())]
+    # The store's lock is also taken by evictions on other threads, so keep it off the event loop
+    clip = await asyncio.to_thread(baybe.audio_store.lookup, audio_id) if baybe.audio_store is not None else None
+    if clip is not None:
+        path, content_type = clip
+        if headers.get("if-none-match") == f'"{audio_id}"':
+            return 304, content_type, b"", cache_headers
+        try:
+            clip = await asyncio.to_thread(open, path, "rb")
+        except FileNotFoundError:
+            # Evicted in the meantime
+            clip = None
+    if clip is not None:
+        size = os.fstat(clip.fileno()).st_size
+        cache_headers.append((b"accept-ranges", b"bytes"))
+        byte_range = parse_range_header(headers.get("range"))
+        if byte_range is None:
+            return 200, content_type, read_clip(clip), [*cache_headers, (b"content-length", str(size).encode())]
+        span = byte_range.range_for_length(size)
+        if span is None:
+            clip.close()
+            return 416, content_type, b"", [*cache_headers, (b"content-range", f"bytes */{size}".encode())]
+        start, stop = span
+        clip.seek(start)
+        return 206, content_type, read_clip(clip, stop - start), [
+            *cache_headers,
+            (b"content-length", str(stop - start).encode()),
+            (b"content-range", f"bytes {start}-{stop - 1}/{size}".encode())
+        ]
+    if future is None:
+        return 404, "application/json", json.dumps({"error": "Unknown audio ID"}).encode(), []
+    return 200, "audio/wav", wav, cache_headers
+
+
+async def write_spoken_reply(user_message, session_id, pieces):
+    """Stream the GPT reply into ``pieces`` in speakable chunks, then None; an exception if the turn fails."""
+    try:
+        history = baybe.conversation_memory.history(session_id)
+        splitter = SpeechSplitter()
+        fragments = []
+        with await baybe.admission.gpt.acquire_async():
+            async for fragment in stream_gpt_response(user_message, history):
+                fragments.append(fragment)
+                for piece in splitter.feed(fragment):
+                    pieces.put_nowait(piece)
+        for piece in splitter.flush():
+            pieces.put_nowait(piece)
+        gpt_reply = "".join(fragments)
+        logging.info(f"GPT response: {gpt_reply}")
+        baybe.conversation_memory.append(session_id, user_message, gpt_reply)
+        pieces.put_nowait(None)
+    except Exception as e:
+        pieces.put_nowait(e)
+
+
+async def open_speech(text):
+    """Start the speech of ``text``: the stored clip, or ElevenLabs' stream once audio is on its way.
+
+    Returns an async iterator of audio chunks.
+    """
+    key = speech_key(text)
+    clip = await asyncio.to_thread(baybe.audio_store.open, key) if baybe.audio_store is not None and key else None
+    if clip is not None:
+        return read_clip(clip)
+    baybe.elevenlabs_breaker.check()
+    url, headers, payload = speech_request(text)
+    started = time.monotonic()
+    try:
+        with tracing.span("elevenlabs.stream", chars=len(text)):
+            response = await send(client.build_request("POST", url, headers=headers, json=payload), stream=True)
+            if response.is_error:
+                await response.aclose()
+                response.raise_for_status()
+    except Exception:
+        baybe.elevenlabs_breaker.record(time.monotonic() - started, False)
+        raise
+    baybe.elevenlabs_breaker.record(time.monotonic() - started, True)
+    return relay_speech(response, key)
+
+
+async def read_clip(clip, length=None):
+    """Yield an open clip's bytes in chunks (at most ``length`` of them), reading on a thread."""
+    with clip:
+        while length is None or length > 0:
+            chunk = await asyncio.to_thread(clip.read, AUDIO_CHUNK_BYTES if length is None
+                                            else min(AUDIO_CHUNK_BYTES, length))
+            if not chunk:
+                return
+            if length is not None:
+                length -= len(chunk)
+            yield chunk
+
+
+async def relay_speech(response, key):
+    """Yield ElevenLabs' audio as it arrives, storing the clip once it is complete."""
+    chunks = []
+    try:
+        async for chunk in response.aiter_bytes(AUDIO_CHUNK_BYTES):
+            chunks.append(chunk)
+            yield chunk
+    finally:
+        await response.aclose()
+    if baybe.audio_store is not None and key is not None:
+        # Writing the file, and any eviction it triggers, happens on a thread
+        try:
+            await asyncio.to_thread(baybe.audio_store.put, key, b"".join(chunks), content_type())
+        except OSError as e:
+            logging.error(f"Could not store audio clip {key}: {str(e)}")
+
+
+async def chat_audio(data, send):
+    """Voice-only turn: stream ElevenLabs speech of the GPT reply while it is being generated."""
+    started = time.monotonic()
+    logging.info(f"Received audio chat request: {data}")
+
+    if not ELEVENLABS_API_KEY:
+        return await send_json(send, 404, {"error": "Audio mode is not enabled"})
+    if not isinstance(data, dict) or 'message' not in data:
+        return await send_json(send, 400, {"error": "No message provided"})
+    session_id = data.get('session_id')
+    if not baybe.valid_session_id(session_id):
+        return await send_json(send, 400, {"error": "Invalid session_id"})
+
+    # Wait for the first piece of the reply and its audio, so failures still get a proper status
+    pieces = asyncio.Queue()
+    writer = None
+    try:
+        baybe.admission.check()
+        if baybe.elevenlabs_breaker.open:
+            raise CircuitOpen(baybe.elevenlabs_breaker.name, baybe.elevenlabs_breaker.retry_after())
+        writer = asyncio.create_task(write_spoken_reply(data['message'], session_id, pieces))
+        piece = await pieces.get()
+        if isinstance(piece, Exception):
+            raise piece
+        if piece is None:
+            return await send_json(send, 502, {"error": "Empty reply"})
+        audio = await open_speech(piece)
+    except (Overloaded, CircuitOpen) as e:
+        logging.warning(f"Shedding audio chat request: {str(e)}")
+        return await send_json(send, 503, {"error": str(e)}, [(b"retry-after", str(e.retry_after).encode())])
+    except Exception as e:
+        logging.error(f"Error in audio chat endpoint: {str(e)}")
+        return await send_json(send, 502, {"error": str(e)})
+
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [(b"content-type", content_type().encode()),
+                    (b"cache-control", b"no-cache"),
+                    (b"x-accel-buffering", b"no"),
+                    *CORS_HEADERS]
+    })
+    # Relay the audio of each piece of the reply in turn, opening the next when one finishes
+    first = True
+    try:
+        while audio is not None:
+            try:
+                with baybe.in_flight.track("elevenlabs"):
+                    async for chunk in audio:
+                        if first:
+                            baybe.speech_first_audio.observe(time.monotonic() - started)
+                            first = False
+                        await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            finally:
+                await audio.aclose()
+            piece = await pieces.get()
+            if isinstance(piece, Exception):
+                logging.error(f"Voice-only turn ended early: {str(piece)}")
+                break
+            audio = None
+            if piece is not None:
+                try:
+                    audio = await open_speech(piece)
+                except Exception as e:
+                    logging.error(f"ElevenLabs error, voice-only turn ended early: {str(e)}")
+    finally:
+        if not writer.done():
+            writer.cancel()
+    await send({"type": "http.response.body", "body": b""})
+
+
+def api_chat(data):
+    """Start a streamed chat turn; results arrive on /api/messages."""
+    logging.info(f"Received streaming chat request: {data}")
+
+    if not isinstance(data, dict) or 'message' not in data or 'client_id' not in data:
+        return 400, {"error": "Both message and client_id are required"}, []
+    # The browser's client ID doubles as its conversation unless it names one
+    session_id = data.get('session_id', data['client_id'])
+    if not baybe.valid_session_id(session_id):
+        return 400, {"error": "Invalid session_id"}, []
+
+    try:
+        baybe.admission.check()
+    except Overloaded as e:
+        logging.warning(f"Shedding streaming chat request: {str(e)}")
+        return 503, {"error": str(e)}, [(b"retry-after", str(e.retry_after).encode())]
+
+    # run_turn is blocking, so it runs on the Flask app's stream executor, in this request's trace
+    baybe.stream_executor.submit(contextvars.copy_context().run, baybe.run_streamed_turn,
+                                 data['client_id'], data['message'], session_id)
+    return 202, {"status": "accepted"}, []
+
+
+async def api_messages(client_id, receive, send):
+    """Server-Sent Events stream of GPT tokens and video stages for one client, until it disconnects."""
+    if not client_id:
+        return await send_json(send, 400, {"error": "client_id is required"})
+
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [(b"content-type", b"text/event-stream"),
+                    (b"cache-control", b"no-cache"),
+                    (b"x-accel-buffering", b"no"),
+                    *CORS_HEADERS]
+    })
+
+    async def relay():
+        async with contextlib.aclosing(baybe.event_channels.stream_async(client_id)) as events:
+            async for message in events:
+                await send({"type": "http.response.body", "body": message.encode(), "more_body": True})
+
+    relaying = asyncio.create_task(relay())
+    try:
+        # The server doesn't fail sends to a closed connection, so watch for the disconnect
+        while (await receive())["type"] != "http.disconnect":
+            pass
+    finally:
+        relaying.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await relaying
+
+
+def get_job(job_id):
+    """Report the current stage of an asynchronous chat job."""
+    job = baybe.job_store.get(job_id)
+    if job is None:
+        return 404, {
+            "Job ID": job_id,
+            "Video Status": "error",
+            "error": "Unknown job ID"
+        }
+    return 200, job.to_dict()
+
+
+def heygen_webhook(body, headers):
+    """Receive HeyGen render callbacks and wake up whoever is waiting on the video."""
+    if not baybe.HEYGEN_WEBHOOK_SECRET:
+        return 404, {"error": "Webhooks are not enabled"}
+    if not verify_signature(baybe.HEYGEN_WEBHOOK_SECRET, body, headers.get('signature')):
+        logging.warning("Rejected HeyGen webhook with an invalid signature")
+        return 401, {"error": "Invalid signature"}
+
+    try:
+        event = parse_event(json.loads(body or b"null"))
+    except ValueError as e:
+        return 400, {"error": str(e)}
+    if event is None:
+        return 200, {"status": "ignored"}
+
+    video_id, status, video_url, error = event
+    baybe.video_poller.resolve(video_id, status, video_url, error)
+    logging.info(f"HeyGen callback for video {video_id}: {status}")
+    return 200, {"status": "ok"}
+
+
+async def read_body(receive):
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            return body
+
+
+async def send_json(send, status, payload, extra_headers=()):
+    body = json.dumps(payload).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    *CORS_HEADERS, *extra_headers]
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def lifespan(receive, send):
+    global client, loop
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            loop = asyncio.get_running_loop()
+            client = httpx.AsyncClient(
+                timeout=httpx.Timeout(HTTP_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+                limits=httpx.Limits(max_connections=ASYNC_MAX_CONNECTIONS,
+                                    max_keepalive_connections=HTTP_POOL_SIZE)
+            )
+            logging.info("Async chat pipeline ready")
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await client.aclose()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    """ASGI entry point."""
+    if scope["type"] == "lifespan":
+        return await lifespan(receive, send)
+    if scope["type"] != "http":
+        return
+
+    method = scope["method"]
+    path = scope["path"]
+    headers = {name.decode().lower(): value.decode() for name, value in scope["headers"]}
+
+    if method == "OPTIONS":
+        await send({"type": "http.response.start", "status": 204, "headers": CORS_HEADERS})
+        await send({"type": "http.response.body", "body": b""})
+        return
+
+    # Trace the request, continuing the caller's trace if it sent a traceparent header
+    route = path
+    if path.startswith("/jobs/"):
+        route = "/jobs/<job_id>"
+    elif path.startswith("/audio/"):
+        route = "/audio/<audio_id>"
+    span = tracing.start_span(f"{method} {route}", traceparent=headers.get("traceparent"),
+                              kind=tracing.KIND_SERVER, **{"http.method": method, "http.route": route})
+    token = tracing.activate(span)
+
+    # Tag log records with the client's X-Request-ID, if valid, or a new one
+    request_id = headers.get("x-request-id", "")
+    if not baybe.REQUEST_ID_PATTERN.match(request_id):
+        request_id = uuid.uuid4().hex
+    request_id_token = structured_logging.set_request_id(request_id)
+
+    async def traced_send(message):
+        if message["type"] == "http.response.start":
+            span.set(**{"http.status_code": message["status"]})
+            message = dict(message, headers=[*message.get("headers", []),
+                                             (b"x-request-id", request_id.encode())])
+        await send(message)
+
+    query = parse_qs(scope.get("query_string", b"").decode())
+    try:
+        await route_request(method, path, query, headers, receive, traced_send)
+    except BaseException as e:
+        span.set_error(e)
+        raise
+    finally:
+        structured_logging.reset_request_id(request_id_token)
+        tracing.deactivate(token)
+        span.end()
+
+
+async def route_request(method, path, query, headers, receive, send):
+    if path == "/chat" and method == "POST":
+        body = await read_body(receive)
+        try:
+            data = json.loads(body) if body else None
+        except ValueError:
+            data = None
+        started = time.monotonic()
+        with baybe.in_flight.track("chat"):
+            status, payload, extra_headers = await chat(data, headers)
+        outcome = baybe.chat_outcome(status, payload)
+        baybe.chat_latency.observe(time.monotonic() - started, outcome)
+        baybe.chat_outcomes.inc(outcome)
+        await send_json(send, status, payload, extra_headers)
+    elif path == "/" and method == "GET":
+        body = baybe.app.jinja_env.get_template("index.html").render().encode()
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", b"text/html; charset=utf-8"),
+                        (b"content-length", str(len(body)).encode())]
+        })
+        await send({"type": "http.response.body", "body": body})
+    elif path == "/api/chat" and method == "POST":
+        body = await read_body(receive)
+        try:
+            data = json.loads(body) if body else None
+        except ValueError:
+            data = None
+        await send_json(send, *api_chat(data))
+    elif path == "/api/messages" and method == "GET":
+        await api_messages(query.get("client_id", [None])[0], receive, send)
+    elif path == "/chat/audio" and method == "POST":
+        body = await read_body(receive)
+        try:
+            data = json.loads(body) if body else None
+        except ValueError:
+            data = None
+        await chat_audio(data, send)
+    elif path.startswith("/audio/") and method == "GET":
+        status, content_type, body, extra_headers = await get_audio(path[len("/audio/"):], headers)
+        if isinstance(body, bytes):
+            extra_headers = [(b"content-length", str(len(body)).encode()), *extra_headers]
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", content_type.encode()), *CORS_HEADERS, *extra_headers]
+        })
+        if isinstance(body, bytes):
+            await send({"type": "http.response.body", "body": body})
+        else:
+            async with contextlib.aclosing(body) as chunks:
+                async for chunk in chunks:
+                    await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            await send({"type": "http.response.body", "body": b""})
+    elif path.startswith("/jobs/") and method == "GET":
+        await send_json(send, *get_job(path[len("/jobs/"):]))
+    elif path == "/stats" and method == "GET":
+        await send_json(send, 200, baybe.collect_stats())
+    elif path == "/status" and method == "GET":
+        await send_json(send, 200, baybe.dependency_status())
+    elif path == "/metrics" and method == "GET":
+        body = metrics.render(baybe.collect_stats()).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", metrics.CONTENT_TYPE.encode()),
+                        (b"content-length", str(len(body)).encode())]
+        })
+        await send({"type": "http.response.body", "body": body})
+    elif path.startswith("/debug/requests/") and method in ("PUT", "DELETE"):
+        await send_json(send, *baybe.set_request_debug(path[len("/debug/requests/"):], method == "PUT",
+                                                       headers.get("x-debug-token")))
+    elif path == "/heygen/webhook" and method == "POST":
+        await send_json(send, *heygen_webhook(await read_body(receive), headers))
+    else:
+        await send_json(send, 404, {"error": "Not found"})
@@ -0,0 +1,194 @@
+"""Content-addressed store of synthesized speech on disk.
+
+A clip's ID is a hash of everything that shapes the audio: voice, text,
+model and output format. The persona repeats many short lines, so a clip
+that is already on disk is served (or streamed) from there instead of being
+synthesized again.
+
+Files are written to a temporary name and moved into place with
+os.replace, so every worker can share the directory and never sees a
+partial clip. Each worker keeps an in-memory index of the clips it knows
+about. When its view of the directory goes over AUDIO_CACHE_MAX_BYTES it
+rescans the directory and deletes the least recently used clips (by
+modification time, which hits refresh) until it is back under
+AUDIO_CACHE_LOW_WATER of the limit.
+"""
+import os
+import re
+import time
+import uuid
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# Audio cache configuration; an empty AUDIO_CACHE_DIR turns the store off
+AUDIO_CACHE_DIR = os.getenv("AUDIO_CACHE_DIR", "cache/audio")
+AUDIO_CACHE_MAX_BYTES = int(os.getenv("AUDIO_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+# Eviction frees space down to this fraction of the limit, so it doesn't run on every write
+AUDIO_CACHE_LOW_WATER = float(os.getenv("AUDIO_CACHE_LOW_WATER", "0.9"))
+
+EXTENSIONS = {"audio/wav": ".wav", "audio/mpeg": ".mp3", "audio/pcm": ".pcm", "audio/basic": ".ulaw"}
+CONTENT_TYPES = {extension: content_type for content_type, extension in EXTENSIONS.items()}
+
+KEY_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+
+def audio_key(voice, text, model, output_format):
+    """The clip ID for ``text`` spoken by ``voice`` with ``model``, encoded as ``output_format``."""
+    material = "\x00".join([voice or "", text, model, output_format])
+    return hashlib.sha256(material.encode()).hexdigest()[:32]
+
+
+class AudioStore:
+    """Clips on disk under ``path``, named ``<key><extension>``, bounded in total size."""
+
+    def __init__(self, path=AUDIO_CACHE_DIR, max_bytes=AUDIO_CACHE_MAX_BYTES, low_water=AUDIO_CACHE_LOW_WATER):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.low_water = low_water
+        # key -> (filename, size), least recently used first
+        self._index = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        with self._lock:
+            self._rescan()
+
+    def lookup(self, key):
+        """``(path, content_type)`` of a stored clip, or None. Counts as a use of the clip."""
+        if not KEY_PATTERN.match(key):
+            return None
+        with self._lock:
+            entry = self._index.get(key)
+        if entry is not None:
+            filename = entry[0]
+        else:
+            # Another worker may have stored it since we last looked
+            filename = next((key + extension for extension in CONTENT_TYPES
+                             if os.path.exists(os.path.join(self.path, key + extension))), None)
+        if filename is not None:
+            path = os.path.join(self.path, filename)
+            try:
+                # The modification time is the shared LRU clock
+                os.utime(path)
+                size = os.path.getsize(path)
+            except FileNotFoundError:
+                # Evicted by another worker
+                filename = None
+        if filename is None:
+            with self._lock:
+                self._forget(key)
+                self.misses += 1
+            return None
+        with self._lock:
+            self._remember(key, filename, size)
+            self.hits += 1
+        return path, CONTENT_TYPES[os.path.splitext(filename)[1]]
+
+    def open(self, key):
+        """A stored clip opened for reading, or None."""
+        clip = self.lookup(key)
+        if clip is None:
+            return None
+        try:
+            return open(clip[0], "rb")
+        except FileNotFoundError:
+            # Evicted in the meantime
+            return None
+
+    def put(self, key, data, content_type):
+        with self.writer(key, content_type) as f:
+            f.write(data)
+
+    @contextmanager
+    def writer(self, key, content_type):
+        """Write a clip in pieces; it is stored only if the ``with`` block completes."""
+        filename = key + EXTENSIONS[content_type]
+        tmp_path = os.path.join(self.path, f".{filename}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp")
+        f = open(tmp_path, "wb")
+        try:
+            yield f
+            f.close()
+            size = os.path.getsize(tmp_path)
+            os.replace(tmp_path, os.path.join(self.path, filename))
+        except BaseException:
+            # Including GeneratorExit when a client hangs up mid-stream
+            f.close()
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+        with self._lock:
+            self._remember(key, filename, size)
+            self.writes += 1
+            if self._bytes > self.max_bytes:
+                self._evict()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "clips": len(self._index),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "writes": self.writes,
+                "evictions": self.evictions
+            }
+
+    def _remember(self, key, filename, size):
+        self._forget(key)
+        self._index[key] = (filename, size)
+        self._bytes += size
+
+    def _forget(self, key):
+        entry = self._index.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[1]
+
+    def _rescan(self):
+        """Rebuild the index from the directory, oldest clips first. Call with the lock held."""
+        clips = []
+        with os.scandir(self.path) as entries:
+            for entry in entries:
+                key, extension = os.path.splitext(entry.name)
+                if extension not in CONTENT_TYPES or not KEY_PATTERN.match(key):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                clips.append((stat.st_mtime, key, entry.name, stat.st_size))
+        clips.sort()
+        self._index.clear()
+        self._bytes = 0
+        for _, key, filename, size in clips:
+            self._remember(key, filename, size)
+
+    def _evict(self):
+        """Delete the least recently used clips of every worker down to the low-water mark. Call with the lock held."""
+        started = time.monotonic()
+        self._rescan()
+        target = self.max_bytes * self.low_water
+        evicted = 0
+        for key, (filename, size) in list(self._index.items()):
+            if self._bytes <= target:
+                break
+            try:
+                os.remove(os.path.join(self.path, filename))
+            except FileNotFoundError:
+                pass
+            self._forget(key)
+            evicted += 1
+        self.evictions += evicted
+        logging.info(f"Audio cache evicted {evicted} clips in {time.monotonic() - started:.3f}s, "
+                     f"{self._bytes} bytes left")
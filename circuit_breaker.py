@@ -0,0 +1,161 @@
+"""Circuit breakers for the upstream APIs.
+
+A breaker watches the outcome of recent calls to one dependency. Calls
+that fail, or that succeed but take longer than its slow-call threshold,
+count against it; once more than CIRCUIT_FAILURE_RATE of the window is
+bad, the breaker opens and calls are refused straight away instead of
+tying up a thread on an upstream that isn't answering. After
+CIRCUIT_OPEN_SECONDS it goes half-open and lets one probe call through:
+a good probe closes it again, a bad one reopens it.
+"""
+import os
+import time
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+import metrics
+
+# Circuit breaker configuration, shared by every dependency
+CIRCUIT_FAILURE_RATE = float(os.getenv("CIRCUIT_FAILURE_RATE", "0.5"))
+CIRCUIT_WINDOW = int(os.getenv("CIRCUIT_WINDOW", "20"))
+# Calls in the window before the failure rate is trusted
+CIRCUIT_MIN_CALLS = int(os.getenv("CIRCUIT_MIN_CALLS", "10"))
+CIRCUIT_OPEN_SECONDS = float(os.getenv("CIRCUIT_OPEN_SECONDS", "30"))
+# Successful calls slower than this count as failures
+CIRCUIT_OPENAI_SLOW_SECONDS = float(os.getenv("CIRCUIT_OPENAI_SLOW_SECONDS", "30"))
+CIRCUIT_HEYGEN_SLOW_SECONDS = float(os.getenv("CIRCUIT_HEYGEN_SLOW_SECONDS", "10"))
+# For ElevenLabs this is the time to the first audio byte
+CIRCUIT_ELEVENLABS_SLOW_SECONDS = float(os.getenv("CIRCUIT_ELEVENLABS_SLOW_SECONDS", "5"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+circuit_transitions = metrics.Counter("baybe_circuit_transitions_total",
+                                      "Circuit breaker state changes by dependency and new state",
+                                      ["dependency", "state"])
+circuit_rejections = metrics.Counter("baybe_circuit_rejected_total",
+                                     "Calls refused by an open circuit breaker", ["dependency"])
+
+
+class CircuitOpen(Exception):
+    """Raised instead of calling a dependency whose breaker is open."""
+
+    def __init__(self, dependency, retry_after):
+        self.dependency = dependency
+        self.retry_after = max(1, round(retry_after))
+        super().__init__(f"{dependency} is unavailable, retry in {self.retry_after}s")
+
+
+class CircuitBreaker:
+    """Closed/open/half-open breaker over the last ``window`` calls to one dependency."""
+
+    def __init__(self, name, slow_seconds, failure_rate=CIRCUIT_FAILURE_RATE, window=CIRCUIT_WINDOW,
+                 min_calls=CIRCUIT_MIN_CALLS, open_seconds=CIRCUIT_OPEN_SECONDS):
+        self.name = name
+        self.slow_seconds = slow_seconds
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.state = CLOSED
+        self._results = deque(maxlen=window)
+        self._opened_at = 0.0
+        # When the half-open probe went out; a probe that never reports back is replaced after open_seconds
+        self._probe_started = None
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.rejected = 0
+
+    def allow(self):
+        """Whether a call may go ahead now. Every allowed call must be followed by ``record``."""
+        now = time.monotonic()
+        with self._lock:
+            if self.state == OPEN and now - self._opened_at >= self.open_seconds:
+                self._transition(HALF_OPEN)
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and (self._probe_started is None
+                                            or now - self._probe_started >= self.open_seconds):
+                self._probe_started = now
+                return True
+            self.rejected += 1
+        circuit_rejections.inc(self.name)
+        return False
+
+    def check(self):
+        """Raise CircuitOpen unless a call may go ahead now."""
+        if not self.allow():
+            raise CircuitOpen(self.name, self.retry_after())
+
+    @contextmanager
+    def call(self):
+        """Check the breaker, then record how the ``with`` block went."""
+        self.check()
+        started = time.monotonic()
+        try:
+            yield
+        except Exception:
+            self.record(time.monotonic() - started, False)
+            raise
+        self.record(time.monotonic() - started, True)
+
+    def retry_after(self):
+        with self._lock:
+            if self.state == CLOSED:
+                return 0.0
+            return max(0.0, self._opened_at + self.open_seconds - time.monotonic())
+
+    def record(self, seconds, ok):
+        """Record one call's outcome; slow successes count as failures."""
+        good = ok and seconds <= self.slow_seconds
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probe_started = None
+                if good:
+                    self._results.clear()
+                    self._transition(CLOSED)
+                else:
+                    self._open(f"probe {'was slow' if ok else 'failed'}")
+                return
+            if self.state == OPEN:
+                # A call let through before the breaker opened
+                return
+            self._results.append(good)
+            bad = self._results.count(False)
+            if len(self._results) >= self.min_calls and bad / len(self._results) > self.failure_rate:
+                self._open(f"{bad} of the last {len(self._results)} calls failed or were slow")
+
+    @property
+    def open(self):
+        """Whether calls are being refused right now, without using up the half-open probe."""
+        with self._lock:
+            return self.state == OPEN and time.monotonic() - self._opened_at < self.open_seconds
+
+    def stats(self):
+        with self._lock:
+            calls = len(self._results)
+            return {
+                "state": self.state,
+                "open": self.state != CLOSED,
+                "failure_rate": round(self._results.count(False) / calls, 4) if calls else 0.0,
+                "calls": calls,
+                "opened": self.opened,
+                "rejected": self.rejected,
+                "retry_after_seconds": round(max(0.0, self._opened_at + self.open_seconds - time.monotonic()), 1)
+                if self.state != CLOSED else 0.0
+            }
+
+    def _open(self, reason):
+        logging.warning(f"Circuit breaker for {self.name} opened for {self.open_seconds}s: {reason}")
+        self._opened_at = time.monotonic()
+        self.opened += 1
+        self._transition(OPEN)
+
+    def _transition(self, state):
+        if state != self.state:
+            if state == CLOSED:
+                logging.warning(f"Circuit breaker for {self.name} closed")
+            self.state = state
+            circuit_transitions.inc(self.name, state)
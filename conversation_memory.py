@@ -0,0 +1,294 @@
+"""Per-session conversation memory for multi-turn chats.
+
+Each session keeps its recent turns in a small ring buffer. The history sent
+with a prompt never exceeds a token budget: turns that no longer fit are
+dropped, or, with a summarizer, rolled into a running summary that is stored
+with the session and reused on every turn. Sessions are kept in an LRU and
+expire when idle, so memory stays bounded however many clients there are.
+
+Tokens are counted with tiktoken when it is installed (it is not in
+requirements.txt) and estimated from the text length otherwise.
+"""
+import os
+import math
+import time
+import logging
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# Conversation memory configuration
+CONVERSATION_MAX_SESSIONS = int(os.getenv("CONVERSATION_MAX_SESSIONS", "10000"))
+CONVERSATION_MAX_TURNS = int(os.getenv("CONVERSATION_MAX_TURNS", "20"))
+# Most tokens of history sent with one prompt, summary included
+CONVERSATION_HISTORY_TOKENS = int(os.getenv("CONVERSATION_HISTORY_TOKENS", "1000"))
+CONVERSATION_SESSION_TTL = float(os.getenv("CONVERSATION_SESSION_TTL", "3600"))
+CONVERSATION_SUMMARY_ENABLED = os.getenv("CONVERSATION_SUMMARY_ENABLED", "").lower() in ("1", "true", "yes")
+CONVERSATION_SUMMARY_TOKENS = int(os.getenv("CONVERSATION_SUMMARY_TOKENS", "200"))
+# Turns a session may have waiting for its summary; older ones are dropped beyond this
+CONVERSATION_SUMMARY_MAX_PENDING = int(os.getenv("CONVERSATION_SUMMARY_MAX_PENDING", "8"))
+# Sessions waiting for the summarizer; turns trimmed beyond this are dropped unsummarized
+CONVERSATION_SUMMARY_MAX_QUEUE = int(os.getenv("CONVERSATION_SUMMARY_MAX_QUEUE", "100"))
+
+# Rough size of a token in English text, for when tiktoken isn't available
+CHARS_PER_TOKEN = 4
+# Role and separator tokens the API adds around every message
+MESSAGE_OVERHEAD_TOKENS = 4
+
+SUMMARY_PREFIX = "Summary of the conversation so far: "
+
+
+class TokenCounter:
+    """Counts tokens the way the chat model does, or estimates them."""
+
+    def __init__(self, model="gpt-4"):
+        self._encoding = None
+        if tiktoken is not None:
+            try:
+                self._encoding = tiktoken.encoding_for_model(model)
+            except Exception as e:
+                logging.warning(f"Estimating conversation tokens, tiktoken failed: {str(e)}")
+
+    @property
+    def exact(self):
+        return self._encoding is not None
+
+    def __call__(self, text):
+        if self._encoding is not None:
+            return len(self._encoding.encode(text)) + MESSAGE_OVERHEAD_TOKENS
+        return math.ceil(len(text) / CHARS_PER_TOKEN) + MESSAGE_OVERHEAD_TOKENS
+
+    def truncate(self, text, tokens):
+        """Cut ``text`` to about ``tokens`` tokens."""
+        tokens = max(0, tokens - MESSAGE_OVERHEAD_TOKENS)
+        if self._encoding is not None:
+            encoded = self._encoding.encode(text)
+            return text if len(encoded) <= tokens else self._encoding.decode(encoded[:tokens])
+        return text[:tokens * CHARS_PER_TOKEN]
+
+
+class _Turn:
+    __slots__ = ("user", "reply", "tokens")
+
+    def __init__(self, user, reply, tokens):
+        self.user = user
+        self.reply = reply
+        self.tokens = tokens
+
+
+class _Session:
+    __slots__ = ("turns", "tokens", "summary", "summary_tokens", "pending", "summarizing", "last_used")
+
+    def __init__(self, max_turns):
+        self.turns = deque(maxlen=max_turns)
+        self.tokens = 0
+        self.summary = None
+        self.summary_tokens = 0
+        # Trimmed turns waiting to be folded into the summary, and whether a roll-up is queued or running
+        self.pending = []
+        self.summarizing = False
+        self.last_used = time.monotonic()
+
+
+class ConversationMemory:
+    """Bounded history of recent turns per session ID.
+
+    ``summarize(summary, turns)`` is optional; given one, turns that fall out
+    of the token budget are folded into the session's summary on a
+    background thread instead of being forgotten. It gets the previous
+    summary (or None) and a list of ``(user message, reply)`` pairs and
+    returns the new summary text.
+
+    At most ``max_pending`` turns per session wait for a summary (a burst of
+    turns drops the oldest), and at most ``max_queue`` sessions wait for the
+    summarizer thread, so neither memory nor the summary prompt grows with load.
+    """
+
+    def __init__(self, max_sessions=CONVERSATION_MAX_SESSIONS, max_turns=CONVERSATION_MAX_TURNS,
+                 history_tokens=CONVERSATION_HISTORY_TOKENS, ttl=CONVERSATION_SESSION_TTL,
+                 summarize=None, summary_tokens=CONVERSATION_SUMMARY_TOKENS,
+                 max_pending=CONVERSATION_SUMMARY_MAX_PENDING, max_queue=CONVERSATION_SUMMARY_MAX_QUEUE):
+        self._sessions = OrderedDict()
+        self._max_sessions = max_sessions
+        self._max_turns = max_turns
+        self._history_tokens = history_tokens
+        self._ttl = ttl
+        self._summarize = summarize
+        self._summary_tokens = min(summary_tokens, history_tokens // 2)
+        self._max_pending = max_pending
+        self._max_queue = max_queue
+        self._queued = 0
+        self._count_tokens = TokenCounter()
+        self._lock = threading.Lock()
+        # One thread: summaries are a background nicety and must never compete with turns
+        self._summarizer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="summarizer") if summarize else None
+        self.evictions = 0
+        self.expirations = 0
+        self.trimmed_turns = 0
+        self.summaries = 0
+        self.summary_failures = 0
+        self.summary_dropped_turns = 0
+
+    def history(self, session_id):
+        """Chat messages to send before the new user message: the summary, then recent turns, oldest first."""
+        if not session_id:
+            return []
+        with self._lock:
+            session = self._get(session_id)
+            if session is None:
+                return []
+            messages = []
+            if session.summary:
+                messages.append({"role": "system", "content": SUMMARY_PREFIX + session.summary})
+            for turn in session.turns:
+                messages.append({"role": "user", "content": turn.user})
+                messages.append({"role": "assistant", "content": turn.reply})
+            return messages
+
+    def append(self, session_id, user_message, reply):
+        """Remember a finished turn, trimming the oldest turns to stay within the token budget."""
+        if not session_id:
+            return
+        # Leave room for the summary, and never let one huge turn take the whole budget
+        turn_budget = self._history_tokens - self._summary_tokens if self._summarize else self._history_tokens
+        half = turn_budget // 2
+        user_message = self._count_tokens.truncate(user_message, half)
+        reply = self._count_tokens.truncate(reply, half)
+        turn = _Turn(user_message, reply, self._count_tokens(user_message) + self._count_tokens(reply))
+
+        with self._lock:
+            session = self._get(session_id)
+            if session is None:
+                session = self._sessions[session_id] = _Session(self._max_turns)
+                self._evict()
+            trimmed = []
+            if len(session.turns) == session.turns.maxlen:
+                trimmed.append(session.turns.popleft())
+            session.turns.append(turn)
+            session.tokens += turn.tokens - sum(old.tokens for old in trimmed)
+            while session.tokens + session.summary_tokens > self._history_tokens and len(session.turns) > 1:
+                old = session.turns.popleft()
+                session.tokens -= old.tokens
+                trimmed.append(old)
+            self.trimmed_turns += len(trimmed)
+            if not trimmed or self._summarizer is None:
+                return
+            self._add_pending(session, trimmed)
+            if session.summarizing:
+                # A summary is already being written; it picks these turns up when it finishes
+                return
+            if self._queued >= self._max_queue:
+                # The summarizer is behind; these turns are forgotten as they would be without it
+                self.summary_dropped_turns += len(session.pending)
+                session.pending.clear()
+                return
+            session.summarizing = True
+            self._queued += 1
+        self._summarizer.submit(self._roll_up, session_id, session)
+
+    def clear(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "max_sessions": self._max_sessions,
+                "turns": sum(len(session.turns) for session in self._sessions.values()),
+                "history_tokens": self._history_tokens,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "trimmed_turns": self.trimmed_turns,
+                "summaries": self.summaries,
+                "summary_failures": self.summary_failures,
+                "summary_queue": self._queued,
+                "summary_dropped_turns": self.summary_dropped_turns,
+                "exact_tokens": self._count_tokens.exact
+            }
+
+    def _get(self, session_id):
+        """Look up a live session and mark it recently used. Call with the lock held."""
+        session = self._sessions.get(session_id)
+        if session is None:
+            return None
+        now = time.monotonic()
+        if now - session.last_used > self._ttl:
+            del self._sessions[session_id]
+            self.expirations += 1
+            return None
+        session.last_used = now
+        self._sessions.move_to_end(session_id)
+        return session
+
+    def _evict(self):
+        now = time.monotonic()
+        # Idle sessions are at the front, so expired ones go first
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if now - session.last_used > self._ttl:
+                self.expirations += 1
+            elif len(self._sessions) > self._max_sessions:
+                self.evictions += 1
+            else:
+                break
+            del self._sessions[session_id]
+
+    def _add_pending(self, session, turns):
+        """Queue trimmed turns for the summary, dropping the oldest beyond the cap. Call with the lock held."""
+        session.pending.extend((turn.user, turn.reply) for turn in turns)
+        excess = len(session.pending) - self._max_pending
+        if excess > 0:
+            del session.pending[:excess]
+            self.summary_dropped_turns += excess
+
+    def _roll_up(self, session_id, session):
+        """Fold trimmed turns into the session summary until none are left."""
+        while True:
+            with self._lock:
+                turns, session.pending = session.pending, []
+                previous = session.summary
+            try:
+                summary = self._fit_summary(self._summarize(previous, turns))
+            except Exception as e:
+                # These turns are forgotten rather than retried forever
+                logging.error(f"Conversation summary failed for session {session_id}: {str(e)}")
+                with self._lock:
+                    self.summary_failures += 1
+                    if not session.pending:
+                        session.summarizing = False
+                        self._queued -= 1
+                        return
+                continue
+            with self._lock:
+                self.summaries += 1
+                session.summary = summary
+                session.summary_tokens = self._count_tokens(SUMMARY_PREFIX + summary)
+                # The new summary may be longer than the old one; make room for it
+                trimmed = []
+                while session.tokens + session.summary_tokens > self._history_tokens and len(session.turns) > 1:
+                    old = session.turns.popleft()
+                    session.tokens -= old.tokens
+                    trimmed.append(old)
+                self.trimmed_turns += len(trimmed)
+                self._add_pending(session, trimmed)
+                if not session.pending:
+                    session.summarizing = False
+                    self._queued -= 1
+                    return
+
+    def _fit_summary(self, summary):
+        """Cut a summary so its message, prefix included, is within the summary budget."""
+        budget = self._summary_tokens - (self._count_tokens(SUMMARY_PREFIX) - MESSAGE_OVERHEAD_TOKENS)
+        while True:
+            summary = self._count_tokens.truncate(summary, budget)
+            excess = self._count_tokens(SUMMARY_PREFIX + summary) - self._summary_tokens
+            if excess <= 0 or not summary:
+                return summary
+            # Tokens can merge differently across the join
+            budget -= excess
@@ -0,0 +1,124 @@
+import json
+import time
+import queue
+import asyncio
+import logging
+import threading
+
+# Server-Sent Events configuration
+CHANNEL_MAX_EVENTS = 1000
+CHANNEL_IDLE_TTL_SECONDS = 300
+HEARTBEAT_SECONDS = 15
+
+
+def format_sse(data, event=None):
+    """Encode a single Server-Sent Events message."""
+    message = ""
+    if event:
+        message += f"event: {event}\n"
+    message += f"data: {json.dumps(data)}\n\n"
+    return message
+
+
+class EventChannel:
+    """Bounded queue of events waiting to be sent to one browser."""
+
+    def __init__(self, client_id):
+        self.client_id = client_id
+        self.subscribers = 0
+        self.last_active = time.time()
+        self._queue = queue.Queue(maxsize=CHANNEL_MAX_EVENTS)
+        # Called after every put, to wake up asyncio subscribers
+        self.listeners = set()
+
+    def put(self, data, event=None):
+        try:
+            self._queue.put_nowait(format_sse(data, event))
+        except queue.Full:
+            logging.warning(f"Dropping event for client {self.client_id}: channel is full")
+            return
+        for listener in list(self.listeners):
+            listener()
+
+    def get(self, timeout):
+        try:
+            return self._queue.get(timeout=timeout) if timeout else self._queue.get_nowait()
+        except queue.Empty:
+            return None
+
+
+class EventChannels:
+    """Per-client event channels for /api/messages.
+
+    Events published before the browser connects are buffered in the channel,
+    and channels nobody is listening to are dropped after CHANNEL_IDLE_TTL_SECONDS.
+    """
+
+    def __init__(self):
+        self._channels = {}
+        self._lock = threading.Lock()
+
+    def _channel(self, client_id):
+        with self._lock:
+            self._prune()
+            channel = self._channels.get(client_id)
+            if channel is None:
+                channel = self._channels[client_id] = EventChannel(client_id)
+            channel.last_active = time.time()
+            return channel
+
+    def publish(self, client_id, data, event=None):
+        self._channel(client_id).put(data, event)
+
+    def stream(self, client_id):
+        """Yield encoded events for a client until the connection goes away."""
+        channel = self._channel(client_id)
+        with self._lock:
+            channel.subscribers += 1
+        try:
+            # Tell the browser how long to wait before reconnecting
+            yield "retry: 3000\n\n"
+            while True:
+                message = channel.get(timeout=HEARTBEAT_SECONDS)
+                # A comment line keeps proxies from closing an idle connection
+                yield message if message is not None else ": heartbeat\n\n"
+        finally:
+            with self._lock:
+                channel.subscribers -= 1
+                channel.last_active = time.time()
+
+    async def stream_async(self, client_id):
+        """Like stream(), for an event loop: waits for events without holding a thread."""
+        channel = self._channel(client_id)
+        loop = asyncio.get_running_loop()
+        wakeup = asyncio.Event()
+
+        def listener():
+            loop.call_soon_threadsafe(wakeup.set)
+
+        with self._lock:
+            channel.subscribers += 1
+            channel.listeners.add(listener)
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                wakeup.clear()
+                message = channel.get(timeout=0)
+                if message is None:
+                    try:
+                        await asyncio.wait_for(wakeup.wait(), HEARTBEAT_SECONDS)
+                        continue
+                    except asyncio.TimeoutError:
+                        message = ": heartbeat\n\n"
+                yield message
+        finally:
+            with self._lock:
+                channel.subscribers -= 1
+                channel.listeners.discard(listener)
+                channel.last_active = time.time()
+
+    def _prune(self):
+        cutoff = time.time() - CHANNEL_IDLE_TTL_SECONDS
+        for client_id in [c for c, channel in self._channels.items()
+                          if channel.subscribers == 0 and channel.last_active < cutoff]:
+            del self._channels[client_id]
@@ -1,6 +1,126 @@
 import os
+import sys
+import json
+import math
+import multiprocessing
+from urllib.parse import urlsplit
 
 bind = f"0.0.0.0:{os.getenv('PORT', '10000')}"
-workers = 1
-threads = 2
-timeout = 120 
\ No newline at end of file
+
+# Worker model: gthread (default) or cooperative gevent.
+# ASYNC_MODE=1 serves the asyncio pipeline (asgi_app.py) on uvicorn workers instead of Flask.
+ASYNC_MODE = os.getenv('ASYNC_MODE', '').lower() in ('1', 'true', 'yes')
+WORKER_CLASS = "uvicorn" if ASYNC_MODE else os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+COOPERATIVE_WORKERS = ("gevent", "uvicorn")
+if WORKER_CLASS not in ("gthread",) + COOPERATIVE_WORKERS:
+    # A sync worker holds one turn at a time and is killed by the timeout mid-render
+    raise RuntimeError(f"Unsupported GUNICORN_WORKER_CLASS: {WORKER_CLASS}")
+
+# Capacity sizing. A turn holds its connection for the GPT call plus the video
+# render, so the connections needed follow from target throughput x turn latency.
+# Without a target the default sizes for as many connections as the limits allow,
+# so only an explicit target is checked against the capacity it gets.
+TARGET_RPS = float(os.getenv('TARGET_RPS', '5'))
+TARGET_RPS_SET = bool(os.getenv('TARGET_RPS'))
+CAPACITY_HEADROOM = 1.5
+DEFAULT_TURN_SECONDS = 30.0
+# Turn latency measured by the previous run, written when its workers exit
+CAPACITY_PROFILE_PATH = os.getenv('CAPACITY_PROFILE_PATH', 'cache/capacity.json')
+MAX_WORKER_CONNECTIONS = 2000
+# Each open SSE stream pins a thread, so keep some beyond what turns need
+MIN_THREADS = 8
+MAX_THREADS = 64
+
+# Longest a turn legitimately blocks: GPT plus the video wait (VIDEO_WAIT_TIMEOUT in app.py)
+TURN_DEADLINE_SECONDS = 120 + float(os.getenv('VIDEO_WAIT_TIMEOUT', '90'))
+
+
+def measured_turn_seconds():
+    """Return (seconds, source) for how long a turn holds its connection."""
+    if os.getenv('UPSTREAM_LATENCY_SECONDS'):
+        return float(os.getenv('UPSTREAM_LATENCY_SECONDS')), "UPSTREAM_LATENCY_SECONDS"
+    try:
+        with open(CAPACITY_PROFILE_PATH) as f:
+            return float(json.load(f)['turn_seconds']), CAPACITY_PROFILE_PATH
+    except (OSError, ValueError, KeyError, TypeError):
+        return DEFAULT_TURN_SECONDS, "default"
+
+
+TURN_SECONDS, TURN_SECONDS_SOURCE = measured_turn_seconds()
+CPU_COUNT = multiprocessing.cpu_count()
+
+# Jobs, SSE channels, conversation memory, webhook waiters and admission queues
+# live in the worker that created them, so every worker class runs one worker
+# unless asked otherwise (with sticky sessions in front of them).
+workers_setting = os.getenv('GUNICORN_WORKERS', '1')
+workers = CPU_COUNT if workers_setting == 'auto' else int(workers_setting)
+
+# Concurrent turns each worker must hold to reach TARGET_RPS
+connections_per_worker = math.ceil(TARGET_RPS * TURN_SECONDS * CAPACITY_HEADROOM / workers)
+
+if WORKER_CLASS == "gthread":
+    threads = int(os.getenv('GUNICORN_THREADS', str(min(max(connections_per_worker, MIN_THREADS), MAX_THREADS))))
+    concurrency_per_worker = threads
+    # http_client sizes its pools from the thread count
+    os.environ['GUNICORN_THREADS'] = str(threads)
+else:
+    worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS',
+                                       str(min(max(connections_per_worker, 100), MAX_WORKER_CONNECTIONS))))
+    concurrency_per_worker = worker_connections
+    worker_class = "uvicorn.workers.UvicornWorker" if WORKER_CLASS == "uvicorn" else WORKER_CLASS
+    # A pool per concurrent turn, within reason
+    os.environ.setdefault('HTTP_POOL_SIZE', str(max(10, min(worker_connections, 200))))
+
+wsgi_app = "asgi_app:app" if ASYNC_MODE else "app:app"
+
+# The worker timeout is a heartbeat: threaded and cooperative workers keep
+# beating while requests run, so it only catches a wedged worker and never cuts
+# off long-poll or SSE connections. A restart lets in-flight turns finish first.
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '120'))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', str(int(TURN_DEADLINE_SECONDS))))
+# SSE clients reconnect on their own; idle keep-alive sockets shouldn't pin threads
+keepalive = 5
+
+
+def when_ready(server):
+    """Log the capacity this configuration was sized for."""
+    concurrency = workers * concurrency_per_worker
+    server.log.info(f"Worker class: {WORKER_CLASS}, {workers} worker(s) on {CPU_COUNT} CPU(s)")
+    server.log.info(f"Concurrent turns: {concurrency_per_worker} per worker, {concurrency} total")
+    server.log.info(f"Turn latency: {TURN_SECONDS:.1f}s (from {TURN_SECONDS_SOURCE}), "
+                    f"sustainable throughput ~{concurrency / TURN_SECONDS:.1f} turns/s "
+                    f"(target {TARGET_RPS:g}{'' if TARGET_RPS_SET else ', default'})")
+    server.log.info(f"Timeouts: heartbeat {timeout}s, graceful {graceful_timeout}s, keep-alive {keepalive}s")
+    if TARGET_RPS_SET and concurrency / TURN_SECONDS < TARGET_RPS:
+        server.log.warning("Capacity is below TARGET_RPS; raise the worker or connection limits")
+    if WORKER_CLASS == "gevent" and os.getenv('WS_PORT'):
+        server.log.warning("The WebSocket channel runs asyncio and should be started with python ws_server.py")
+
+
+def worker_exit(server, worker):
+    """Record this worker's measured turn latency so the next start sizes from it."""
+    baybe = sys.modules.get('app')
+    if baybe is None or not hasattr(baybe, 'collect_stats'):
+        return
+    try:
+        stats = baybe.collect_stats()
+        gpt = stats['http_pools'].get(urlsplit(baybe.openai.api_base).netloc, {})
+        render_seconds = stats['video_poller']['avg_wait_seconds']
+        if not render_seconds:
+            return
+        # Async mode calls OpenAI through httpx, so only the render wait is measured there
+        gpt_seconds = gpt.get('avg_seconds', 0.0)
+        profile = {
+            "turn_seconds": round(gpt_seconds + render_seconds, 2),
+            "gpt_seconds": gpt_seconds,
+            "render_seconds": render_seconds
+        }
+        directory = os.path.dirname(CAPACITY_PROFILE_PATH)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{CAPACITY_PROFILE_PATH}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(profile, f)
+        os.replace(tmp_path, CAPACITY_PROFILE_PATH)
+    except Exception as e:
+        server.log.warning(f"Could not record capacity profile: {str(e)}")
@@ -0,0 +1,213 @@
+"""Hedged GPT requests.
+
+GPT latency has a long tail: most replies come back close to the median,
+but a few take several times as long. With hedging on, a call that hasn't
+answered by a recent latency percentile of its model gets a second,
+identical request, optionally to a faster model. Whichever answers first is
+used; the other is left to finish in the background so its latency still
+feeds the model's health and shows how much time the hedge saved.
+
+Every hedge is an extra completion to pay for, so hedges are drawn from a
+budget that refills by GPT_HEDGE_MAX_RATE per call: over time at most that
+fraction of calls is hedged, however slow the upstream gets.
+"""
+import os
+import time
+import asyncio
+import logging
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import metrics
+
+# Hedging configuration
+GPT_HEDGE_ENABLED = os.getenv("GPT_HEDGE_ENABLED", "").lower() in ("1", "true", "yes")
+# Hedge calls still running at this percentile of the model's recent latency
+GPT_HEDGE_PERCENTILE = float(os.getenv("GPT_HEDGE_PERCENTILE", "95"))
+# Never hedge sooner than this, whatever the percentile says
+GPT_HEDGE_MIN_DELAY = float(os.getenv("GPT_HEDGE_MIN_DELAY", "1"))
+# Most hedges per call, averaged over time
+GPT_HEDGE_MAX_RATE = float(os.getenv("GPT_HEDGE_MAX_RATE", "0.05"))
+# Send the hedge to the next faster model in GPT_MODELS instead of the same one
+GPT_HEDGE_FASTER_MODEL = os.getenv("GPT_HEDGE_FASTER_MODEL", "").lower() in ("1", "true", "yes")
+GPT_HEDGE_WORKERS = int(os.getenv("GPT_HEDGE_WORKERS", "64"))
+
+# Hedges that can be sent back to back before the rate limit applies
+HEDGE_BURST = 10
+
+gpt_hedges = metrics.Counter("baybe_gpt_hedges_total", "GPT calls that reached the hedge delay, by outcome", ["outcome"])
+gpt_hedge_saved = metrics.Histogram("baybe_gpt_hedge_saved_seconds",
+                                    "How much sooner hedged GPT calls answered than the original request")
+
+
+class HedgeBudget:
+    """Token bucket of hedges, refilled by ``max_rate`` per call."""
+
+    def __init__(self, max_rate=GPT_HEDGE_MAX_RATE, burst=HEDGE_BURST):
+        self.max_rate = max_rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + self.max_rate)
+
+    def withdraw(self):
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+class Hedger:
+    """Runs a GPT request, and a hedge for it when it is slow and the budget allows.
+
+    ``request(model)`` makes one call and returns the reply; it must record
+    its own outcome with the router, as the losing request finishes after
+    the caller has moved on.
+    """
+
+    def __init__(self, router, enabled=GPT_HEDGE_ENABLED, percentile=GPT_HEDGE_PERCENTILE,
+                 min_delay=GPT_HEDGE_MIN_DELAY, max_rate=GPT_HEDGE_MAX_RATE,
+                 faster_model=GPT_HEDGE_FASTER_MODEL, workers=GPT_HEDGE_WORKERS):
+        self.router = router
+        self.enabled = enabled
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.faster_model = faster_model
+        self.budget = HedgeBudget(max_rate)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="gpt-hedge") if enabled else None
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.hedged = 0
+        self.won = 0
+        self.over_budget = 0
+        self.saved_seconds = 0.0
+
+    def delay(self, model):
+        """Seconds to wait before hedging a call to ``model``, or None to not hedge it."""
+        if not self.enabled:
+            return None
+        recent = self.router.percentile(model, self.percentile)
+        if recent is None:
+            # Not enough calls yet to know what slow looks like
+            return None
+        return max(self.min_delay, recent)
+
+    def hedge_model(self, model):
+        return self.router.faster(model) if self.faster_model else model
+
+    def call(self, request, model):
+        """``request(model)``, hedged on the worker pool if it runs past the hedge delay."""
+        delay = self.delay(model)
+        if delay is None:
+            return request(model)
+        self._count_call()
+        started = time.monotonic()
+        primary = self._executor.submit(contextvars.copy_context().run, request, model)
+        done, _ = wait([primary], timeout=delay)
+        if done or not self._withdraw():
+            return primary.result()
+
+        hedge_model = self.hedge_model(model)
+        logging.info(f"Hedging GPT call to {model} with {hedge_model} after {delay:.2f}s")
+        hedge = self._executor.submit(contextvars.copy_context().run, request, hedge_model)
+        pending = {primary, hedge}
+        winner = None
+        # If the first to finish failed, the other may still answer
+        while pending and winner is None:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            winner = self._first_success(done, primary, hedge)
+        return self._settle(winner, primary, hedge, started).result()
+
+    async def call_async(self, request, model):
+        """Coroutine version of ``call``: ``request(model)`` is awaited and hedged as a task."""
+        delay = self.delay(model)
+        if delay is None:
+            return await request(model)
+        self._count_call()
+        started = time.monotonic()
+        primary = asyncio.ensure_future(request(model))
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done or not self._withdraw():
+            return await primary
+
+        hedge_model = self.hedge_model(model)
+        logging.info(f"Hedging GPT call to {model} with {hedge_model} after {delay:.2f}s")
+        hedge = asyncio.ensure_future(request(hedge_model))
+        pending = {primary, hedge}
+        winner = None
+        while pending and winner is None:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            winner = self._first_success(done, primary, hedge)
+        return self._settle(winner, primary, hedge, started).result()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "calls": self.calls,
+                "hedged": self.hedged,
+                "won": self.won,
+                "over_budget": self.over_budget,
+                # Extra completions paid for, per call that could be hedged
+                "hedge_rate": round(self.hedged / self.calls, 4) if self.calls else 0.0,
+                "saved_seconds": round(self.saved_seconds, 3)
+            }
+
+    def _count_call(self):
+        self.budget.deposit()
+        with self._lock:
+            self.calls += 1
+
+    def _withdraw(self):
+        if self.budget.withdraw():
+            with self._lock:
+                self.hedged += 1
+            return True
+        gpt_hedges.inc("over_budget")
+        with self._lock:
+            self.over_budget += 1
+        return False
+
+    @staticmethod
+    def _first_success(done, primary, hedge):
+        for future in (primary, hedge):
+            if future in done and future.exception() is None:
+                return future
+        return None
+
+    def _settle(self, winner, primary, hedge, started):
+        """Count the outcome and, once the loser finishes, how much time the hedge saved.
+
+        Returns the future whose result the caller gets: the winner, or the
+        original request's if both failed.
+        """
+        for future in (primary, hedge):
+            # Mark the loser's error as seen; it has nobody else to report to
+            future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        if winner is None:
+            gpt_hedges.inc("failed")
+            return primary
+        if winner is primary:
+            gpt_hedges.inc("lost")
+            return primary
+
+        gpt_hedges.inc("won")
+        answered = time.monotonic() - started
+        with self._lock:
+            self.won += 1
+
+        def primary_finished(future):
+            if future.cancelled() or future.exception() is not None:
+                return
+            saved = time.monotonic() - started - answered
+            gpt_hedge_saved.observe(saved)
+            with self._lock:
+                self.saved_seconds += saved
+
+        primary.add_done_callback(primary_finished)
+        return hedge
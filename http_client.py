@@ -0,0 +1,135 @@
+import os
+import time
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import tracing
+
+# HTTP client configuration
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "30"))
+
+# Size pools so every gunicorn thread plus the background executors can hold a
+# connection to the same host without opening throwaway ones
+GUNICORN_THREADS = int(os.getenv("GUNICORN_THREADS", "2"))
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", str(max(10, GUNICORN_THREADS * 4))))
+
+
+class PooledSession(requests.Session):
+    """Keep-alive session for one host that applies default timeouts and records usage."""
+
+    def __init__(self, host, pool_size=HTTP_POOL_SIZE):
+        super().__init__()
+        self.host = host
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.mount("https://", adapter)
+        self.mount("http://", adapter)
+        self.pool_size = pool_size
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.total_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def request(self, method, url, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        started = time.monotonic()
+        try:
+            return super().request(method, url, **kwargs)
+        except requests.exceptions.RequestException:
+            with self._lock:
+                self.errors += 1
+            raise
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+                self.total_seconds += time.monotonic() - started
+
+    def send(self, request, **kwargs):
+        """Send a prepared request in a client span, propagating the trace to the upstream."""
+        with tracing.span(f"HTTP {request.method}", kind=tracing.KIND_CLIENT,
+                          **{"http.method": request.method, "http.url": request.url.split("?")[0],
+                             "http.request_bytes": len(request.body or b"")}) as span:
+            if span.traceparent:
+                request.headers["traceparent"] = span.traceparent
+            response = super().send(request, **kwargs)
+            span.set(**{"http.status_code": response.status_code})
+            if kwargs.get("stream"):
+                # Reading the body here would consume the stream
+                if response.headers.get("Content-Length"):
+                    span.set(**{"http.response_bytes": int(response.headers["Content-Length"])})
+            else:
+                span.set(**{"http.response_bytes": len(response.content)})
+            return response
+
+    def stats(self):
+        with self._lock:
+            return {
+                "pool_size": self.pool_size,
+                "requests": self.requests,
+                "errors": self.errors,
+                "in_flight": self.in_flight,
+                "peak_in_flight": self.peak_in_flight,
+                "avg_seconds": round(self.total_seconds / self.requests, 4) if self.requests else 0.0
+            }
+
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def session_for(url):
+    """Return the shared session for the host in ``url``, creating it on first use."""
+    host = urlsplit(url).netloc
+    with _sessions_lock:
+        session = _sessions.get(host)
+        if session is None:
+            session = _sessions[host] = PooledSession(host)
+        return session
+
+
+class BorrowedSession:
+    """A view of a shared session whose close() leaves the pool open.
+
+    For libraries that close the sessions they are given: openai 0.28 closes
+    each thread's session every few minutes, which would otherwise drop every
+    pooled connection to the host.
+    """
+
+    def __init__(self, session):
+        self._session = session
+
+    def __getattr__(self, name):
+        return getattr(self._session, name)
+
+    def close(self):
+        pass
+
+
+def borrow_session(url):
+    return BorrowedSession(session_for(url))
+
+
+def get(url, **kwargs):
+    return session_for(url).get(url, **kwargs)
+
+
+def post(url, **kwargs):
+    return session_for(url).post(url, **kwargs)
+
+
+def stats():
+    """Per-host pool usage."""
+    with _sessions_lock:
+        sessions = list(_sessions.values())
+    return {session.host: session.stats() for session in sessions}
@@ -0,0 +1,176 @@
+import os
+import time
+import uuid
+import heapq
+import logging
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+# Job configuration
+# Threads that record finished jobs (and cache their turns); none of them waits on a video
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_TTL_SECONDS = int(os.getenv("JOB_TTL_SECONDS", "3600"))
+JOB_MAX_RETAINED = int(os.getenv("JOB_MAX_RETAINED", "10000"))
+
+# Job stages
+STAGE_RENDERING = "rendering"
+STAGE_COMPLETED = "completed"
+STAGE_TIMED_OUT = "timed_out"
+STAGE_ERROR = "error"
+
+FINISHED_STAGES = (STAGE_COMPLETED, STAGE_TIMED_OUT, STAGE_ERROR)
+
+
+class Job:
+    """State of a single asynchronous chat turn."""
+
+    def __init__(self, reply, video_id):
+        self.id = uuid.uuid4().hex
+        self.stage = STAGE_RENDERING
+        self.reply = reply
+        self.video_id = video_id
+        self.video_url = None
+        self.error = None
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+
+    @property
+    def finished(self):
+        return self.stage in FINISHED_STAGES
+
+    def to_dict(self):
+        """Render the job using the same field names as the /chat response."""
+        if self.stage == STAGE_COMPLETED:
+            video_status = "completed"
+        elif self.stage == STAGE_ERROR:
+            video_status = "error"
+        else:
+            video_status = "processing"
+
+        result = {
+            "Job ID": self.id,
+            "Stage": self.stage,
+            "BAYBE's Response": self.reply,
+            "Video Status": video_status,
+            "Video ID": self.video_id
+        }
+        if self.video_url:
+            result["Video URL"] = self.video_url
+        if self.error:
+            result["error"] = self.error
+        return result
+
+
+class JobStore:
+    """In-memory job registry.
+
+    Jobs are finished from a done-callback on the video's future, or by a
+    single timer thread once their timeout passes, so no thread is parked
+    per outstanding job.
+    """
+
+    def __init__(self, max_workers=JOB_WORKERS, ttl=JOB_TTL_SECONDS, max_retained=JOB_MAX_RETAINED):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._ttl = ttl
+        self._max_retained = max_retained
+        # (deadline, sequence, job, on_finish, context), earliest first
+        self._deadlines = []
+        self._sequence = 0
+        self._deadline_added = threading.Condition(self._lock)
+        self._timer = None
+
+    def submit(self, reply, video_id, future, timeout, on_finish=None):
+        """Register a job that finishes when ``future`` resolves to the video URL, or times out after ``timeout`` seconds.
+
+        ``on_finish(job)`` is called once the job has finished, on a job thread.
+        """
+        job = self.create(reply, video_id)
+        # Carry the caller's context (and so its trace) over to the job threads; the settle
+        # and timeout tasks may overlap, and a context can't be entered twice at once,
+        # so each task runs in its own copy
+        context = contextvars.copy_context()
+        with self._lock:
+            self._sequence += 1
+            heapq.heappush(self._deadlines, (time.monotonic() + timeout, self._sequence, job, on_finish, context))
+            self._deadline_added.notify()
+            self._ensure_timer()
+        future.add_done_callback(
+            lambda future: self._executor.submit(context.copy().run, self._settle, job, future, on_finish))
+        return job
+
+    def create(self, reply, video_id):
+        """Register a job whose video the caller will wait on itself; report back with finish()."""
+        job = Job(reply, video_id)
+        with self._lock:
+            self._prune()
+            self._jobs[job.id] = job
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def finish(self, job, video_url=None, error=None):
+        """Record the outcome of a job: a video URL, an error, or neither if it timed out."""
+        if error:
+            logging.error(f"Job {job.id} failed: {error}")
+            job.error = error
+            job.stage = STAGE_ERROR
+        elif video_url:
+            job.video_url = video_url
+            job.stage = STAGE_COMPLETED
+        else:
+            job.stage = STAGE_TIMED_OUT
+        job.updated_at = time.time()
+        logging.info(f"Job {job.id} finished with stage: {job.stage}")
+
+    def _settle(self, job, future, on_finish):
+        try:
+            outcome = {"video_url": future.result()}
+        except Exception as e:
+            outcome = {"error": str(e)}
+        self._finish_once(job, on_finish, **outcome)
+
+    def _finish_once(self, job, on_finish, **outcome):
+        # The video and the timer race to finish the job; only the first one counts
+        with self._lock:
+            if job.finished:
+                return
+            self.finish(job, **outcome)
+        if on_finish is not None:
+            try:
+                on_finish(job)
+            except Exception as e:
+                logging.error(f"Job {job.id} cleanup failed: {str(e)}")
+
+    def _ensure_timer(self):
+        """Start the timeout thread if it isn't running. Call with the lock held."""
+        if self._timer is None or not self._timer.is_alive():
+            self._timer = threading.Thread(target=self._run_timer, name="job-timer", daemon=True)
+            self._timer.start()
+
+    def _run_timer(self):
+        while True:
+            with self._lock:
+                while not self._deadlines or self._deadlines[0][0] > time.monotonic():
+                    self._deadline_added.wait(self._deadlines[0][0] - time.monotonic() if self._deadlines else None)
+                _, _, job, on_finish, context = heapq.heappop(self._deadlines)
+            if not job.finished:
+                self._executor.submit(context.copy().run, self._finish_once, job, on_finish)
+
+    def _prune(self):
+        """Drop finished jobs past their TTL, then the oldest finished ones over the cap."""
+        cutoff = time.time() - self._ttl
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.finished and job.updated_at < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+        overflow = len(self._jobs) - self._max_retained + 1
+        if overflow > 0:
+            # Dicts keep insertion order, so the first entries are the oldest jobs; unfinished ones are kept
+            for job_id in [job_id for job_id, job in self._jobs.items() if job.finished][:overflow]:
+                del self._jobs[job_id]
@@ -0,0 +1,192 @@
+"""Local text-to-speech for a fast audio path.
+
+A HeyGen video takes tens of seconds to render, but a small Coqui TTS model
+(VITS by default) speaks a reply on CPU in about a second. The model is
+loaded once per process and warmed up, and clips are synthesized on a small
+bounded pool of inference threads, so clients can play BAYBE's voice while
+the video renders.
+
+Clips are content-addressed by model, speaker and text: the same reply is
+only synthesized once while its clip is remembered, or for as long as it is
+kept in the shared audio store on disk. Coqui TTS (the ``TTS``
+package) is an optional dependency; the engine is only built when
+LOCAL_TTS_ENABLED is set.
+"""
+import io
+import os
+import wave
+import time
+import logging
+import threading
+import contextvars
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, Future
+
+import metrics
+import tracing
+from audio_store import audio_key
+
+# Local TTS configuration
+LOCAL_TTS_ENABLED = os.getenv("LOCAL_TTS_ENABLED", "").lower() in ("1", "true", "yes")
+LOCAL_TTS_MODEL = os.getenv("LOCAL_TTS_MODEL", "tts_models/en/ljspeech/vits")
+LOCAL_TTS_SPEAKER = os.getenv("LOCAL_TTS_SPEAKER") or None
+LOCAL_TTS_WORKERS = int(os.getenv("LOCAL_TTS_WORKERS", "2"))
+# Clips waiting for an inference thread beyond this are not synthesized
+LOCAL_TTS_MAX_QUEUE = int(os.getenv("LOCAL_TTS_MAX_QUEUE", "16"))
+LOCAL_TTS_CACHE_SIZE = int(os.getenv("LOCAL_TTS_CACHE_SIZE", "100"))
+LOCAL_TTS_MAX_CHARS = int(os.getenv("LOCAL_TTS_MAX_CHARS", "1000"))
+# How long GET /audio/<id> waits for a clip that is still being synthesized
+LOCAL_TTS_TIMEOUT = float(os.getenv("LOCAL_TTS_TIMEOUT", "15"))
+
+WARMUP_TEXT = "Ugh, fine."
+
+tts_latency = metrics.Histogram("baybe_tts_seconds", "Local text-to-speech synthesis time")
+
+
+class CoquiSynthesizer:
+    """Float samples from a Coqui TTS model, run on CPU."""
+
+    def __init__(self, model_name=LOCAL_TTS_MODEL, speaker=LOCAL_TTS_SPEAKER):
+        from TTS.api import TTS
+
+        self.name = model_name
+        self.speaker = speaker
+        self._tts = TTS(model_name=model_name, progress_bar=False)
+        self.sample_rate = self._tts.synthesizer.output_sample_rate
+
+    def __call__(self, text):
+        return self._tts.tts(text=text, speaker=self.speaker)
+
+
+def encode_wav(samples, sample_rate):
+    """16-bit mono WAV bytes from float samples in [-1, 1]."""
+    import numpy as np
+
+    pcm = (np.clip(np.asarray(samples, dtype=np.float32), -1.0, 1.0) * 32767).astype("<i2")
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(pcm.tobytes())
+    return buffer.getvalue()
+
+
+class LocalTTS:
+    """Synthesizes replies to WAV on a bounded thread pool and keeps recent clips by ID.
+
+    ``synthesize(text)`` returns float samples and has ``name``, ``speaker``
+    and ``sample_rate`` attributes. It is called from several threads at
+    once, which PyTorch inference allows. Finished clips are also written to
+    ``store`` (an AudioStore), if given, and not synthesized again while they
+    are there.
+    """
+
+    def __init__(self, synthesize=None, workers=LOCAL_TTS_WORKERS, max_queue=LOCAL_TTS_MAX_QUEUE,
+                 cache_size=LOCAL_TTS_CACHE_SIZE, max_chars=LOCAL_TTS_MAX_CHARS, store=None):
+        try:
+            self._synthesize = synthesize or CoquiSynthesizer()
+        except ImportError as e:
+            raise ImportError(f"Local TTS needs the TTS package: {str(e)}")
+        self._max_pending = workers + max_queue
+        self._cache_size = cache_size
+        self._max_chars = max_chars
+        self._store = store
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tts")
+        self._clips = OrderedDict()
+        self._pending = 0
+        self._lock = threading.Lock()
+        self.synthesized = 0
+        self.hits = 0
+        self.rejected = 0
+        self.failures = 0
+        self.synthesis_seconds = 0.0
+        self.audio_seconds = 0.0
+        self._warm_up()
+
+    def _warm_up(self):
+        # The first inference is several times slower than the rest; pay for it at startup
+        started = time.monotonic()
+        self._synthesize(WARMUP_TEXT)
+        logging.info(f"Local TTS model {self._synthesize.name} ready in {time.monotonic() - started:.2f}s")
+
+    def submit(self, text):
+        """Start synthesizing ``text`` unless its clip exists already. Returns the clip ID, or None if too busy."""
+        text = text.strip()[:self._max_chars]
+        if not text:
+            return None
+        clip_id = audio_key(self._synthesize.speaker, text, self._synthesize.name, "wav")
+        with self._lock:
+            if clip_id in self._clips:
+                self._clips.move_to_end(clip_id)
+                self.hits += 1
+                return clip_id
+        if self._store is not None and self._store.lookup(clip_id) is not None:
+            with self._lock:
+                self.hits += 1
+            return clip_id
+        with self._lock:
+            if self._pending >= self._max_pending:
+                self.rejected += 1
+                logging.warning("Local TTS queue is full, reply goes without audio")
+                return None
+            self._pending += 1
+            future = self._clips[clip_id] = Future()
+            self._evict()
+        self._executor.submit(contextvars.copy_context().run, self._run, clip_id, text, future)
+        return clip_id
+
+    def future(self, clip_id):
+        """The clip's Future (resolving to WAV bytes), or None if the ID is unknown or forgotten."""
+        with self._lock:
+            return self._clips.get(clip_id)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "model": self._synthesize.name,
+                "clips": len(self._clips),
+                "pending": self._pending,
+                "synthesized": self.synthesized,
+                "hits": self.hits,
+                "rejected": self.rejected,
+                "failures": self.failures,
+                # Below 1 means faster than real time
+                "real_time_factor": round(self.synthesis_seconds / self.audio_seconds, 3) if self.audio_seconds else 0.0
+            }
+
+    def _run(self, clip_id, text, future):
+        started = time.monotonic()
+        try:
+            with tracing.span("tts.synthesize", chars=len(text)), tts_latency.time():
+                samples = self._synthesize(text)
+                wav = encode_wav(samples, self._synthesize.sample_rate)
+        except Exception as e:
+            logging.error(f"Local TTS failed: {str(e)}")
+            with self._lock:
+                self._pending -= 1
+                self.failures += 1
+                # Let a later request try again
+                if self._clips.get(clip_id) is future:
+                    del self._clips[clip_id]
+            future.set_exception(e)
+            return
+        with self._lock:
+            self._pending -= 1
+            self.synthesized += 1
+            self.synthesis_seconds += time.monotonic() - started
+            self.audio_seconds += len(samples) / self._synthesize.sample_rate
+        if self._store is not None:
+            try:
+                self._store.put(clip_id, wav, "audio/wav")
+            except OSError as e:
+                logging.error(f"Could not store audio clip {clip_id}: {str(e)}")
+        future.set_result(wav)
+
+    def _evict(self):
+        """Forget the least recently used finished clips beyond the cache size. Call with the lock held."""
+        for clip_id in list(self._clips):
+            if len(self._clips) <= self._cache_size:
+                break
+            if self._clips[clip_id].done():
+                del self._clips[clip_id]
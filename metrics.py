@@ -0,0 +1,208 @@
+import math
+import time
+import threading
+from contextlib import contextmanager
+
+try:
+    # Under gevent's monkey patching get_ident is per greenlet; shards must follow OS threads
+    from gevent.monkey import get_original
+    _get_ident = get_original("_thread", "get_ident")
+except ImportError:
+    from _thread import get_ident as _get_ident
+
+# Latency buckets in seconds, from cached answers up to a full video render
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 90, 120)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_registry = []
+_registry_lock = threading.Lock()
+
+
+class _Metric:
+    """Base for metrics whose values are kept per thread.
+
+    Each thread records into its own dict, so the hot path never takes a lock
+    or contends with other threads; a scrape adds the per-thread values up.
+    Shards are keyed by OS thread ID, so greenlets sharing a thread share its
+    shard and the number of shards stays bounded by the threads in use (a
+    dead thread's ID, and its shard, are reused by a later thread).
+    """
+
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        # OS thread ID -> values
+        self._shards = {}
+        self._shards_lock = threading.Lock()
+        with _registry_lock:
+            _registry.append(self)
+
+    def _shard(self):
+        ident = _get_ident()
+        shard = self._shards.get(ident)
+        if shard is None:
+            # Only taken once per thread
+            with self._shards_lock:
+                shard = self._shards.setdefault(ident, {})
+        return shard
+
+    def _snapshots(self):
+        with self._shards_lock:
+            shards = list(self._shards.values())
+        # dict() copies under the GIL, so a thread recording meanwhile can't break iteration
+        return [dict(shard) for shard in shards]
+
+    def _check_labels(self, labels):
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {labels}")
+        return labels
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount=1):
+        shard = self._shard()
+        labels = self._check_labels(labels)
+        shard[labels] = shard.get(labels, 0) + amount
+
+    def samples(self):
+        totals = {}
+        for shard in self._snapshots():
+            for labels, value in shard.items():
+                totals[labels] = totals.get(labels, 0) + value
+        return [(self.name, labels, (), value) for labels, value in sorted(totals.items())]
+
+
+class Gauge(Counter):
+    """A value that goes up and down, such as calls in flight."""
+
+    kind = "gauge"
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+    @contextmanager
+    def track(self, *labels):
+        """Count the ``with`` block as in progress."""
+        self.inc(*labels)
+        try:
+            yield
+        finally:
+            self.dec(*labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, *labels):
+        shard = self._shard()
+        labels = self._check_labels(labels)
+        counts = shard.get(labels)
+        if counts is None:
+            # One count per bucket, then the sum
+            counts = shard[labels] = [0] * len(self.buckets) + [0.0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+                break
+        counts[-1] += value
+
+    @contextmanager
+    def time(self, *labels):
+        """Observe how long the ``with`` block takes."""
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(time.monotonic() - started, *labels)
+
+    def samples(self):
+        totals = {}
+        for shard in self._snapshots():
+            for labels, counts in shard.items():
+                total = totals.setdefault(labels, [0] * len(counts))
+                for i, value in enumerate(counts):
+                    total[i] += value
+
+        samples = []
+        for labels, counts in sorted(totals.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                le = "+Inf" if bound == math.inf else repr(float(bound))
+                samples.append((f"{self.name}_bucket", labels, (("le", le),), cumulative))
+            samples.append((f"{self.name}_sum", labels, (), counts[-1]))
+            samples.append((f"{self.name}_count", labels, (), cumulative))
+        return samples
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_value(value):
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, float):
+        if math.isinf(value):
+            return "+Inf" if value > 0 else "-Inf"
+        return repr(value)
+    return str(value)
+
+
+def _format_sample(name, labelnames, labels, extra=()):
+    pairs = list(zip(labelnames, labels)) + list(extra)
+    if not pairs:
+        return name
+    return name + "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in pairs) + "}"
+
+
+def stats_samples(stats, prefix):
+    """Turn a /stats style dict into gauges.
+
+    Top-level sections become ``<prefix>_<section>_<field>``. Sections that
+    hold one dict per host or stage get the key as a ``name`` label. Fields
+    that aren't numbers are skipped.
+    """
+    gauges = {}
+    for section, values in stats.items():
+        if not isinstance(values, dict):
+            continue
+        if values and all(isinstance(value, dict) for value in values.values()):
+            rows = [((name,), fields) for name, fields in values.items()]
+            labelnames = ("name",)
+        else:
+            rows = [((), values)]
+            labelnames = ()
+        for labels, fields in rows:
+            for field, value in fields.items():
+                if isinstance(value, (int, float)):
+                    gauges.setdefault(f"{prefix}_{section}_{field}", (labelnames, []))[1].append((labels, value))
+    return gauges
+
+
+def render(stats=None, prefix="baybe"):
+    """Render every registered metric, plus ``stats`` as gauges, in the Prometheus text format."""
+    lines = []
+    with _registry_lock:
+        metrics = list(_registry)
+    for metric in metrics:
+        lines.append(f"# HELP {metric.name} {_escape(metric.documentation)}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for name, labels, extra, value in metric.samples():
+            lines.append(f"{_format_sample(name, metric.labelnames, labels, extra)} {_format_value(value)}")
+
+    for name, (labelnames, rows) in sorted(stats_samples(stats or {}, prefix).items()):
+        lines.append(f"# TYPE {name} gauge")
+        for labels, value in rows:
+            lines.append(f"{_format_sample(name, labelnames, labels)} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
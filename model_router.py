@@ -0,0 +1,172 @@
+"""Routing chat turns between GPT models.
+
+Models are listed from fastest to strongest in GPT_MODELS. Short, simple
+messages go to the first; longer or more involved ones go further down the
+list. Each model's recent latency and errors are tracked, and a model whose
+p95 goes over GPT_ROUTE_LATENCY_BUDGET or that keeps failing is skipped for
+a cooldown, with its traffic going to the healthy model nearest in strength.
+"""
+import os
+import re
+import time
+import math
+import logging
+import threading
+from collections import deque
+
+import metrics
+
+# Model routing configuration: fastest first, strongest last
+GPT_MODELS = [model.strip() for model in os.getenv("GPT_MODELS", "gpt-4").split(",") if model.strip()]
+# Messages up to this long, without signs of complexity, go to the fastest model
+GPT_ROUTE_SIMPLE_MAX_CHARS = int(os.getenv("GPT_ROUTE_SIMPLE_MAX_CHARS", "120"))
+# Messages longer than this go to the strongest model
+GPT_ROUTE_COMPLEX_MIN_CHARS = int(os.getenv("GPT_ROUTE_COMPLEX_MIN_CHARS", "600"))
+GPT_ROUTE_LATENCY_BUDGET = float(os.getenv("GPT_ROUTE_LATENCY_BUDGET", "10"))
+GPT_ROUTE_MAX_ERROR_RATE = float(os.getenv("GPT_ROUTE_MAX_ERROR_RATE", "0.5"))
+GPT_ROUTE_COOLDOWN = float(os.getenv("GPT_ROUTE_COOLDOWN", "30"))
+
+# Recent calls per model that latency and error rates are computed over
+WINDOW_SIZE = 200
+# Calls needed before a model's window is trusted
+MIN_SAMPLES = 5
+
+COMPLEX_PATTERN = re.compile(
+    r"\b(explain|why|how (?:do|does|can|would|to)|compare|difference|analy[sz]e|step[- ]by[- ]step|"
+    r"write|code|debug|calculate|summari[sz]e|translate|plan|pros and cons)\b|```|\d+\s*[-+*/^]\s*\d+",
+    re.IGNORECASE)
+
+gpt_model_latency = metrics.Histogram("baybe_gpt_model_seconds", "GPT call latency by model", ["model"])
+gpt_model_calls = metrics.Counter("baybe_gpt_model_calls_total", "GPT calls by model and result", ["model", "result"])
+gpt_routes = metrics.Counter("baybe_gpt_routes_total", "Model routing decisions by model and reason", ["model", "reason"])
+
+
+def complexity(user_text):
+    """0 for a short, simple message, 1 for an ordinary one, 2 for a long or involved one."""
+    length = len(user_text)
+    markers = len(COMPLEX_PATTERN.findall(user_text)) + max(0, user_text.count("?") - 1)
+    if length > GPT_ROUTE_COMPLEX_MIN_CHARS or markers >= 2:
+        return 2
+    if length > GPT_ROUTE_SIMPLE_MAX_CHARS or markers:
+        return 1
+    return 0
+
+
+class ModelHealth:
+    """Recent latencies and failures for one model."""
+
+    def __init__(self, model):
+        self.model = model
+        self.latencies = deque(maxlen=WINDOW_SIZE)
+        self.results = deque(maxlen=WINDOW_SIZE)
+        self.degraded_until = 0.0
+        self.degraded_reason = None
+
+    def percentile(self, p):
+        if len(self.latencies) < MIN_SAMPLES:
+            return None
+        values = sorted(self.latencies)
+        return values[max(1, math.ceil(p / 100 * len(values))) - 1]
+
+    def error_rate(self):
+        if len(self.results) < MIN_SAMPLES:
+            return 0.0
+        return self.results.count(False) / len(self.results)
+
+
+class ModelRouter:
+    """Picks a model per message and orders the fallbacks to try if it fails."""
+
+    def __init__(self, models=GPT_MODELS, latency_budget=GPT_ROUTE_LATENCY_BUDGET,
+                 max_error_rate=GPT_ROUTE_MAX_ERROR_RATE, cooldown=GPT_ROUTE_COOLDOWN):
+        if not models:
+            raise ValueError("At least one GPT model must be configured")
+        self.models = list(models)
+        self.latency_budget = latency_budget
+        self.max_error_rate = max_error_rate
+        self.cooldown = cooldown
+        self._health = {model: ModelHealth(model) for model in self.models}
+        self._lock = threading.Lock()
+
+    def route(self, user_text):
+        """Models to try for this message, in order: the chosen one, then fallbacks."""
+        level = complexity(user_text)
+        preferred = math.ceil(level * (len(self.models) - 1) / 2)
+        # Nearest in strength first, preferring stronger models on ties
+        order = sorted(range(len(self.models)), key=lambda i: (abs(i - preferred), -i))
+        now = time.monotonic()
+        with self._lock:
+            healthy = [i for i in order if self._health[self.models[i]].degraded_until <= now]
+        if not healthy:
+            # Everything is degraded; the preferred order is still the best guess
+            healthy = order
+        candidates = [self.models[i] for i in healthy] + [self.models[i] for i in order if i not in healthy]
+
+        if healthy[0] == preferred:
+            reason = ("simple", "standard", "complex")[level] if len(self.models) > 1 else "only"
+        else:
+            reason = f"fallback_{self._health[self.models[preferred]].degraded_reason or 'degraded'}"
+        gpt_routes.inc(candidates[0], reason)
+        return candidates
+
+    def record(self, model, seconds, ok):
+        """Record one call's outcome, degrading the model if it's too slow or failing."""
+        gpt_model_calls.inc(model, "ok" if ok else "error")
+        if ok:
+            gpt_model_latency.observe(seconds, model)
+        health = self._health.get(model)
+        if health is None:
+            return
+        with self._lock:
+            health.results.append(ok)
+            if ok:
+                health.latencies.append(seconds)
+            if len(self.models) == 1 or health.degraded_until > time.monotonic():
+                return
+            p95 = health.percentile(95)
+            if health.error_rate() > self.max_error_rate:
+                self._degrade(health, "errors")
+            elif p95 is not None and p95 > self.latency_budget:
+                self._degrade(health, "latency")
+
+    def faster(self, model):
+        """The nearest healthy model faster than ``model``, or ``model`` itself if there is none."""
+        if model not in self.models:
+            return model
+        now = time.monotonic()
+        with self._lock:
+            for candidate in reversed(self.models[:self.models.index(model)]):
+                if self._health[candidate].degraded_until <= now:
+                    return candidate
+        return model
+
+    def percentile(self, model, p):
+        """Recent latency percentile for ``model``, or None until enough calls have been seen."""
+        health = self._health.get(model)
+        if health is None:
+            return None
+        with self._lock:
+            return health.percentile(p)
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            return {
+                model: {
+                    "calls": len(health.results),
+                    "p50_seconds": round(health.percentile(50) or 0.0, 3),
+                    "p95_seconds": round(health.percentile(95) or 0.0, 3),
+                    "error_rate": round(health.error_rate(), 4),
+                    "degraded": health.degraded_until > now
+                }
+                for model, health in self._health.items()
+            }
+
+    def _degrade(self, health, reason):
+        logging.warning(f"Routing around {health.model} for {self.cooldown}s: {reason} "
+                        f"(p95 {health.percentile(95)}s, error rate {health.error_rate():.0%})")
+        # Start afresh after the cooldown, so old slow samples don't degrade it again straight away
+        health.degraded_until = time.monotonic() + self.cooldown
+        health.degraded_reason = reason
+        health.latencies.clear()
+        health.results.clear()
@@ -0,0 +1,197 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from concurrent.futures import Future
+
+# Render deduplication configuration
+RENDER_REGISTRY_PATH = os.getenv("RENDER_REGISTRY_PATH", "cache/renders.sqlite3")
+# HeyGen video URLs are signed and expire, so finished videos are only reused for a while
+RENDER_REUSE_TTL = float(os.getenv("RENDER_REUSE_TTL", "86400"))
+# A render nobody has heard back about in this long is submitted again
+RENDER_STALE_SECONDS = float(os.getenv("RENDER_STALE_SECONDS", "900"))
+# How long another worker may take to submit a render before we take over its claim
+RENDER_CLAIM_TIMEOUT = float(os.getenv("RENDER_CLAIM_TIMEOUT", "30"))
+RENDER_CLAIM_POLL_SECONDS = 0.25
+
+# Render states
+STATE_SUBMITTING = "submitting"
+STATE_RENDERING = "rendering"
+STATE_COMPLETED = "completed"
+
+
+def render_key(avatar_id, voice_id, text, dimension):
+    """Identify a render by everything that changes the resulting video."""
+    material = json.dumps([avatar_id, voice_id, text, dimension], sort_keys=True)
+    return hashlib.sha256(material.encode()).hexdigest()
+
+
+class RenderRegistry:
+    """Single-flight HeyGen renders, shared across threads and worker processes.
+
+    Identical renders are coalesced in two layers: threads in this process
+    share a Future, and processes share a SQLite table where the first one
+    to insert a row for a key owns the submission. The table also maps
+    video IDs to finished URLs so identical text later reuses the video.
+    """
+
+    def __init__(self, path=RENDER_REGISTRY_PATH):
+        self._db = self._open_db(path)
+        self._db_lock = threading.Lock()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.coalesced = 0
+        self.reused = 0
+
+    def _open_db(self, path):
+        try:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # Autocommit, so every statement is its own transaction across workers
+            db = sqlite3.connect(path, check_same_thread=False, timeout=5, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("""CREATE TABLE IF NOT EXISTS renders (
+                key TEXT PRIMARY KEY,
+                state TEXT NOT NULL,
+                video_id TEXT,
+                video_url TEXT,
+                updated_at REAL NOT NULL
+            )""")
+            db.execute("CREATE INDEX IF NOT EXISTS renders_video_id ON renders (video_id)")
+            return db
+        except (OSError, sqlite3.Error) as e:
+            logging.error(f"Render registry disabled, renders are only deduplicated within this process: {str(e)}")
+            return None
+
+    def submit(self, key, create_render):
+        """Return HeyGen's generate response for ``key``, submitting at most one render.
+
+        ``create_render()`` performs the actual submission and returns the
+        HeyGen response dict (``{"data": {"video_id": ...}}`` or ``{"error": ...}``).
+        """
+        with self._lock:
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = self._in_flight[key] = Future()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            return future.result()
+
+        try:
+            try:
+                response = self._submit_shared(key, create_render) if self._db else create_render()
+            except sqlite3.Error as e:
+                logging.error(f"Render registry unavailable, submitting without dedup: {str(e)}")
+                response = create_render()
+            future.set_result(response)
+            return response
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+
+    def finished_url(self, video_id):
+        """Return the URL of a finished video we already know about, or None."""
+        try:
+            row = self._fetchone(
+                "SELECT video_url FROM renders WHERE video_id = ? AND state = ? AND updated_at >= ?",
+                (video_id, STATE_COMPLETED, time.time() - RENDER_REUSE_TTL)
+            )
+        except sqlite3.Error as e:
+            logging.error(f"Render registry read failed: {str(e)}")
+            return None
+        return row[0] if row else None
+
+    def mark_completed(self, video_id, video_url):
+        try:
+            self._execute("UPDATE renders SET state = ?, video_url = ?, updated_at = ? WHERE video_id = ?",
+                          (STATE_COMPLETED, video_url, time.time(), video_id))
+        except sqlite3.Error as e:
+            logging.error(f"Render registry write failed: {str(e)}")
+
+    def mark_failed(self, video_id):
+        """Forget a failed render so the next identical request submits a fresh one."""
+        try:
+            self._execute("DELETE FROM renders WHERE video_id = ?", (video_id,))
+        except sqlite3.Error as e:
+            logging.error(f"Render registry write failed: {str(e)}")
+
+    def stats(self):
+        with self._lock:
+            return {
+                "submitted": self.submitted,
+                "coalesced": self.coalesced,
+                "reused": self.reused,
+                "in_flight": len(self._in_flight)
+            }
+
+    def _submit_shared(self, key, create_render):
+        while True:
+            now = time.time()
+            claimed = self._execute(
+                "INSERT OR IGNORE INTO renders (key, state, updated_at) VALUES (?, ?, ?)",
+                (key, STATE_SUBMITTING, now)
+            ) == 1
+
+            if not claimed:
+                row = self._fetchone("SELECT state, video_id, updated_at FROM renders WHERE key = ?", (key,))
+                if row is None:
+                    continue
+                state, video_id, updated_at = row
+                age = now - updated_at
+                if (state == STATE_COMPLETED and age <= RENDER_REUSE_TTL) or \
+                        (state == STATE_RENDERING and age <= RENDER_STALE_SECONDS):
+                    with self._lock:
+                        self.reused += 1
+                    logging.info(f"Reusing HeyGen video {video_id} for identical text")
+                    return {"data": {"video_id": video_id}}
+                if state == STATE_SUBMITTING and age <= RENDER_CLAIM_TIMEOUT:
+                    # Another worker is submitting this render right now
+                    time.sleep(RENDER_CLAIM_POLL_SECONDS)
+                    continue
+                # Expired, stale or abandoned: take the claim over, unless someone beat us to it
+                claimed = self._execute(
+                    "UPDATE renders SET state = ?, video_id = NULL, video_url = NULL, updated_at = ? "
+                    "WHERE key = ? AND updated_at = ?",
+                    (STATE_SUBMITTING, now, key, updated_at)
+                ) == 1
+                if not claimed:
+                    continue
+
+            try:
+                response = create_render()
+            except BaseException:
+                self._execute("DELETE FROM renders WHERE key = ?", (key,))
+                raise
+            if "error" in response:
+                self._execute("DELETE FROM renders WHERE key = ?", (key,))
+                return response
+
+            with self._lock:
+                self.submitted += 1
+            self._execute("UPDATE renders SET state = ?, video_id = ?, updated_at = ? WHERE key = ?",
+                          (STATE_RENDERING, response['data']['video_id'], time.time(), key))
+            return response
+
+    def _execute(self, sql, params):
+        """Run a write and return the number of affected rows."""
+        if self._db is None:
+            return 0
+        with self._db_lock:
+            return self._db.execute(sql, params).rowcount
+
+    def _fetchone(self, sql, params):
+        if self._db is None:
+            return None
+        with self._db_lock:
+            return self._db.execute(sql, params).fetchone()
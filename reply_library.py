@@ -0,0 +1,85 @@
+import os
+import json
+import time
+import logging
+import threading
+
+from response_cache import normalize_message
+
+# Pre-rendered reply library built by tools/build_reply_library.py
+REPLY_LIBRARY_PATH = os.getenv("REPLY_LIBRARY_PATH", "cache/reply_library.json")
+# HeyGen video URLs are signed and expire after about a week
+REPLY_LIBRARY_MAX_AGE = float(os.getenv("REPLY_LIBRARY_MAX_AGE", str(6 * 86400)))
+
+MANIFEST_VERSION = 1
+
+
+def load_manifest(path):
+    """Read a library manifest, returning an empty one if the file doesn't exist."""
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return {"version": MANIFEST_VERSION, "context": None, "entries": {}}
+    if manifest.get("version") != MANIFEST_VERSION:
+        raise ValueError(f"Unsupported reply library version: {manifest.get('version')}")
+    return manifest
+
+
+def save_manifest(path, manifest):
+    """Write a manifest atomically so a crash never leaves a half-written file."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def is_fresh(entry, now=None):
+    """Whether a library entry has a finished video that hasn't expired yet."""
+    now = now or time.time()
+    return bool(entry.get("video_url")) and now - entry.get("rendered_at", 0) <= REPLY_LIBRARY_MAX_AGE
+
+
+class ReplyLibrary:
+    """Read-only lookup of pre-rendered replies, loaded once at startup."""
+
+    def __init__(self, path=REPLY_LIBRARY_PATH, context=None):
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        try:
+            manifest = load_manifest(path)
+        except (OSError, ValueError) as e:
+            logging.error(f"Reply library not loaded: {str(e)}")
+            return
+        if manifest["entries"] and context and manifest.get("context") != context:
+            logging.warning("Reply library was built for a different prompt, avatar or voice; ignoring it")
+            return
+
+        now = time.time()
+        self._entries = {key: entry for key, entry in manifest["entries"].items() if is_fresh(entry, now)}
+        stale = len(manifest["entries"]) - len(self._entries)
+        logging.info(f"Reply library loaded with {len(self._entries)} entries ({stale} missing or expired)")
+
+    def get(self, message):
+        """Return the library entry for a message, or None."""
+        entry = self._entries.get(normalize_message(message))
+        with self._lock:
+            if entry is None or not is_fresh(entry):
+                self.misses += 1
+                return None
+            self.hits += 1
+        return entry
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses
+            }
@@ -0,0 +1,157 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+# Response cache configuration
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "1000"))
+# HeyGen video URLs are signed and expire, so don't keep them for too long
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "86400"))
+RESPONSE_CACHE_PATH = os.getenv("RESPONSE_CACHE_PATH", "cache/responses.sqlite3")
+RESPONSE_CACHE_DISK_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_DISK_MAX_ENTRIES", "100000"))
+
+
+def normalize_message(text):
+    """Normalize a user message so trivial differences share a cache entry."""
+    text = " ".join(text.lower().split())
+    return text.rstrip("!?.,;: ")
+
+
+def cache_key(message, system_prompt, avatar_id, voice_id):
+    """Build a cache key from everything that shapes the reply and the video."""
+    prompt_hash = hashlib.sha256(system_prompt.encode()).hexdigest()
+    material = json.dumps([normalize_message(message), prompt_hash, avatar_id, voice_id])
+    return hashlib.sha256(material.encode()).hexdigest()
+
+
+class ResponseCache:
+    """Two-tier cache of finished turns: GPT reply text and video URL.
+
+    The memory tier is a bounded LRU; the optional SQLite tier survives
+    restarts and is shared by every worker pointing at the same file.
+    """
+
+    def __init__(self, max_entries=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL,
+                 path=RESPONSE_CACHE_PATH, disk_max_entries=RESPONSE_CACHE_DISK_MAX_ENTRIES):
+        self._entries = OrderedDict()
+        self._max_entries = max_entries
+        self._ttl = ttl
+        self._disk_max_entries = disk_max_entries
+        self._lock = threading.Lock()
+        self._db = self._open_db(path) if path else None
+        self._db_lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _open_db(self, path):
+        try:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            db = sqlite3.connect(path, check_same_thread=False, timeout=5)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("""CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                reply TEXT NOT NULL,
+                video_url TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )""")
+            db.execute("CREATE INDEX IF NOT EXISTS responses_created_at ON responses (created_at)")
+            db.commit()
+            return db
+        except sqlite3.Error as e:
+            logging.error(f"Response cache disk tier disabled: {str(e)}")
+            return None
+
+    def get(self, key):
+        """Return ``{"reply", "video_url"}`` for a cached turn, or None."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if now - entry["created_at"] <= self._ttl:
+                    self._entries.move_to_end(key)
+                    self.memory_hits += 1
+                    return entry
+                del self._entries[key]
+                self.expirations += 1
+
+        entry = self._disk_get(key, now)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._remember(key, entry)
+        return entry
+
+    def put(self, key, reply, video_url):
+        entry = {"reply": reply, "video_url": video_url, "created_at": time.time()}
+        with self._lock:
+            self._remember(key, entry)
+        self._disk_put(key, entry)
+
+    def stats(self):
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self._max_entries,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "disk": self._db is not None
+            }
+
+    def _remember(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _disk_get(self, key, now):
+        if self._db is None:
+            return None
+        try:
+            with self._db_lock:
+                row = self._db.execute(
+                    "SELECT reply, video_url, created_at FROM responses WHERE key = ? AND created_at >= ?",
+                    (key, now - self._ttl)
+                ).fetchone()
+        except sqlite3.Error as e:
+            logging.error(f"Response cache read failed: {str(e)}")
+            return None
+        if row is None:
+            return None
+        return {"reply": row[0], "video_url": row[1], "created_at": row[2]}
+
+    def _disk_put(self, key, entry):
+        if self._db is None:
+            return
+        try:
+            with self._db_lock:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses (key, reply, video_url, created_at) VALUES (?, ?, ?, ?)",
+                    (key, entry["reply"], entry["video_url"], entry["created_at"])
+                )
+                # Keep the disk tier bounded: drop expired rows, then the oldest over the cap
+                self._db.execute("DELETE FROM responses WHERE created_at < ?", (entry["created_at"] - self._ttl,))
+                self._db.execute(
+                    "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+                    (self._disk_max_entries,)
+                )
+                self._db.commit()
+        except sqlite3.Error as e:
+            logging.error(f"Response cache write failed: {str(e)}")
@@ -0,0 +1,274 @@
+"""Semantic response cache for near-duplicate questions.
+
+Messages are embedded with a small sentence-embedding model on CPU and looked
+up in a fixed-size vector index by cosine similarity, so "how r u" can reuse
+the reply and video generated for "how are you doing?".
+
+numpy, torch and transformers are optional dependencies; the cache is only
+built when SEMANTIC_CACHE_ENABLED is set.
+"""
+import os
+import json
+import time
+import fcntl
+import hashlib
+import logging
+import threading
+from concurrent.futures import Future
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Semantic cache configuration
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "").lower() in ("1", "true", "yes")
+SEMANTIC_CACHE_MODEL = os.getenv("SEMANTIC_CACHE_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "5000"))
+SEMANTIC_CACHE_TTL = float(os.getenv("SEMANTIC_CACHE_TTL", "86400"))
+SEMANTIC_CACHE_PATH = os.getenv("SEMANTIC_CACHE_PATH", "cache/semantic")
+SEMANTIC_CACHE_SAVE_EVERY = int(os.getenv("SEMANTIC_CACHE_SAVE_EVERY", "20"))
+
+# Embedding batches: wait up to this long to group concurrent messages into one forward pass
+EMBED_BATCH_WINDOW_SECONDS = float(os.getenv("EMBED_BATCH_WINDOW_MS", "5")) / 1000
+EMBED_MAX_BATCH_SIZE = int(os.getenv("EMBED_MAX_BATCH_SIZE", "32"))
+
+
+def vector_hash(vector):
+    return hashlib.blake2b(np.ascontiguousarray(vector, dtype=np.float32).tobytes(), digest_size=8).hexdigest()
+
+
+class SentenceEmbedder:
+    """Mean-pooled, L2-normalized sentence embeddings from a transformers model."""
+
+    def __init__(self, model_name=SEMANTIC_CACHE_MODEL):
+        import torch
+        from transformers import AutoTokenizer, AutoModel
+
+        self._torch = torch
+        self._tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self._model = AutoModel.from_pretrained(model_name)
+        self._model.eval()
+        self.dimension = self._model.config.hidden_size
+
+    def __call__(self, texts):
+        """Embed a list of texts into a (len(texts), dimension) float32 array."""
+        encoded = self._tokenizer(texts, padding=True, truncation=True, max_length=128, return_tensors="pt")
+        with self._torch.no_grad():
+            hidden = self._model(**encoded).last_hidden_state
+        mask = encoded["attention_mask"].unsqueeze(-1).to(hidden.dtype)
+        pooled = (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1e-9)
+        vectors = pooled.numpy().astype(np.float32)
+        return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+
+class EmbeddingBatcher:
+    """Groups concurrent embedding requests into one model call."""
+
+    def __init__(self, embed, window=EMBED_BATCH_WINDOW_SECONDS, max_batch_size=EMBED_MAX_BATCH_SIZE):
+        self._embed = embed
+        self._window = window
+        self._max_batch_size = max_batch_size
+        self._pending = []
+        self._condition = threading.Condition()
+        self.batches = 0
+        self.texts = 0
+        threading.Thread(target=self._run, name="embed-batcher", daemon=True).start()
+
+    def embed(self, text):
+        """Embed one text; blocks until its batch has been run."""
+        future = Future()
+        with self._condition:
+            self._pending.append((text, future))
+            self._condition.notify()
+        return future.result()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._pending:
+                    self._condition.wait()
+            # Give concurrent requests a moment to join the batch
+            time.sleep(self._window)
+            with self._condition:
+                batch = self._pending[:self._max_batch_size]
+                self._pending = self._pending[self._max_batch_size:]
+            try:
+                vectors = self._embed([text for text, _ in batch])
+                self.batches += 1
+                self.texts += len(batch)
+                for (_, future), vector in zip(batch, vectors):
+                    future.set_result(vector)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+
+
+class SemanticCache:
+    """Fixed-capacity cosine-similarity index over past messages.
+
+    Vectors live in a memory-mapped ``.npy`` file (``vectors.npy``) and the
+    replies they map to in ``entries.json`` next to it. When the index is
+    full the least recently used entry is overwritten. ``context`` identifies
+    the prompt, avatar and voice; a persisted index built for a different
+    context is discarded on load.
+
+    Vectors reach the file as soon as they are stored, but entries only every
+    SEMANTIC_CACHE_SAVE_EVERY puts, so each entry records a hash of its
+    vector and slots whose vector has changed since are dropped on load.
+    Only one process writes the files, the one holding ``writer.lock``;
+    other workers load a private copy and keep their additions in memory.
+    """
+
+    def __init__(self, context, embed=None, threshold=SEMANTIC_CACHE_THRESHOLD,
+                 capacity=SEMANTIC_CACHE_SIZE, ttl=SEMANTIC_CACHE_TTL, path=SEMANTIC_CACHE_PATH):
+        if np is None:
+            raise ImportError("The semantic cache needs numpy")
+        embed = embed or SentenceEmbedder()
+        self._batcher = EmbeddingBatcher(embed)
+        self._dimension = getattr(embed, "dimension", None) or len(embed(["probe"])[0])
+        self._context = context
+        self._threshold = threshold
+        self._capacity = capacity
+        self._ttl = ttl
+        self._path = path
+        self._lock = threading.Lock()
+        self._unsaved = 0
+        self._writer_lock = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        try:
+            self._open()
+        except BaseException:
+            # Let another worker become the writer
+            if self._writer_lock is not None:
+                self._writer_lock.close()
+            raise
+
+    def _open(self):
+        vectors_path = os.path.join(self._path, "vectors.npy")
+        entries_path = os.path.join(self._path, "entries.json")
+        os.makedirs(self._path, exist_ok=True)
+        writer = self._claim_writer()
+
+        entries = None
+        try:
+            with open(entries_path) as f:
+                saved = json.load(f)
+            if saved.get("context") == self._context and saved.get("dimension") == self._dimension:
+                entries = saved["entries"]
+        except (OSError, ValueError):
+            pass
+
+        shape = (self._capacity, self._dimension)
+        vectors = None
+        if entries is not None and os.path.exists(vectors_path):
+            try:
+                vectors = np.load(vectors_path, mmap_mode="r+" if writer else "r")
+            except (OSError, ValueError):
+                vectors = None
+            if vectors is not None and vectors.shape != shape:
+                vectors = None
+        if vectors is None:
+            entries = []
+            if writer:
+                vectors = np.lib.format.open_memmap(vectors_path, mode="w+", dtype=np.float32, shape=shape)
+        if not writer:
+            # A private copy: only the writer's entries.json describes the file
+            vectors = np.array(vectors) if vectors is not None else np.zeros(shape, dtype=np.float32)
+
+        self._vectors = vectors
+        # One slot per row; None marks an empty row, or one whose vector was replaced after the last save
+        self._entries = (entries + [None] * self._capacity)[:self._capacity]
+        for slot, entry in enumerate(self._entries):
+            if entry is not None and entry.get("vector_hash") != vector_hash(vectors[slot]):
+                self._entries[slot] = None
+        self._valid = np.array([entry is not None for entry in self._entries], dtype=bool)
+        self._created_at = np.array([entry["created_at"] if entry else 0.0 for entry in self._entries])
+        self._last_used = np.array([entry["last_used"] if entry else 0.0 for entry in self._entries])
+        logging.info(f"Semantic cache loaded with {int(self._valid.sum())} entries"
+                     f"{'' if writer else ', kept in memory (another worker writes the index)'}")
+
+    def _claim_writer(self):
+        """Whether this process may write the files: the first to lock ``writer.lock`` keeps it for life."""
+        lock_file = open(os.path.join(self._path, "writer.lock"), "w")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._writer_lock = lock_file
+        return True
+
+    def get(self, message):
+        """Return ``{"reply", "video_url", "message", "similarity"}`` for a close enough past message, or None."""
+        vector = self._batcher.embed(message)
+        now = time.time()
+        with self._lock:
+            # Vectors are normalized, so the dot product is the cosine similarity
+            scores = self._vectors @ vector
+            scores[~self._valid | (self._created_at < now - self._ttl)] = -1.0
+            best = int(np.argmax(scores))
+            similarity = float(scores[best])
+            entry = self._entries[best]
+            if similarity < self._threshold or entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._last_used[best] = now
+            entry["last_used"] = now
+            return {**entry, "similarity": round(similarity, 4)}
+
+    def put(self, message, reply, video_url):
+        vector = self._batcher.embed(message)
+        now = time.time()
+        with self._lock:
+            if self._valid.all():
+                # Overwrite the least recently used entry
+                slot = int(np.argmin(self._last_used))
+                self.evictions += 1
+            else:
+                slot = int(np.argmin(self._valid))
+            self._vectors[slot] = vector
+            self._entries[slot] = {"message": message, "reply": reply, "video_url": video_url,
+                                   "created_at": now, "last_used": now,
+                                   "vector_hash": vector_hash(self._vectors[slot])}
+            self._valid[slot] = True
+            self._created_at[slot] = now
+            self._last_used[slot] = now
+            self._unsaved += 1
+            if self._unsaved >= SEMANTIC_CACHE_SAVE_EVERY:
+                self._save()
+
+    def save(self):
+        with self._lock:
+            self._save()
+
+    def _save(self):
+        if self._writer_lock is None:
+            return
+        self._vectors.flush()
+        entries_path = os.path.join(self._path, "entries.json")
+        tmp_path = f"{entries_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"context": self._context, "dimension": self._dimension, "entries": self._entries}, f)
+        os.replace(tmp_path, entries_path)
+        self._unsaved = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": int(self._valid.sum()),
+                "capacity": self._capacity,
+                "threshold": self._threshold,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "writer": self._writer_lock is not None,
+                "embedding_batches": self._batcher.batches,
+                "avg_batch_size": round(self._batcher.texts / self._batcher.batches, 2) if self._batcher.batches else 0.0
+            }
@@ -0,0 +1,88 @@
+"""Streamed ElevenLabs speech for voice-only turns.
+
+The GPT reply is cut into sentence-sized pieces as its tokens arrive, and
+each piece is sent to ElevenLabs' streaming text-to-speech endpoint as soon
+as it is complete, so the first audio reaches the client while the rest of
+the reply is still being written. The first piece is sent at the first
+sentence end; later ones are at least SPEECH_MIN_CHARS long, which keeps
+the number of synthesis requests (and the seams between them) down.
+
+Pieces that were spoken before are streamed from the audio store instead.
+Requests go through the shared keep-alive pool in http_client (or the
+ASGI app's client), rather than the pinned elevenlabs package, which opens
+a new connection for every call.
+"""
+import os
+import re
+
+from audio_store import audio_key, EXTENSIONS
+
+# ElevenLabs configuration
+ELEVENLABS_API_KEY = os.getenv("ELEVENLABS_API_KEY")
+ELEVENLABS_API_BASE = os.getenv("ELEVENLABS_API_BASE", "https://api.elevenlabs.io").rstrip("/")
+ELEVENLABS_VOICE_ID = os.getenv("ELEVENLABS_VOICE_ID", "21m00Tcm4TlvDq8ikWAM")
+ELEVENLABS_MODEL = os.getenv("ELEVENLABS_MODEL", "eleven_turbo_v2")
+# Smaller formats such as mp3_22050_32 suit low-bandwidth clients
+ELEVENLABS_OUTPUT_FORMAT = os.getenv("ELEVENLABS_OUTPUT_FORMAT", "mp3_44100_64")
+# 0 (best quality) to 4 (lowest latency)
+ELEVENLABS_STREAMING_LATENCY = int(os.getenv("ELEVENLABS_STREAMING_LATENCY", "3"))
+SPEECH_MIN_CHARS = int(os.getenv("SPEECH_MIN_CHARS", "80"))
+
+AUDIO_CHUNK_BYTES = 4096
+
+# A sentence ends at punctuation followed by whitespace (so "3.5" doesn't split), or at a line break
+SENTENCE_END = re.compile(r"[.!?…]+[\"')\]]*\s+|\n+")
+
+CONTENT_TYPES = {"mp3": "audio/mpeg", "pcm": "audio/pcm", "ulaw": "audio/basic"}
+
+
+def content_type(output_format=ELEVENLABS_OUTPUT_FORMAT):
+    return CONTENT_TYPES.get(output_format.split("_")[0], "application/octet-stream")
+
+
+def speech_key(text):
+    """The audio store key of ``text`` in the configured voice, or None if the format can't be stored."""
+    if content_type() not in EXTENSIONS:
+        return None
+    return audio_key(ELEVENLABS_VOICE_ID, text, ELEVENLABS_MODEL, ELEVENLABS_OUTPUT_FORMAT)
+
+
+def speech_request(text):
+    """URL, headers and JSON body for streaming ``text`` as speech."""
+    url = (f"{ELEVENLABS_API_BASE}/v1/text-to-speech/{ELEVENLABS_VOICE_ID}/stream"
+           f"?optimize_streaming_latency={ELEVENLABS_STREAMING_LATENCY}&output_format={ELEVENLABS_OUTPUT_FORMAT}")
+    headers = {
+        "xi-api-key": ELEVENLABS_API_KEY,
+        "Content-Type": "application/json",
+        "accept": content_type()
+    }
+    return url, headers, {"text": text, "model_id": ELEVENLABS_MODEL}
+
+
+class SpeechSplitter:
+    """Regroups streamed text fragments into pieces to synthesize, ending at sentence boundaries."""
+
+    def __init__(self, min_chars=SPEECH_MIN_CHARS):
+        self.min_chars = min_chars
+        self._buffer = ""
+        self._first = True
+
+    def feed(self, fragment):
+        """Add a fragment; returns the pieces it completed."""
+        self._buffer += fragment
+        pieces = []
+        while True:
+            # The first piece goes out at the first sentence end, to start the audio early
+            match = SENTENCE_END.search(self._buffer, 0 if self._first else self.min_chars)
+            if match is None:
+                return pieces
+            piece, self._buffer = self._buffer[:match.end()].strip(), self._buffer[match.end():]
+            if piece:
+                self._first = False
+                pieces.append(piece)
+
+    def flush(self):
+        """The rest of the text, once the reply is complete."""
+        piece, self._buffer = self._buffer.strip(), ""
+        return [piece] if piece else []
+
@@ -0,0 +1,260 @@
+import os
+import re
+import sys
+import json
+import time
+import queue
+import atexit
+import random
+import logging
+import threading
+import contextvars
+from logging.handlers import QueueHandler, QueueListener
+
+import tracing
+
+# Logging configuration
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_MAX_FIELD_CHARS = int(os.getenv("LOG_MAX_FIELD_CHARS", "2000"))
+# Share of records kept per category, e.g. "heygen.status=0.1,chat.request=0.5"
+LOG_SAMPLE_RATES = os.getenv("LOG_SAMPLE_RATES", "heygen.status=0.1")
+# How long per-request debug logging stays on once enabled
+LOG_DEBUG_TTL = float(os.getenv("LOG_DEBUG_TTL", "600"))
+
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+REDACTED = "[REDACTED]"
+# Field names whose values are never logged
+SENSITIVE_KEY = re.compile(r"api[-_]?key|authorization|secret|token|password|signature|cookie", re.IGNORECASE)
+# Credentials that end up inside free text
+SENSITIVE_TEXT = (
+    (re.compile(r"(?i)(bearer\s+)[\w.~+/=-]+"), r"\1" + REDACTED),
+    (re.compile(r"sk-[\w-]{8,}"), REDACTED),
+    (re.compile(r"(?i)((?:api[-_]?key|secret|token|password)['\"]?\s*[:=]\s*['\"]?)[^'\"\s,}]+"), r"\1" + REDACTED)
+)
+
+# Attributes every LogRecord has; anything else came in through ``extra``
+STANDARD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+# Request IDs clients may pass in X-Request-ID; session IDs follow the same rules
+REQUEST_ID_PATTERN = re.compile(r"^[A-Za-z0-9._-]{1,128}$")
+
+_request_id = contextvars.ContextVar("request_id", default=None)
+_debug_requests = {}
+_debug_lock = threading.Lock()
+
+
+def parse_sample_rates(value):
+    rates = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        category, _, rate = item.partition("=")
+        rates[category.strip()] = float(rate)
+    return rates
+
+
+def set_request_id(request_id):
+    """Tag records logged from this thread or task with ``request_id``; returns a reset token."""
+    return _request_id.set(request_id)
+
+
+def reset_request_id(token):
+    _request_id.reset(token)
+
+
+def current_request_id():
+    return _request_id.get()
+
+
+def enable_debug(request_id, ttl=LOG_DEBUG_TTL):
+    """Log DEBUG records for one request ID for the next ``ttl`` seconds."""
+    with _debug_lock:
+        _debug_requests[request_id] = time.monotonic() + ttl
+        logging.getLogger().setLevel(logging.DEBUG)
+
+
+def disable_debug(request_id):
+    with _debug_lock:
+        _debug_requests.pop(request_id, None)
+        _restore_level()
+
+
+def debug_enabled(request_id=None):
+    """Whether DEBUG records are wanted for ``request_id`` (default: the current request)."""
+    if not _debug_requests:
+        return False
+    request_id = request_id or _request_id.get()
+    with _debug_lock:
+        expires = _debug_requests.get(request_id)
+        if expires is not None and expires < time.monotonic():
+            del _debug_requests[request_id]
+            _restore_level()
+            return False
+        return expires is not None
+
+
+def _restore_level():
+    now = time.monotonic()
+    for request_id in [r for r, expires in _debug_requests.items() if expires < now]:
+        del _debug_requests[request_id]
+    if not _debug_requests:
+        logging.getLogger().setLevel(LOG_LEVEL)
+
+
+def truncate(text, limit=LOG_MAX_FIELD_CHARS):
+    if len(text) <= limit:
+        return text
+    return f"{text[:limit]}...[truncated {len(text) - limit} chars]"
+
+
+def scrub(text):
+    """Mask credentials in free text and cap its length."""
+    for pattern, replacement in SENSITIVE_TEXT:
+        text = pattern.sub(replacement, text)
+    return truncate(text)
+
+
+def redact(value, key=None):
+    """Copy a logged value with sensitive fields masked and long strings truncated."""
+    if key is not None and SENSITIVE_KEY.search(str(key)):
+        return REDACTED
+    if isinstance(value, dict):
+        return {k: redact(v, k) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [redact(v) for v in value]
+    if isinstance(value, (int, float, bool)) or value is None:
+        return value
+    return scrub(str(value))
+
+
+class ContextFilter(logging.Filter):
+    """Tags records with the request and trace IDs, then samples them.
+
+    Runs in the thread that logs, before the record is queued. DEBUG records
+    only pass for requests with debug enabled (or with LOG_LEVEL=DEBUG).
+    Warnings and errors are always kept; other records are sampled by their
+    ``category``.
+    """
+
+    def __init__(self, sample_rates):
+        super().__init__()
+        self.sample_rates = sample_rates
+        self.sampled_out = {}
+
+    def filter(self, record):
+        record.request_id = getattr(record, "request_id", None) or _request_id.get()
+        span = tracing.current_span()
+        record.trace_id = span.trace_id if span is not None else None
+
+        if record.levelno < logging.INFO:
+            return LOG_LEVEL == "DEBUG" or debug_enabled(record.request_id)
+        if record.levelno >= logging.WARNING:
+            return True
+        category = getattr(record, "category", None)
+        rate = self.sample_rates.get(category)
+        if rate is None or random.random() < rate:
+            return True
+        self.sampled_out[category] = self.sampled_out.get(category, 0) + 1
+        return False
+
+
+class DroppingQueueHandler(QueueHandler):
+    """Hands records to the writer thread, dropping them rather than blocking when it falls behind."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._exception_formatter = logging.Formatter()
+
+    def prepare(self, record):
+        # Render the message now, since its arguments may change once we return,
+        # but leave the extra fields for the formatter on the writer thread
+        record.message = record.getMessage()
+        if record.exc_info:
+            record.exc_text = self._exception_formatter.formatException(record.exc_info)
+        record.msg = record.message
+        record.args = None
+        record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, message, request and trace IDs and any extra fields."""
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": scrub(record.getMessage()),
+            "request_id": getattr(record, "request_id", None),
+            "trace_id": getattr(record, "trace_id", None)
+        }
+        for key, value in vars(record).items():
+            if key not in STANDARD_ATTRIBUTES and key not in entry:
+                entry[key] = redact(value, key)
+        if record.exc_text:
+            entry["exception"] = scrub(record.exc_text)
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """The classic one-line format, with the same redaction and extra fields appended as JSON."""
+
+    def __init__(self):
+        super().__init__(TEXT_FORMAT)
+
+    def format(self, record):
+        line = scrub(super().format(record))
+        extra = {key: redact(value, key) for key, value in vars(record).items()
+                 if key not in STANDARD_ATTRIBUTES and value is not None}
+        extra.pop("trace_id", None)
+        if extra:
+            line += " " + json.dumps(extra, default=str)
+        return line
+
+
+_handler = None
+_context_filter = None
+
+
+def configure():
+    """Route the root logger through a bounded queue to a writer thread emitting JSON (or text) lines."""
+    global _handler, _context_filter
+    if _handler is not None:
+        return
+
+    output = logging.StreamHandler(sys.stderr)
+    output.setFormatter(TextFormatter() if LOG_FORMAT == "text" else JsonFormatter())
+
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    _handler = DroppingQueueHandler(log_queue)
+    _context_filter = ContextFilter(parse_sample_rates(LOG_SAMPLE_RATES))
+    _handler.addFilter(_context_filter)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_handler)
+    root.setLevel(LOG_LEVEL)
+
+    listener = QueueListener(log_queue, output)
+    listener.start()
+    # Flush what's queued on exit
+    atexit.register(listener.stop)
+
+
+def stats():
+    if _handler is None:
+        return None
+    return {
+        "queued": _handler.queue.qsize(),
+        "dropped": _handler.dropped,
+        "sampled_out": dict(_context_filter.sampled_out),
+        "debug_requests": len(_debug_requests)
+    }
@@ -0,0 +1,545 @@
+"""End-to-end load benchmark for /chat against local OpenAI and HeyGen stand-ins.
+
+Starts tools/fake_openai.py, tools/fake_heygen.py and the app (gunicorn with
+gunicorn.conf.py, or `python app.py` with --server flask), drives /chat and
+writes latency percentiles, throughput, error rate and thread/connection
+usage to a JSON file, so runs on different commits can be compared:
+
+    python tools/benchmark.py --requests 200 --concurrency 20
+    python tools/benchmark.py --rate 5 --duration 120 --arrival poisson \\
+        --openai-latency lognormal:1.5,0.4 --render-seconds normal:20,5
+    python tools/benchmark.py --env GUNICORN_WORKER_CLASS=gevent --baseline cache/benchmarks/<earlier>.json
+
+Latencies take the distributions in tools/latency.py. With --concurrency
+alone the load is a closed loop (each client sends its next turn when the
+last one finishes); --rate switches to open-loop arrivals. --url benchmarks
+a server that is already running instead of starting one.
+"""
+import os
+import sys
+import json
+import math
+import time
+import random
+import socket
+import argparse
+import datetime
+import tempfile
+import threading
+import contextlib
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from latency import Distribution, parse_distribution
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TOOLS_DIR = os.path.join(REPO_ROOT, "tools")
+DEFAULT_OUTPUT_DIR = os.path.join(REPO_ROOT, "cache", "benchmarks")
+STARTUP_TIMEOUT_SECONDS = 60
+JOB_POLL_SECONDS = 0.5
+FINISHED_JOB_STAGES = ("completed", "timed_out", "error")
+# Questions reused by --repeat-ratio to exercise the response cache
+REPEATED_QUESTIONS = [f"What do you think about topic number {i}?" for i in range(10)]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def latency_summary(latencies):
+    values = sorted(latencies)
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "mean": round(sum(values) / len(values), 4),
+        "p50": round(percentile(values, 50), 4),
+        "p95": round(percentile(values, 95), 4),
+        "p99": round(percentile(values, 99), 4),
+        "max": round(values[-1], 4)
+    }
+
+
+def chat_outcome(status_code, payload):
+    """Classify a /chat response the way the app's metrics do, plus client-side failures."""
+    if status_code is None:
+        return "failed"
+    if status_code == 503:
+        return "rejected"
+    if status_code >= 400:
+        return "error"
+    return (payload or {}).get("Video Status", "error")
+
+
+def send_turn(session, base_url, message, job_mode=False, timeout=300, headers=None):
+    """Send one /chat turn and, in job mode, poll the job until it finishes.
+
+    Returns a dict with the latency in seconds, the HTTP status, the outcome
+    (completed, processing, error, rejected or failed) and any error text.
+    """
+    body = {"message": message}
+    if job_mode:
+        body["async"] = True
+    started = time.monotonic()
+    status_code, payload, error = None, None, None
+    try:
+        response = session.post(f"{base_url}/chat", json=body, headers=headers, timeout=timeout)
+        status_code = response.status_code
+        payload = response.json() if response.content else None
+        if status_code == 202:
+            job_url = f"{base_url}{response.headers.get('Location') or '/jobs/' + payload['Job ID']}"
+            while payload.get("Stage") not in FINISHED_JOB_STAGES:
+                if time.monotonic() - started > timeout:
+                    raise TimeoutError(f"Job still {payload.get('Stage')} after {timeout}s")
+                time.sleep(JOB_POLL_SECONDS)
+                response = session.get(job_url, timeout=timeout)
+                status_code, payload = response.status_code, response.json()
+                if status_code != 200:
+                    break
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        if status_code == 202:
+            status_code = None
+    outcome = chat_outcome(status_code, payload) if error is None else "failed"
+    if error is None and outcome == "error":
+        error = (payload or {}).get("error", f"HTTP {status_code}")
+    return {
+        "latency": time.monotonic() - started,
+        "status": status_code,
+        "outcome": outcome,
+        "error": error
+    }
+
+
+def summarize(results, duration):
+    """Throughput, error rate and latency percentiles for a list of send_turn() results."""
+    latencies = {}
+    for result in results:
+        latencies.setdefault(result["outcome"], []).append(result["latency"])
+    return summarize_latencies(latencies, {r["error"] for r in results if r["error"]}, duration)
+
+
+def summarize_latencies(latencies, errors, duration):
+    """The summary figures from latencies grouped by outcome and the distinct error texts."""
+    outcomes = {outcome: len(values) for outcome, values in latencies.items()}
+    total = sum(outcomes.values())
+    failures = outcomes.get("error", 0) + outcomes.get("failed", 0)
+    answered = [latency for outcome, values in latencies.items() if outcome != "failed" for latency in values]
+    return {
+        "requests": total,
+        "duration_seconds": round(duration, 3),
+        "throughput_rps": round(total / duration, 4) if duration > 0 else 0.0,
+        "completed_rps": round(outcomes.get("completed", 0) / duration, 4) if duration > 0 else 0.0,
+        "error_rate": round(failures / total, 4) if total else 0.0,
+        "rejected_rate": round(outcomes.get("rejected", 0) / total, 4) if total else 0.0,
+        "outcomes": outcomes,
+        "latency_seconds": latency_summary(answered),
+        "latency_by_outcome": {outcome: latency_summary(values) for outcome, values in sorted(latencies.items())},
+        "errors": sorted(errors)[:20]
+    }
+
+
+class ResourceSampler:
+    """Samples threads and sockets of the app's process tree and upstream calls in flight.
+
+    Threads and sockets come from /proc, so they are only available on Linux
+    for a server started (or given with --pid) by this tool. Upstream calls in
+    flight and admission queues come from the app's /stats.
+    """
+
+    def __init__(self, base_url, pid=None, interval=0.5):
+        self.base_url = base_url
+        self.pid = pid
+        self.interval = interval
+        self.samples = {"threads": [], "sockets": [], "upstream_in_flight": [], "admission_queued": []}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="resource-sampler", daemon=True)
+        self._session = requests.Session()
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def summary(self):
+        return {
+            name: {"peak": max(values), "mean": round(sum(values) / len(values), 2)} if values else None
+            for name, values in self.samples.items()
+        }
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            if self.pid is not None and os.path.isdir("/proc"):
+                threads, sockets = self._process_usage()
+                self.samples["threads"].append(threads)
+                self.samples["sockets"].append(sockets)
+            try:
+                stats = self._session.get(f"{self.base_url}/stats", timeout=2).json()
+            except (requests.RequestException, ValueError):
+                continue
+            pools = stats.get("http_pools") or {}
+            self.samples["upstream_in_flight"].append(sum(pool.get("in_flight", 0) for pool in pools.values()))
+            stages = stats.get("admission") or {}
+            self.samples["admission_queued"].append(sum(stage.get("queued", 0) for stage in stages.values()))
+
+    def _process_usage(self):
+        threads = sockets = 0
+        for pid in process_tree(self.pid):
+            try:
+                with open(f"/proc/{pid}/status") as f:
+                    threads += next(int(line.split()[1]) for line in f if line.startswith("Threads:"))
+                for fd in os.listdir(f"/proc/{pid}/fd"):
+                    if os.readlink(f"/proc/{pid}/fd/{fd}").startswith("socket:"):
+                        sockets += 1
+            except (OSError, StopIteration):
+                continue
+        return threads, sockets
+
+
+def process_tree(root_pid):
+    """``root_pid`` and all of its descendants, read from /proc."""
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # The command name may contain spaces, so parse after its closing parenthesis
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    tree, pending = [], [root_pid]
+    while pending:
+        pid = pending.pop()
+        tree.append(pid)
+        pending.extend(children.get(pid, []))
+    return tree
+
+
+def arrival_times(rate, duration, pattern):
+    """Seconds from the start at which open-loop turns arrive."""
+    if pattern == "constant":
+        return [i / rate for i in range(int(rate * duration))]
+    if pattern == "ramp":
+        # Rate climbs linearly from 0 to ``rate``, so n arrivals are due by sqrt(2 * duration * n / rate)
+        return [math.sqrt(2 * duration * n / rate) for n in range(int(rate * duration / 2))]
+    times, t = [], random.expovariate(rate)
+    while t < duration:
+        times.append(t)
+        t += random.expovariate(rate)
+    return times
+
+
+class LoadGenerator:
+    """Drives /chat in a closed loop (fixed concurrency) or with open-loop arrivals."""
+
+    def __init__(self, base_url, job_mode=False, repeat_ratio=0.0, timeout=300):
+        self.base_url = base_url
+        self.job_mode = job_mode
+        self.repeat_ratio = repeat_ratio
+        self.timeout = timeout
+        self.results = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._counter = 0
+
+    def _session(self):
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def _message(self):
+        with self._lock:
+            self._counter += 1
+            n = self._counter
+        if random.random() < self.repeat_ratio:
+            return random.choice(REPEATED_QUESTIONS)
+        return f"Benchmark question {n} ({os.getpid()}-{time.time_ns()}): how is your day going?"
+
+    def one(self):
+        result = send_turn(self._session(), self.base_url, self._message(), self.job_mode, self.timeout)
+        with self._lock:
+            self.results.append(result)
+
+    def closed_loop(self, concurrency, requests_total=None, duration=None):
+        deadline = time.monotonic() + duration if duration else None
+        remaining = [requests_total]
+
+        def take():
+            with self._lock:
+                if remaining[0] is not None:
+                    if remaining[0] <= 0:
+                        return False
+                    remaining[0] -= 1
+            return deadline is None or time.monotonic() < deadline
+
+        def client():
+            while take():
+                self.one()
+
+        clients = [threading.Thread(target=client, daemon=True) for _ in range(concurrency)]
+        for thread in clients:
+            thread.start()
+        for thread in clients:
+            thread.join()
+
+    def open_loop(self, rate, duration, pattern, max_outstanding):
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=max_outstanding, thread_name_prefix="client") as executor:
+            for at in arrival_times(rate, duration, pattern):
+                delay = started + at - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                executor.submit(self.one)
+
+
+def start_process(command, env, log_path):
+    log = open(log_path, "w")
+    return subprocess.Popen(command, cwd=REPO_ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+def wait_until_up(url, process, timeout=STARTUP_TIMEOUT_SECONDS):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"{url} exited with code {process.returncode} during startup")
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} didn't come up within {timeout}s")
+
+
+def stop_process(process):
+    if process.poll() is None:
+        process.terminate()
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+
+class Environment:
+    """The fake upstreams plus the app under test, started in a scratch directory."""
+
+    def __init__(self, args):
+        self.args = args
+        self.workdir = tempfile.mkdtemp(prefix="baybe-benchmark-")
+        self.processes = []
+        self.app = None
+        self.base_url = None
+
+    def __enter__(self):
+        try:
+            self._start()
+        except BaseException:
+            self.__exit__(None, None, None)
+            raise
+        return self
+
+    def _start(self):
+        args = self.args
+        openai_port, heygen_port, app_port = free_port(), free_port(), free_port()
+
+        fakes = [
+            ("fake_openai", [sys.executable, os.path.join(TOOLS_DIR, "fake_openai.py"), "--port", str(openai_port),
+                             "--latency", args.openai_latency.spec,
+                             "--first-token-latency", args.openai_first_token_latency.spec,
+                             "--fail-rate", str(args.openai_fail_rate)]
+                            + [option for value in args.openai_model_latency for option in ("--model-latency", value)],
+                            f"http://127.0.0.1:{openai_port}/"),
+            ("fake_heygen", [sys.executable, os.path.join(TOOLS_DIR, "fake_heygen.py"), "--port", str(heygen_port),
+                             "--render-seconds", args.render_seconds.spec,
+                             "--submit-latency", args.heygen_submit_latency.spec,
+                             "--fail-rate", str(args.render_fail_rate)], f"http://127.0.0.1:{heygen_port}/")
+        ]
+        for name, command, url in fakes:
+            process = start_process(command, os.environ.copy(), os.path.join(self.workdir, f"{name}.log"))
+            self.processes.append(process)
+            wait_until_up(url, process)
+
+        env = os.environ.copy()
+        env.update({
+            "PORT": str(app_port),
+            "OPENAI_API_KEY": "benchmark",
+            "HEYGEN_API_KEY": "benchmark",
+            "OPENAI_API_BASE": f"http://127.0.0.1:{openai_port}/v1",
+            "HEYGEN_API_BASE": f"http://127.0.0.1:{heygen_port}",
+            # Keep the benchmark away from the real caches and capacity profile
+            "RESPONSE_CACHE_PATH": os.path.join(self.workdir, "responses.sqlite3"),
+            "RENDER_REGISTRY_PATH": os.path.join(self.workdir, "renders.sqlite3"),
+            "REPLY_LIBRARY_PATH": os.path.join(self.workdir, "reply_library.json"),
+            "CAPACITY_PROFILE_PATH": os.path.join(self.workdir, "capacity.json"),
+            "LOG_LEVEL": "WARNING"
+        })
+        env.update(args.env)
+        if args.server == "flask":
+            command = [sys.executable, "app.py"]
+        else:
+            command = [sys.executable, "-m", "gunicorn", "--config", "gunicorn.conf.py"]
+        self.app = start_process(command, env, os.path.join(self.workdir, "app.log"))
+        self.processes.append(self.app)
+        self.base_url = f"http://127.0.0.1:{app_port}"
+        wait_until_up(f"{self.base_url}/stats", self.app)
+
+    def __exit__(self, *exc_info):
+        for process in reversed(self.processes):
+            stop_process(process)
+
+
+def git_revision():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=REPO_ROOT,
+                                    capture_output=True, text=True, check=True).stdout.strip())
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+
+def compare(result, baseline):
+    """Print the headline figures next to a baseline run's."""
+    rows = [
+        ("throughput_rps", lambda r: r["summary"]["throughput_rps"]),
+        ("error_rate", lambda r: r["summary"]["error_rate"]),
+        ("p50", lambda r: r["summary"]["latency_seconds"].get("p50")),
+        ("p95", lambda r: r["summary"]["latency_seconds"].get("p95")),
+        ("p99", lambda r: r["summary"]["latency_seconds"].get("p99")),
+        ("peak_threads", lambda r: (r["resources"].get("threads") or {}).get("peak")),
+        ("peak_sockets", lambda r: (r["resources"].get("sockets") or {}).get("peak"))
+    ]
+    print(f"\n{'':16}{'baseline':>12}{'this run':>12}{'change':>10}")
+    for name, value in rows:
+        before, after = value(baseline), value(result)
+        change = f"{(after - before) / before * 100:+.1f}%" if before and after is not None else ""
+        print(f"{name:16}{before if before is not None else '-':>12}{after if after is not None else '-':>12}{change:>10}")
+
+
+def print_summary(summary, resources):
+    latency = summary["latency_seconds"]
+    print(f"{summary['requests']} requests in {summary['duration_seconds']}s: "
+          f"{summary['throughput_rps']} req/s, error rate {summary['error_rate']:.2%}, "
+          f"rejected {summary['rejected_rate']:.2%}")
+    if latency["count"]:
+        print(f"latency p50 {latency['p50']}s  p95 {latency['p95']}s  p99 {latency['p99']}s  max {latency['max']}s")
+    print(f"outcomes: {summary['outcomes']}")
+    for name, usage in resources.items():
+        if usage:
+            print(f"{name}: peak {usage['peak']}, mean {usage['mean']}")
+
+
+def parse_env(value):
+    key, sep, setting = value.partition("=")
+    if not sep or not key:
+        raise argparse.ArgumentTypeError(f"Expected KEY=VALUE, got {value!r}")
+    return key, setting
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark /chat end to end against local API stand-ins")
+    load = parser.add_argument_group("load")
+    load.add_argument("--concurrency", type=int, default=10,
+                      help="Concurrent clients (closed loop), or the cap on outstanding turns with --rate")
+    load.add_argument("--requests", type=int, help="Stop after this many turns (closed loop)")
+    load.add_argument("--duration", type=float, help="Seconds to generate load for")
+    load.add_argument("--rate", type=float, help="Open-loop arrivals per second instead of a closed loop")
+    load.add_argument("--arrival", choices=("poisson", "constant", "ramp"), default="poisson",
+                      help="Open-loop arrival pattern; ramp climbs from 0 to --rate over --duration")
+    load.add_argument("--job-mode", action="store_true", help="Send async turns and poll /jobs until they finish")
+    load.add_argument("--repeat-ratio", type=float, default=0.0,
+                      help="Share of turns asking one of a few repeated questions (cache hits)")
+    load.add_argument("--timeout", type=float, default=300)
+
+    upstreams = parser.add_argument_group("upstream stand-ins")
+    upstreams.add_argument("--openai-latency", type=parse_distribution, default=Distribution("lognormal:1.5,0.4"))
+    upstreams.add_argument("--openai-model-latency", action="append", default=[], metavar="MODEL=DISTRIBUTION",
+                           help="Latency for one model, e.g. gpt-3.5-turbo=lognormal:0.6,0.3 (with GPT_MODELS)")
+    upstreams.add_argument("--openai-first-token-latency", type=parse_distribution, default=Distribution(0.4))
+    upstreams.add_argument("--openai-fail-rate", type=float, default=0.0)
+    upstreams.add_argument("--heygen-submit-latency", type=parse_distribution, default=Distribution("uniform:0.2,0.6"))
+    upstreams.add_argument("--render-seconds", type=parse_distribution, default=Distribution("normal:20,5"))
+    upstreams.add_argument("--render-fail-rate", type=float, default=0.0)
+
+    server = parser.add_argument_group("server")
+    server.add_argument("--server", choices=("gunicorn", "flask"), default="gunicorn")
+    server.add_argument("--env", type=parse_env, action="append", default=[], metavar="KEY=VALUE",
+                        help="Extra app environment, e.g. GUNICORN_WORKER_CLASS=gevent or ASYNC_MODE=1")
+    server.add_argument("--url", help="Benchmark this running server instead of starting one")
+    server.add_argument("--pid", type=int, help="With --url, the server's PID for thread and socket counts")
+
+    parser.add_argument("--output", help=f"Results file (default {os.path.relpath(DEFAULT_OUTPUT_DIR)}/<time>-<commit>.json)")
+    parser.add_argument("--baseline", help="Earlier results file to compare against")
+    args = parser.parse_args()
+    args.env = dict(args.env)
+    if args.rate is not None and not args.duration:
+        parser.error("--rate needs --duration")
+    if args.rate is None and args.requests is None and args.duration is None:
+        args.requests = 100
+
+    commit, dirty = git_revision()
+    started_at = datetime.datetime.now(datetime.timezone.utc)
+    with Environment(args) if args.url is None else contextlib.nullcontext() as environment:
+        if environment is not None:
+            base_url, pid = environment.base_url, environment.app.pid
+            print(f"App running at {base_url} (logs in {environment.workdir})")
+        else:
+            base_url, pid = args.url.rstrip("/"), args.pid
+
+        generator = LoadGenerator(base_url, args.job_mode, args.repeat_ratio, args.timeout)
+        sampler = ResourceSampler(base_url, pid).start()
+        began = time.monotonic()
+        if args.rate is not None:
+            generator.open_loop(args.rate, args.duration, args.arrival, args.concurrency)
+        else:
+            generator.closed_loop(args.concurrency, args.requests, args.duration)
+        duration = time.monotonic() - began
+        sampler.stop()
+
+    summary = summarize(generator.results, duration)
+    result = {
+        "commit": commit,
+        "dirty": dirty,
+        "started_at": started_at.isoformat(),
+        "config": {
+            key: value.spec if isinstance(value, Distribution) else value
+            for key, value in vars(args).items() if key not in ("output", "baseline")
+        },
+        "summary": summary,
+        "resources": sampler.summary()
+    }
+
+    output = args.output or os.path.join(
+        DEFAULT_OUTPUT_DIR, f"{started_at.strftime('%Y%m%d-%H%M%S')}-{(commit or 'unknown')[:8]}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(result, f, indent=2)
+
+    print_summary(summary, result["resources"])
+    print(f"Results written to {output}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(result, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
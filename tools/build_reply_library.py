@@ -0,0 +1,191 @@
+"""Build the pre-rendered reply library from logged traffic.
+
+Reads chat logs (the "Received chat request: {...}" records app.py writes) and
+JSONL request logs, picks the most frequent prompts and renders them ahead of
+time, so the server can answer them instantly from the library manifest:
+
+    python tools/build_reply_library.py app.log requests.jsonl --top 300 --concurrency 4
+
+Runs are resumable: prompts already in the manifest with a fresh video are
+skipped, and videos that were still rendering are waited on again instead of
+being generated from scratch. Needs the same environment as app.py.
+"""
+import os
+import ast
+import sys
+import json
+import time
+import argparse
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from response_cache import normalize_message
+from reply_library import REPLY_LIBRARY_PATH, load_manifest, save_manifest, is_fresh
+
+CHAT_LOG_MARKER = "Received chat request: "
+
+
+def iter_messages(path, field):
+    """Yield user messages from a chat log or a JSONL request log, one line at a time.
+
+    Chat logs may be in app.py's JSON format (LOG_FORMAT=json) or the text one.
+    """
+    with open(path, errors="replace") as f:
+        for line in f:
+            try:
+                data = json.loads(line)
+            except ValueError:
+                data = None
+            if isinstance(data, dict) and CHAT_LOG_MARKER in str(data.get("message", "")):
+                # A JSON log record; the request is in its message
+                line, data = data["message"], None
+
+            if data is None:
+                marker = line.find(CHAT_LOG_MARKER)
+                if marker == -1:
+                    continue
+                try:
+                    data = ast.literal_eval(line[marker + len(CHAT_LOG_MARKER):].strip())
+                except (ValueError, SyntaxError):
+                    continue
+            if isinstance(data, dict) and isinstance(data.get(field), str) and data[field].strip():
+                yield data[field]
+
+
+def count_prompts(paths, field):
+    """Count normalized prompts, remembering the most common original wording of each."""
+    counts = Counter()
+    variants = defaultdict(Counter)
+    for path in paths:
+        for message in iter_messages(path, field):
+            key = normalize_message(message)
+            counts[key] += 1
+            variants[key][message.strip()] += 1
+    wording = {key: variants[key].most_common(1)[0][0] for key in counts}
+    return counts, wording
+
+
+def select_prompts(counts, top, coverage, min_count):
+    """Pick the most frequent prompts until ``top`` prompts or ``coverage`` of traffic is reached."""
+    total = sum(counts.values())
+    selected = []
+    covered = 0
+    for key, count in counts.most_common():
+        if len(selected) >= top or count < min_count or (coverage and covered / total >= coverage):
+            break
+        selected.append(key)
+        covered += count
+    return selected
+
+
+def render_prompt(app, entry):
+    """Generate (or finish) the reply and video for one prompt.
+
+    Progress is recorded on ``entry`` as it happens, so a failed or timed-out
+    render keeps its reply and video ID for the next run.
+    """
+    message = entry["message"]
+    if not entry.get("reply"):
+        entry["reply"] = app.get_gpt_response(message)
+    if not entry.get("video_id"):
+        video_gen_response = app.submit_heygen_video(entry["reply"])
+        if "error" in video_gen_response:
+            raise RuntimeError(video_gen_response["error"])
+        entry["video_id"] = video_gen_response["data"]["video_id"]
+
+    try:
+        video_url = app.wait_for_video(entry["video_id"])
+    except app.VideoRenderError:
+        # Start over with a fresh render next time
+        entry.pop("video_id")
+        raise
+    if not video_url:
+        raise TimeoutError(f"Video {entry['video_id']} is still rendering; rerun to pick it up")
+    entry["video_url"] = video_url
+    entry["rendered_at"] = time.time()
+    entry.pop("error", None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-render the most frequent replies from logged traffic")
+    parser.add_argument("logs", nargs="+", help="Chat logs or JSONL request logs")
+    parser.add_argument("--field", default="message", help="JSONL field holding the user message")
+    parser.add_argument("--manifest", default=REPLY_LIBRARY_PATH)
+    parser.add_argument("--top", type=int, default=300, help="Maximum number of prompts to render")
+    parser.add_argument("--coverage", type=float, default=0.0,
+                        help="Stop selecting once this share of traffic is covered (0 = no limit)")
+    parser.add_argument("--min-count", type=int, default=2, help="Ignore prompts seen fewer times")
+    parser.add_argument("--concurrency", type=int, default=4, help="Prompts rendered at the same time")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would be rendered")
+    parser.add_argument("--report", help="Also write the report as JSON to this file")
+    args = parser.parse_args()
+
+    counts, wording = count_prompts(args.logs, args.field)
+    total = sum(counts.values())
+    if not total:
+        sys.exit("No chat messages found in the given logs")
+    selected = select_prompts(counts, args.top, args.coverage, args.min_count)
+
+    manifest = load_manifest(args.manifest)
+    report = {
+        "requests": total,
+        "distinct_prompts": len(counts),
+        "selected_prompts": len(selected),
+        "expected_hit_rate": round(sum(counts[key] for key in selected) / total, 4),
+        "rendered": 0,
+        "already_fresh": 0,
+        "failed": 0
+    }
+
+    if not args.dry_run:
+        import app
+
+        context = app.response_cache_key("")
+        if manifest.get("context") not in (None, context):
+            print("Manifest was built for a different prompt, avatar or voice; starting a new one")
+            manifest["entries"] = {}
+        manifest["context"] = context
+
+        todo = []
+        for key in selected:
+            entry = manifest["entries"].get(key)
+            if entry and is_fresh(entry):
+                entry["count"] = counts[key]
+                report["already_fresh"] += 1
+            else:
+                todo.append(key)
+
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            entries = {key: dict(manifest["entries"].get(key) or {}, message=wording[key]) for key in todo}
+            futures = {executor.submit(render_prompt, app, entries[key]): key for key in todo}
+            for future in as_completed(futures):
+                key = futures[future]
+                entry = entries[key]
+                try:
+                    future.result()
+                    report["rendered"] += 1
+                    print(f"Rendered: {wording[key]!r}")
+                except Exception as e:
+                    entry["error"] = str(e)
+                    report["failed"] += 1
+                    print(f"Failed: {wording[key]!r}: {e}")
+                entry["count"] = counts[key]
+                manifest["entries"][key] = entry
+                # Save after every prompt so an interrupted run loses nothing
+                save_manifest(args.manifest, manifest)
+
+        save_manifest(args.manifest, manifest)
+        fresh = [key for key, entry in manifest["entries"].items() if is_fresh(entry)]
+        report["library_entries"] = len(fresh)
+        report["library_hit_rate"] = round(sum(counts.get(key, 0) for key in fresh) / total, 4)
+
+    print(json.dumps(report, indent=2))
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
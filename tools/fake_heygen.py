@@ -0,0 +1,148 @@
+"""Local stand-in for the HeyGen API.
+
+Accepts /v2/video/generate, answers /v2/video/status and /v1/video.list and, when a callback URL
+is given, fires signed webhook callbacks once a fake render finishes.
+
+    python tools/fake_heygen.py --port 8001 --render-seconds 5 \
+        --callback-url http://localhost:10000/heygen/webhook --secret test-secret
+
+Then run the app with HEYGEN_API_BASE=http://localhost:8001 and
+HEYGEN_WEBHOOK_SECRET=test-secret. --render-seconds and --submit-latency also
+take a distribution such as normal:20,5 (see tools/latency.py).
+"""
+import hmac
+import json
+import time
+import uuid
+import hashlib
+import argparse
+import threading
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from latency import Distribution, parse_distribution
+
+
+class FakeHeyGen:
+    """Tracks fake renders and their completion times."""
+
+    def __init__(self, render_seconds, fail_rate=0.0, callback_url=None, secret=None, submit_latency=None):
+        self.render_seconds = render_seconds if isinstance(render_seconds, Distribution) else Distribution(render_seconds)
+        self.submit_latency = submit_latency or Distribution(0)
+        self.fail_rate = fail_rate
+        self.callback_url = callback_url
+        self.secret = secret
+        self.videos = {}
+        self.lock = threading.Lock()
+        self._counter = 0
+
+    def create(self):
+        video_id = uuid.uuid4().hex
+        render_seconds = self.render_seconds.sample()
+        with self.lock:
+            self._counter += 1
+            # Fail every Nth render so the failure rate is deterministic
+            fails = self.fail_rate > 0 and self._counter % max(1, round(1 / self.fail_rate)) == 0
+            self.videos[video_id] = {"ready_at": time.time() + render_seconds, "fails": fails}
+        if self.callback_url:
+            threading.Timer(render_seconds, self.send_callback, args=(video_id,)).start()
+        return video_id
+
+    def status(self, video_id):
+        with self.lock:
+            video = self.videos.get(video_id)
+        if video is None:
+            return None
+        if time.time() < video["ready_at"]:
+            return {"video_id": video_id, "status": "processing", "video_url": None}
+        if video["fails"]:
+            return {"video_id": video_id, "status": "failed", "video_url": None,
+                    "error": "Fake render failure"}
+        return {"video_id": video_id, "status": "completed",
+                "video_url": f"https://fake-heygen.local/videos/{video_id}.mp4"}
+
+    def list(self):
+        with self.lock:
+            video_ids = list(self.videos)
+        return [{"video_id": video_id, "status": self.status(video_id)["status"]}
+                for video_id in reversed(video_ids)]
+
+    def send_callback(self, video_id):
+        status = self.status(video_id)
+        if status["status"] == "completed":
+            payload = {"event_type": "avatar_video.success",
+                       "event_data": {"video_id": video_id, "url": status["video_url"]}}
+        else:
+            payload = {"event_type": "avatar_video.fail",
+                       "event_data": {"video_id": video_id, "msg": status.get("error")}}
+
+        body = json.dumps(payload).encode()
+        headers = {"Content-Type": "application/json"}
+        if self.secret:
+            headers["Signature"] = hmac.new(self.secret.encode(), body, hashlib.sha256).hexdigest()
+        try:
+            req = urllib.request.Request(self.callback_url, data=body, headers=headers, method="POST")
+            urllib.request.urlopen(req, timeout=10).read()
+        except Exception as e:
+            print(f"Callback for {video_id} failed: {e}")
+
+
+def make_handler(heygen):
+    class Handler(BaseHTTPRequestHandler):
+        def _send_json(self, status, payload):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            self.rfile.read(length)
+            if urlparse(self.path).path != "/v2/video/generate":
+                return self._send_json(404, {"error": "Not found"})
+            time.sleep(heygen.submit_latency.sample())
+            self._send_json(200, {"data": {"video_id": heygen.create()}})
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path == "/v1/video.list":
+                return self._send_json(200, {"code": 100, "data": {"videos": heygen.list()}})
+            if url.path != "/v2/video/status":
+                return self._send_json(404, {"error": "Not found"})
+            video_id = parse_qs(url.query).get("video_id", [None])[0]
+            status = heygen.status(video_id)
+            if status is None:
+                return self._send_json(404, {"error": "Unknown video_id"})
+            self._send_json(200, {"code": 100, "data": status})
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local fake HeyGen API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--render-seconds", type=parse_distribution, default=Distribution(5.0))
+    parser.add_argument("--submit-latency", type=parse_distribution, default=Distribution(0),
+                        help="Delay before answering /v2/video/generate")
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    parser.add_argument("--callback-url", help="Webhook URL to notify when a render finishes")
+    parser.add_argument("--secret", help="Webhook signing secret (HEYGEN_WEBHOOK_SECRET on the app)")
+    args = parser.parse_args()
+
+    heygen = FakeHeyGen(args.render_seconds, args.fail_rate, args.callback_url, args.secret, args.submit_latency)
+    # The default listen backlog of 5 drops connections under load tests
+    ThreadingHTTPServer.request_queue_size = 1024
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(heygen))
+    print(f"Fake HeyGen listening on http://{args.host}:{args.port}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""Local stand-in for the OpenAI chat completions API.
+
+Answers /v1/chat/completions, streamed or not, after a delay drawn from a
+latency distribution (see tools/latency.py). Streamed replies spread their
+tokens over that delay, starting after --first-token-latency.
+
+    python tools/fake_openai.py --port 8002 --latency lognormal:1.5,0.4 \
+        --model-latency gpt-3.5-turbo=lognormal:0.6,0.3
+
+Then run the app with OPENAI_API_BASE=http://localhost:8002/v1.
+"""
+import json
+import time
+import uuid
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from latency import Distribution, parse_distribution
+
+FILLER = "Ugh, fine. I suppose I can spare a moment for this, even though I really have better things to do."
+
+
+class FakeOpenAI:
+    """Builds canned replies and decides how long each one takes."""
+
+    def __init__(self, latency, first_token_latency=None, fail_rate=0.0, reply_words=20, model_latency=None):
+        self.latency = latency
+        self.model_latency = model_latency or {}
+        self.first_token_latency = first_token_latency or Distribution(0)
+        self.fail_rate = fail_rate
+        self.reply_words = reply_words
+        self.lock = threading.Lock()
+        self._counter = 0
+
+    def sample_latency(self, model):
+        return self.model_latency.get(model, self.latency).sample()
+
+    def should_fail(self):
+        with self.lock:
+            self._counter += 1
+            # Fail every Nth call so the failure rate is deterministic
+            return self.fail_rate > 0 and self._counter % max(1, round(1 / self.fail_rate)) == 0
+
+    def reply(self, messages):
+        question = messages[-1]["content"] if messages else ""
+        words = FILLER.split()
+        filler = " ".join(words[i % len(words)] for i in range(self.reply_words))
+        return f"You asked: {question[:80]}. {filler}"
+
+
+def completion(reply, model):
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": reply}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 0, "completion_tokens": len(reply.split()), "total_tokens": len(reply.split())}
+    }
+
+
+def chunk(completion_id, model, delta, finish_reason=None):
+    return {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+    }
+
+
+def make_handler(openai):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _send_json(self, status, payload):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            if self.path.rstrip("/") != "/v1/chat/completions":
+                return self._send_json(404, {"error": {"message": "Not found", "type": "invalid_request_error"}})
+
+            model = request.get("model", "gpt-4")
+            latency = openai.sample_latency(model)
+            if openai.should_fail():
+                time.sleep(latency)
+                return self._send_json(500, {"error": {"message": "Fake upstream failure", "type": "server_error"}})
+
+            reply = openai.reply(request.get("messages", []))
+            if not request.get("stream"):
+                time.sleep(latency)
+                return self._send_json(200, completion(reply, model))
+            self.stream(reply, model, latency)
+
+        def stream(self, reply, model, latency):
+            first_token = min(openai.first_token_latency.sample(), latency)
+            tokens = [word + " " for word in reply.split()]
+            gap = (latency - first_token) / max(1, len(tokens))
+            completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            time.sleep(first_token)
+            events = [chunk(completion_id, model, {"role": "assistant"})]
+            events += [chunk(completion_id, model, {"content": token}) for token in tokens]
+            events.append(chunk(completion_id, model, {}, "stop"))
+            for i, event in enumerate(events):
+                if 1 < i < len(events) - 1:
+                    time.sleep(gap)
+                self._write_chunk(f"data: {json.dumps(event)}\n\n")
+            self._write_chunk("data: [DONE]\n\n")
+            self.wfile.write(b"0\r\n\r\n")
+
+        def _write_chunk(self, text):
+            data = text.encode()
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def parse_model_latency(value):
+    model, sep, spec = value.partition("=")
+    if not sep or not model:
+        raise argparse.ArgumentTypeError(f"Expected MODEL=DISTRIBUTION, got {value!r}")
+    return model, parse_distribution(spec)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local fake OpenAI chat completions API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8002)
+    parser.add_argument("--latency", type=parse_distribution, default=Distribution(1.0),
+                        help="Time to the full reply, e.g. lognormal:1.5,0.4")
+    parser.add_argument("--first-token-latency", type=parse_distribution, default=Distribution(0.3),
+                        help="Time to the first streamed token")
+    parser.add_argument("--model-latency", type=parse_model_latency, action="append", default=[],
+                        metavar="MODEL=DISTRIBUTION", help="Latency for one model instead of --latency")
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    parser.add_argument("--reply-words", type=int, default=20)
+    args = parser.parse_args()
+
+    openai = FakeOpenAI(args.latency, args.first_token_latency, args.fail_rate, args.reply_words,
+                        dict(args.model_latency))
+    # The default listen backlog of 5 drops connections under load tests
+    ThreadingHTTPServer.request_queue_size = 1024
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(openai))
+    print(f"Fake OpenAI listening on http://{args.host}:{args.port}/v1")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""Local stand-in for an OTLP/HTTP trace collector.
+
+Accepts JSON-encoded spans on /v1/traces, appends them to a JSON lines file
+and prints each finished trace as an indented tree with durations:
+
+    python tools/fake_otlp.py --port 4318 --output traces.jsonl
+
+Then run the app with TRACE_EXPORTER=otlp (TRACE_OTLP_ENDPOINT defaults to
+http://localhost:4318/v1/traces).
+"""
+import json
+import argparse
+import threading
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SPAN_KIND_SERVER = 2
+
+
+def attribute_value(value):
+    for kind in ("stringValue", "boolValue", "doubleValue"):
+        if kind in value:
+            return value[kind]
+    if "intValue" in value:
+        return int(value["intValue"])
+    return None
+
+
+def flatten(payload):
+    """Yield plain span dicts from an OTLP ExportTraceServiceRequest."""
+    for resource_spans in payload.get("resourceSpans", []):
+        for scope_spans in resource_spans.get("scopeSpans", []):
+            for span in scope_spans.get("spans", []):
+                yield {
+                    "trace_id": span["traceId"],
+                    "span_id": span["spanId"],
+                    "parent_id": span.get("parentSpanId"),
+                    "name": span["name"],
+                    "kind": span.get("kind"),
+                    "duration_ms": (int(span["endTimeUnixNano"]) - int(span["startTimeUnixNano"])) / 1e6,
+                    "start_ns": int(span["startTimeUnixNano"]),
+                    "attributes": {a["key"]: attribute_value(a["value"]) for a in span.get("attributes", [])},
+                    "error": span.get("status", {}).get("message")
+                }
+
+
+class Collector:
+    """Stores received spans and prints each trace once its server span arrives."""
+
+    def __init__(self, output=None, quiet=False):
+        self.output = output
+        self.quiet = quiet
+        self.traces = defaultdict(list)
+        self.lock = threading.Lock()
+
+    def receive(self, spans):
+        with self.lock:
+            if self.output:
+                with open(self.output, "a") as f:
+                    f.write("".join(json.dumps(span) + "\n" for span in spans))
+            for span in spans:
+                self.traces[span["trace_id"]].append(span)
+            # The server span ends after the work it waited on, so its arrival means the
+            # trace is complete apart from background work such as job-mode renders
+            finished = [span["trace_id"] for span in spans if span["kind"] == SPAN_KIND_SERVER]
+            for trace_id in finished:
+                if not self.quiet:
+                    self.print_trace(self.traces[trace_id])
+                del self.traces[trace_id]
+
+    def print_trace(self, spans):
+        children = defaultdict(list)
+        ids = {span["span_id"] for span in spans}
+        for span in sorted(spans, key=lambda s: s["start_ns"]):
+            children[span["parent_id"] if span["parent_id"] in ids else None].append(span)
+
+        def show(span, depth):
+            attributes = ", ".join(f"{key}={value}" for key, value in span["attributes"].items())
+            error = f" ERROR: {span['error']}" if span["error"] else ""
+            print(f"{'  ' * depth}{span['name']} {span['duration_ms']:.1f}ms [{attributes}]{error}")
+            for child in children[span["span_id"]]:
+                show(child, depth + 1)
+
+        print(f"trace {spans[0]['trace_id']}")
+        for root in children[None]:
+            show(root, 1)
+
+
+def make_handler(collector):
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if self.path != "/v1/traces":
+                self.send_error(404)
+                return
+            try:
+                payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                collector.receive(list(flatten(payload)))
+            except (ValueError, KeyError) as e:
+                self.send_error(400, str(e))
+                return
+            body = b"{}"
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local OTLP/HTTP trace collector")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=4318)
+    parser.add_argument("--output", help="Also append received spans to this JSON lines file")
+    parser.add_argument("--quiet", action="store_true", help="Don't print traces")
+    args = parser.parse_args()
+
+    collector = Collector(args.output, args.quiet)
+    ThreadingHTTPServer.request_queue_size = 1024
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(collector))
+    print(f"Fake OTLP collector listening on http://{args.host}:{args.port}/v1/traces")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""Latency distributions for the local API stand-ins.
+
+A distribution is given as ``kind:params`` in seconds:
+
+    0.5                 always 0.5s (same as fixed:0.5)
+    uniform:0.2,1.0     anywhere between 0.2s and 1s
+    normal:20,5         mean 20s, standard deviation 5s (never below 0)
+    lognormal:1.5,0.4   median 1.5s with a long tail; 0.4 is the log-space sigma
+    exponential:2       mean 2s
+"""
+import math
+import random
+import argparse
+
+
+class Distribution:
+    """Draws delays from one of the distributions above."""
+
+    def __init__(self, spec):
+        self.spec = str(spec)
+        kind, _, params = self.spec.partition(":")
+        if not params:
+            kind, params = "fixed", kind
+        try:
+            values = [float(value) for value in params.split(",")]
+        except ValueError:
+            raise ValueError(f"Invalid latency distribution: {spec!r}") from None
+        samplers = {
+            "fixed": (1, lambda v: v[0]),
+            "uniform": (2, lambda v: random.uniform(v[0], v[1])),
+            "normal": (2, lambda v: random.gauss(v[0], v[1])),
+            "lognormal": (2, lambda v: v[0] * math.exp(random.gauss(0, v[1]))),
+            "exponential": (1, lambda v: random.expovariate(1 / v[0]) if v[0] > 0 else 0.0)
+        }
+        if kind not in samplers or len(values) != samplers[kind][0]:
+            raise ValueError(f"Invalid latency distribution: {spec!r}")
+        self._sample = samplers[kind][1]
+        self._values = values
+
+    def sample(self):
+        return max(0.0, self._sample(self._values))
+
+    def __repr__(self):
+        return f"Distribution({self.spec!r})"
+
+
+def parse_distribution(spec):
+    """argparse ``type`` for distribution options."""
+    try:
+        return Distribution(spec)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
@@ -0,0 +1,249 @@
+"""Replay a JSONL request log against a running server.
+
+Each line is a JSON object with the user message (--field, default
+"message") and, for timed replays, when it arrived (--time-field, default
+"timestamp": epoch seconds or an ISO 8601 string). app.py's own JSON logs
+(LOG_FORMAT=json) work too: their "Received chat request" records are
+replayed at their logged times. Lines are read one at a time, so logs of
+any size (and .gz files) can be replayed:
+
+    python tools/replay.py requests.jsonl --url http://localhost:10000            # original timing
+    python tools/replay.py requests.jsonl --url http://localhost:10000 --speed 10 # ten times faster
+    python tools/replay.py app.log.gz --url http://localhost:10000 --max-rate --max-outstanding 50
+
+Per-request latency and outcome go to a JSON lines file as they finish,
+with a summary next to it (same figures as tools/benchmark.py).
+"""
+import os
+import ast
+import sys
+import gzip
+import json
+import time
+import argparse
+import datetime
+import threading
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from benchmark import REPO_ROOT, send_turn, summarize_latencies, git_revision
+
+DEFAULT_OUTPUT_DIR = os.path.join(REPO_ROOT, "cache", "replays")
+CHAT_LOG_MARKER = "Received chat request: "
+LOG_TIME_FORMAT = "%Y-%m-%d %H:%M:%S,%f"
+MAX_DISTINCT_ERRORS = 20
+
+
+def parse_timestamp(value):
+    """Seconds since the epoch from a number, an ISO 8601 string or a log asctime, or None."""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    if not isinstance(value, str):
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    for parse in (datetime.datetime.fromisoformat, lambda v: datetime.datetime.strptime(v, LOG_TIME_FORMAT)):
+        try:
+            return parse(value).timestamp()
+        except ValueError:
+            continue
+    return None
+
+
+def open_log(path):
+    if path == "-":
+        return sys.stdin
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", errors="replace")
+    return open(path, errors="replace")
+
+
+def iter_requests(path, field, time_field):
+    """Yield (line number, timestamp or None, request dict) for each replayable line, lazily."""
+    with open_log(path) as f:
+        for number, line in enumerate(f, 1):
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if not isinstance(record, dict):
+                continue
+
+            if "logger" in record and "level" in record:
+                # One of app.py's JSON log records; only chat requests are replayed
+                logged = str(record.get("message", ""))
+                if not logged.startswith(CHAT_LOG_MARKER):
+                    continue
+                try:
+                    request = ast.literal_eval(logged[len(CHAT_LOG_MARKER):])
+                except (ValueError, SyntaxError):
+                    continue
+                timestamp = parse_timestamp(record.get("time"))
+            else:
+                request = record
+                timestamp = parse_timestamp(record.get(time_field))
+
+            if isinstance(request, dict) and isinstance(request.get(field), str) and request[field].strip():
+                yield number, timestamp, request
+
+
+class Recorder:
+    """Writes one JSON line per finished request and keeps what the summary needs."""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "w")
+        self._lock = threading.Lock()
+        self.latencies = {}
+        self.errors = set()
+        self.max_lag = 0.0
+
+    def record(self, entry):
+        with self._lock:
+            self._file.write(json.dumps(entry) + "\n")
+            # Compact arrays rather than lists: a multi-GB log means millions of entries
+            self.latencies.setdefault(entry["outcome"], array("d")).append(entry["latency"])
+            if entry["error"] and len(self.errors) < MAX_DISTINCT_ERRORS:
+                self.errors.add(entry["error"])
+            self.max_lag = max(self.max_lag, entry["lag"])
+
+    def close(self):
+        self._file.close()
+
+    def summary(self, duration):
+        summary = summarize_latencies(self.latencies, self.errors, duration)
+        # How far sends fell behind the log's timing; large values mean the replay couldn't keep up
+        summary["max_lag_seconds"] = round(self.max_lag, 3)
+        return summary
+
+
+class Replayer:
+    """Sends logged requests on the log's schedule (scaled by ``speed``) or as fast as allowed."""
+
+    def __init__(self, base_url, recorder, speed=1.0, max_rate=False, max_outstanding=100,
+                 job_mode=False, timeout=300, field="message"):
+        self.base_url = base_url
+        self.recorder = recorder
+        self.speed = speed
+        self.max_rate = max_rate
+        self.job_mode = job_mode
+        self.timeout = timeout
+        self.field = field
+        self._slots = threading.BoundedSemaphore(max_outstanding)
+        self._executor = ThreadPoolExecutor(max_workers=max_outstanding, thread_name_prefix="replay")
+        self._local = threading.local()
+
+    def _session(self):
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def run(self, records, limit=None):
+        """Replay ``records`` (from iter_requests); returns how many were sent."""
+        started = time.monotonic()
+        first_timestamp = None
+        offset = 0.0
+        sent = 0
+        try:
+            for number, timestamp, request in records:
+                if limit is not None and sent >= limit:
+                    break
+                if not self.max_rate and timestamp is not None:
+                    if first_timestamp is None:
+                        first_timestamp = timestamp
+                    # Lines without a time go out right after the previous one
+                    offset = max(offset, (timestamp - first_timestamp) / self.speed)
+                    delay = started + offset - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                # Waits here when max_outstanding requests are in flight, so the log is never read ahead
+                self._slots.acquire()
+                scheduled = offset if not self.max_rate else time.monotonic() - started
+                self._executor.submit(self._send, number, request, started, scheduled)
+                sent += 1
+        except KeyboardInterrupt:
+            print("Interrupted; waiting for requests in flight")
+        finally:
+            self._executor.shutdown(wait=True)
+        return sent
+
+    def _send(self, number, request, started, scheduled):
+        try:
+            sent_at = time.monotonic() - started
+            job_mode = self.job_mode or bool(request.get("async"))
+            result = send_turn(self._session(), self.base_url, request[self.field], job_mode, self.timeout)
+            self.recorder.record({
+                "line": number,
+                "scheduled": round(scheduled, 3),
+                "sent": round(sent_at, 3),
+                "lag": round(max(0.0, sent_at - scheduled), 3),
+                "latency": round(result["latency"], 4),
+                "status": result["status"],
+                "outcome": result["outcome"],
+                "error": result["error"]
+            })
+        finally:
+            self._slots.release()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a JSONL request log against a running server")
+    parser.add_argument("log", help="JSONL request log or app.py JSON log (.gz or - for stdin)")
+    parser.add_argument("--url", default="http://localhost:10000")
+    timing = parser.add_mutually_exclusive_group()
+    timing.add_argument("--speed", type=float, default=1.0, help="Replay this many times faster than logged")
+    timing.add_argument("--max-rate", action="store_true", help="Ignore timestamps and send as fast as allowed")
+    parser.add_argument("--max-outstanding", type=int, default=100, help="Requests in flight at once")
+    parser.add_argument("--field", default="message", help="JSONL field holding the user message")
+    parser.add_argument("--time-field", default="timestamp", help="JSONL field holding the arrival time")
+    parser.add_argument("--limit", type=int, help="Stop after this many requests")
+    parser.add_argument("--job-mode", action="store_true", help="Send every turn async and poll /jobs")
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--output", help=f"Per-request results (default {os.path.relpath(DEFAULT_OUTPUT_DIR)}/<time>.jsonl); "
+                                         "the summary goes next to it as .summary.json")
+    args = parser.parse_args()
+    if args.speed <= 0:
+        parser.error("--speed must be positive")
+
+    started_at = datetime.datetime.now(datetime.timezone.utc)
+    output = args.output or os.path.join(DEFAULT_OUTPUT_DIR, f"{started_at.strftime('%Y%m%d-%H%M%S')}.jsonl")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+
+    recorder = Recorder(output)
+    replayer = Replayer(args.url.rstrip("/"), recorder, args.speed, args.max_rate, args.max_outstanding,
+                        args.job_mode, args.timeout, args.field)
+    began = time.monotonic()
+    sent = replayer.run(iter_requests(args.log, args.field, args.time_field), args.limit)
+    duration = time.monotonic() - began
+    recorder.close()
+
+    commit, dirty = git_revision()
+    summary = recorder.summary(duration)
+    result = {
+        "commit": commit,
+        "dirty": dirty,
+        "started_at": started_at.isoformat(),
+        "config": {key: value for key, value in vars(args).items() if key != "output"},
+        "summary": summary
+    }
+    summary_path = os.path.splitext(output)[0] + ".summary.json"
+    with open(summary_path, "w") as f:
+        json.dump(result, f, indent=2)
+
+    latency = summary["latency_seconds"]
+    print(f"Replayed {sent} requests in {summary['duration_seconds']}s: {summary['throughput_rps']} req/s, "
+          f"error rate {summary['error_rate']:.2%}, rejected {summary['rejected_rate']:.2%}, "
+          f"max lag {summary['max_lag_seconds']}s")
+    if latency["count"]:
+        print(f"latency p50 {latency['p50']}s  p95 {latency['p95']}s  p99 {latency['p99']}s  max {latency['max']}s")
+    print(f"outcomes: {summary['outcomes']}")
+    print(f"Results written to {output} and {summary_path}")
+
+
+if __name__ == "__main__":
+    main()
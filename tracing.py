@@ -0,0 +1,293 @@
+import os
+import re
+import json
+import time
+import queue
+import random
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+
+import requests
+
+# Tracing configuration: TRACE_EXPORTER is "file", "otlp" or empty to turn tracing off
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "").lower()
+TRACE_FILE = os.getenv("TRACE_FILE", "cache/traces.jsonl")
+TRACE_OTLP_ENDPOINT = os.getenv("TRACE_OTLP_ENDPOINT", "http://localhost:4318/v1/traces")
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "1.0"))
+TRACE_SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "baybe")
+TRACE_QUEUE_SIZE = 10000
+TRACE_BATCH_SIZE = 512
+TRACE_FLUSH_SECONDS = 1.0
+
+# Span kinds, numbered as in OTLP
+KIND_INTERNAL = 1
+KIND_SERVER = 2
+KIND_CLIENT = 3
+
+TRACEPARENT_PATTERN = re.compile(r"^([0-9a-f]{2})-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+_current = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    """One timed operation in a trace."""
+
+    def __init__(self, name, trace_id, parent_id, sampled, kind, attributes):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = "%016x" % random.getrandbits(64)
+        self.parent_id = parent_id
+        self.sampled = sampled
+        self.kind = kind
+        self.attributes = attributes
+        self.error = None
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+
+    @property
+    def traceparent(self):
+        """This span as a W3C traceparent header value."""
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def set_error(self, error):
+        self.error = str(error)
+
+    def end(self):
+        if self.end_ns is None:
+            self.end_ns = time.time_ns()
+            if self.sampled and _exporter is not None:
+                _exporter.export(self)
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3),
+            "attributes": self.attributes,
+            "error": self.error
+        }
+
+
+class _NoopSpan:
+    """Stands in for a span when tracing is off, so callers never need to check."""
+
+    traceparent = None
+    sampled = False
+
+    def set(self, **attributes):
+        pass
+
+    def set_error(self, error):
+        pass
+
+    def end(self):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+def parse_traceparent(header):
+    """Return (trace_id, parent_id, sampled) from a traceparent header, or None if it's invalid."""
+    match = TRACEPARENT_PATTERN.match((header or "").strip().lower())
+    if not match:
+        return None
+    version, trace_id, parent_id, flags = match.groups()
+    if version == "ff" or trace_id == "0" * 32 or parent_id == "0" * 16:
+        return None
+    return trace_id, parent_id, bool(int(flags, 16) & 1)
+
+
+def current_span():
+    """The active span in this thread or task, or None."""
+    return _current.get()
+
+
+def start_span(name, parent=None, traceparent=None, kind=KIND_INTERNAL, **attributes):
+    """Start a span without making it current; call end() when done.
+
+    The parent is ``parent``, else the span in ``traceparent``, else the
+    current span. Without any of those the span starts a new trace.
+    """
+    if _exporter is None:
+        return NOOP_SPAN
+    if parent is None and traceparent is None:
+        parent = _current.get()
+    if isinstance(parent, Span):
+        return Span(name, parent.trace_id, parent.span_id, parent.sampled, kind, attributes)
+
+    incoming = parse_traceparent(traceparent)
+    if incoming:
+        trace_id, parent_id, sampled = incoming
+    else:
+        trace_id, parent_id = "%032x" % random.getrandbits(128), None
+        sampled = random.random() < TRACE_SAMPLE_RATE
+    return Span(name, trace_id, parent_id, sampled, kind, attributes)
+
+
+def activate(span):
+    """Make ``span`` the current span; returns a token for deactivate()."""
+    return _current.set(span if isinstance(span, Span) else None)
+
+
+def deactivate(token):
+    _current.reset(token)
+
+
+@contextmanager
+def span(name, parent=None, kind=KIND_INTERNAL, **attributes):
+    """Run the ``with`` block in a child span of the current one (or of ``parent``)."""
+    current = start_span(name, parent=parent, kind=kind, **attributes)
+    token = activate(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.set_error(e)
+        raise
+    finally:
+        deactivate(token)
+        current.end()
+
+
+class _Exporter:
+    """Ships finished spans from a bounded queue on one background thread."""
+
+    def __init__(self):
+        self._queue = queue.Queue(maxsize=TRACE_QUEUE_SIZE)
+        self._lock = threading.Lock()
+        self.exported = 0
+        self.dropped = 0
+        self.failed = 0
+        threading.Thread(target=self._run, name="trace-exporter", daemon=True).start()
+
+    def export(self, finished):
+        try:
+            self._queue.put_nowait(finished)
+        except queue.Full:
+            # Never hold up a request for tracing
+            with self._lock:
+                self.dropped += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "exporter": TRACE_EXPORTER,
+                "exported": self.exported,
+                "dropped": self.dropped,
+                "failed": self.failed,
+                "queued": self._queue.qsize()
+            }
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + TRACE_FLUSH_SECONDS
+            while len(batch) < TRACE_BATCH_SIZE:
+                try:
+                    batch.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            try:
+                self.write(batch)
+                with self._lock:
+                    self.exported += len(batch)
+            except Exception as e:
+                logging.error(f"Trace export failed: {str(e)}")
+                with self._lock:
+                    self.failed += len(batch)
+
+    def write(self, batch):
+        raise NotImplementedError
+
+
+class FileExporter(_Exporter):
+    """Appends spans to a JSON lines file, one span per line."""
+
+    def __init__(self, path=TRACE_FILE):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._path = path
+        super().__init__()
+
+    def write(self, batch):
+        with open(self._path, "a") as f:
+            f.write("".join(json.dumps(finished.to_dict()) + "\n" for finished in batch))
+
+
+class OtlpExporter(_Exporter):
+    """Posts spans to an OTLP/HTTP collector using the JSON encoding."""
+
+    def __init__(self, endpoint=TRACE_OTLP_ENDPOINT):
+        self._endpoint = endpoint
+        # Its own session: exports must not be traced themselves
+        self._session = requests.Session()
+        super().__init__()
+
+    def write(self, batch):
+        body = {
+            "resourceSpans": [{
+                "resource": {"attributes": _otlp_attributes({"service.name": TRACE_SERVICE_NAME})},
+                "scopeSpans": [{
+                    "scope": {"name": "baybe"},
+                    "spans": [_otlp_span(finished) for finished in batch]
+                }]
+            }]
+        }
+        response = self._session.post(self._endpoint, json=body, timeout=(5, 10))
+        response.raise_for_status()
+
+
+def _otlp_attributes(attributes):
+    converted = []
+    for key, value in attributes.items():
+        if isinstance(value, bool):
+            typed = {"boolValue": value}
+        elif isinstance(value, int):
+            typed = {"intValue": str(value)}
+        elif isinstance(value, float):
+            typed = {"doubleValue": value}
+        else:
+            typed = {"stringValue": str(value)}
+        converted.append({"key": key, "value": typed})
+    return converted
+
+
+def _otlp_span(finished):
+    otlp = {
+        "traceId": finished.trace_id,
+        "spanId": finished.span_id,
+        "name": finished.name,
+        "kind": finished.kind,
+        "startTimeUnixNano": str(finished.start_ns),
+        "endTimeUnixNano": str(finished.end_ns),
+        "attributes": _otlp_attributes(finished.attributes),
+        "status": {"code": 2, "message": finished.error} if finished.error else {"code": 1}
+    }
+    if finished.parent_id:
+        otlp["parentSpanId"] = finished.parent_id
+    return otlp
+
+
+def stats():
+    return _exporter.stats() if _exporter is not None else None
+
+
+if TRACE_EXPORTER == "file":
+    _exporter = FileExporter()
+elif TRACE_EXPORTER == "otlp":
+    _exporter = OtlpExporter()
+else:
+    if TRACE_EXPORTER:
+        logging.error(f"Unknown TRACE_EXPORTER {TRACE_EXPORTER!r}; tracing is off")
+    _exporter = None
@@ -0,0 +1,225 @@
+import os
+import hmac
+import time
+import hashlib
+import logging
+import threading
+import contextvars
+from concurrent.futures import Future
+
+import tracing
+
+# HeyGen webhook event types
+EVENT_VIDEO_SUCCESS = "avatar_video.success"
+EVENT_VIDEO_FAIL = "avatar_video.fail"
+
+# How long a callback that arrived before anyone waited on it is kept around
+EARLY_RESULT_TTL_SECONDS = 600
+
+# Shared status polling cadence
+POLL_INTERVAL_SECONDS = float(os.getenv("VIDEO_POLL_INTERVAL", "2"))
+POLL_MAX_CHECKS_PER_CYCLE = int(os.getenv("VIDEO_POLL_MAX_CHECKS", "10"))
+
+# HeyGen statuses for videos that are still rendering
+IN_PROGRESS_STATUSES = ("pending", "waiting", "processing")
+
+
+class VideoRenderError(Exception):
+    """Raised when HeyGen reports that a video failed to render."""
+
+
+def verify_signature(secret, body, signature):
+    """Check a HeyGen webhook signature (hex HMAC-SHA256 of the raw request body)."""
+    if not secret or not signature:
+        return False
+    expected = hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature.strip())
+
+
+def parse_event(payload):
+    """Extract (video_id, status, video_url, error) from a HeyGen webhook payload.
+
+    Returns None for events we don't care about.
+    """
+    if not isinstance(payload, dict):
+        raise ValueError("Webhook payload must be a dictionary")
+
+    event_type = payload.get('event_type')
+    event_data = payload.get('event_data') or {}
+    video_id = event_data.get('video_id')
+
+    if event_type == EVENT_VIDEO_SUCCESS:
+        if not video_id:
+            raise ValueError("Webhook payload missing 'video_id' in event_data")
+        return video_id, "completed", event_data.get('url'), None
+    if event_type == EVENT_VIDEO_FAIL:
+        if not video_id:
+            raise ValueError("Webhook payload missing 'video_id' in event_data")
+        return video_id, "failed", None, event_data.get('msg', 'Video rendering failed')
+    return None
+
+
+class _Watch:
+    """An outstanding video and the future its waiters share."""
+
+    def __init__(self, video_id, poll_after):
+        self.video_id = video_id
+        self.future = Future()
+        self.waiters = 0
+        self.poll_after = poll_after
+        self.last_checked = 0.0
+        self.started_at = time.time()
+        self.checks = 0
+        # Status checks run in the context (trace, request ID) of the turn that started waiting first
+        self.context = contextvars.copy_context()
+
+
+class VideoStatusPoller:
+    """Single background poller for every outstanding HeyGen video.
+
+    Callers get a Future per video ID; everyone waiting on the same video
+    shares it. One thread checks all outstanding videos on a shared cadence,
+    so status traffic depends on the poll interval rather than on how many
+    callers are waiting. Webhook callbacks resolve the same futures through
+    resolve().
+
+    ``fetch_status(video_id)`` returns HeyGen's status ``data`` dict for one
+    video. ``list_statuses()``, if given, returns ``{video_id: status}`` for
+    recent videos in one bulk call; only videos it reports as finished (or
+    doesn't report at all) are then fetched one by one.
+    """
+
+    def __init__(self, fetch_status, list_statuses=None, interval=POLL_INTERVAL_SECONDS,
+                 max_checks_per_cycle=POLL_MAX_CHECKS_PER_CYCLE):
+        self._fetch_status = fetch_status
+        self._list_statuses = list_statuses
+        self._interval = interval
+        self._max_checks_per_cycle = max_checks_per_cycle
+        self._watches = {}
+        self._early_results = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self.status_checks = 0
+        self.bulk_checks = 0
+        self.resolved = 0
+        self.completed = 0
+        self.wait_seconds = 0.0
+
+    def watch(self, video_id, poll_after=0.0):
+        """Start waiting on a video. Polling starts ``poll_after`` seconds from now.
+
+        Every call must be paired with release() once the caller stops waiting.
+        """
+        now = time.time()
+        with self._lock:
+            watch = self._watches.get(video_id)
+            if watch is None:
+                watch = self._watches[video_id] = _Watch(video_id, now + poll_after)
+                # A callback may have arrived before anyone started waiting
+                early = self._early_results.pop(video_id, None)
+                if early is not None:
+                    self._settle(watch, *early[1:])
+            watch.waiters += 1
+            self._ensure_thread()
+        return watch.future
+
+    def release(self, video_id):
+        """Stop waiting on a video; it is dropped once nobody is waiting on it."""
+        with self._lock:
+            watch = self._watches.get(video_id)
+            if watch is None:
+                return
+            watch.waiters -= 1
+            if watch.waiters <= 0:
+                del self._watches[video_id]
+
+    def resolve(self, video_id, status, video_url=None, error=None):
+        """Finish a video from a webhook callback. Returns True if anyone was waiting."""
+        now = time.time()
+        with self._lock:
+            watch = self._watches.get(video_id)
+            if watch is None:
+                # Nobody is waiting yet; keep the result for a late watch()
+                self._early_results[video_id] = (now, status, video_url, error)
+                self._prune(now)
+                return False
+            self._settle(watch, status, video_url, error)
+            return True
+
+    def stats(self):
+        with self._lock:
+            return {
+                "outstanding": len(self._watches),
+                "status_checks": self.status_checks,
+                "bulk_checks": self.bulk_checks,
+                "resolved": self.resolved,
+                "avg_wait_seconds": round(self.wait_seconds / self.completed, 2) if self.completed else 0.0
+            }
+
+    def _settle(self, watch, status, video_url=None, error=None):
+        if watch.future.done():
+            return
+        if status == "completed" and video_url:
+            watch.future.set_result(video_url)
+            self.completed += 1
+            self.wait_seconds += time.time() - watch.started_at
+        elif status == "failed":
+            watch.future.set_exception(VideoRenderError(error or "Video rendering failed"))
+        else:
+            return
+        self.resolved += 1
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="video-poller", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self._interval)
+            try:
+                self._poll_once()
+            except Exception as e:
+                logging.error(f"Video status poll failed: {str(e)}")
+
+    def _poll_once(self):
+        now = time.time()
+        with self._lock:
+            due = [w for w in self._watches.values()
+                   if not w.future.done() and w.poll_after <= now]
+        if not due:
+            return
+
+        if self._list_statuses:
+            # One bulk call tells us which videos are still rendering; only the
+            # rest need an individual status check
+            try:
+                with tracing.span("heygen.list_statuses", videos=len(due)):
+                    statuses = self._list_statuses()
+                with self._lock:
+                    self.bulk_checks += 1
+                due = [w for w in due if statuses.get(w.video_id) not in IN_PROGRESS_STATUSES]
+            except Exception as e:
+                logging.error(f"Bulk video status check failed: {str(e)}")
+
+        # Check the videos that have waited longest since their last check first
+        due.sort(key=lambda w: w.last_checked)
+        for watch in due[:self._max_checks_per_cycle]:
+            watch.last_checked = now
+            watch.checks += 1
+            data = watch.context.run(self._check, watch)
+            with self._lock:
+                self.status_checks += 1
+                if data:
+                    self._settle(watch, data.get('status'), data.get('video_url'), data.get('error'))
+
+    def _check(self, watch):
+        with tracing.span("heygen.status_check", video_id=watch.video_id, attempt=watch.checks) as span:
+            data = self._fetch_status(watch.video_id)
+            span.set(status=data.get('status') if data else "unknown")
+            return data
+
+    def _prune(self, now):
+        cutoff = now - EARLY_RESULT_TTL_SECONDS
+        for video_id in [v for v, result in self._early_results.items() if result[0] < cutoff]:
+            del self._early_results[video_id]
@@ -0,0 +1,162 @@
+"""WebSocket conversation channel.
+
+One connection per conversation. The client sends turns and the server pushes
+events back, tagged with the turn they belong to, so several turns can be in
+flight on the same connection. Each connection is one conversation for the
+server's memory of earlier turns; send a "session_id" with a turn to continue
+a conversation from an earlier connection instead:
+
+    -> {"type": "turn", "turn_id": "1", "message": "hi"}
+    <- {"type": "accepted", "turn_id": "1"}
+    <- {"type": "token", "turn_id": "1", "text": "Ugh"}
+    <- {"type": "text", "turn_id": "1", "text": "Ugh. Hi."}
+    <- {"type": "video", "turn_id": "1", "status": "completed", "video_url": "..."}
+    <- {"type": "done", "turn_id": "1"}
+
+Connections are served by an asyncio event loop, so idle connections cost no
+threads; only turns that are actually running use a thread from the executor.
+
+Run it next to the web process by setting WS_PORT, or on its own with
+``python ws_server.py``.
+"""
+import os
+import json
+import uuid
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from websockets.asyncio.server import serve
+from websockets.exceptions import ConnectionClosed
+
+from structured_logging import REQUEST_ID_PATTERN
+
+# WebSocket configuration
+WS_HOST = os.getenv("WS_HOST", "0.0.0.0")
+WS_PORT = int(os.getenv("WS_PORT", "0"))
+WS_MAX_CONNECTIONS = int(os.getenv("WS_MAX_CONNECTIONS", "10000"))
+WS_MAX_TURNS_PER_CONNECTION = int(os.getenv("WS_MAX_TURNS_PER_CONNECTION", "4"))
+WS_TURN_WORKERS = int(os.getenv("WS_TURN_WORKERS", "32"))
+WS_MAX_MESSAGE_BYTES = 64 * 1024
+MAX_TURN_ID_LENGTH = 64
+
+
+class ConversationServer:
+    """Asyncio WebSocket server that runs chat turns on a thread pool.
+
+    ``run_turn(user_message, emit, session_id)`` is called on an executor
+    thread and reports progress through ``emit(event, data)``.
+    """
+
+    def __init__(self, run_turn, host=WS_HOST, port=WS_PORT, max_workers=WS_TURN_WORKERS):
+        self._run_turn = run_turn
+        self.host = host
+        self.port = port
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ws-turn")
+        self._loop = None
+        self.connections = 0
+
+    def start_in_thread(self):
+        """Run the server on its own event loop in a daemon thread."""
+        thread = threading.Thread(target=lambda: asyncio.run(self.serve_forever()),
+                                  name="ws-server", daemon=True)
+        thread.start()
+        return thread
+
+    async def serve_forever(self):
+        self._loop = asyncio.get_running_loop()
+        # reuse_port lets every gunicorn worker bind the same port
+        async with serve(self._handle_connection, self.host, self.port,
+                         max_size=WS_MAX_MESSAGE_BYTES, reuse_port=True):
+            logging.info(f"WebSocket server listening on ws://{self.host}:{self.port}")
+            await asyncio.Future()
+
+    async def _handle_connection(self, websocket):
+        if self.connections >= WS_MAX_CONNECTIONS:
+            await websocket.close(1013, "Server is at its connection limit")
+            return
+
+        self.connections += 1
+        turns = {}
+        session_id = uuid.uuid4().hex
+        # Everything sent on this connection goes through one queue so events stay in order
+        outbox = asyncio.Queue()
+        writer = asyncio.create_task(self._write(websocket, outbox))
+        try:
+            async for raw in websocket:
+                self._handle_message(outbox, turns, raw, session_id)
+        except ConnectionClosed:
+            pass
+        finally:
+            self.connections -= 1
+            writer.cancel()
+            for task in list(turns.values()):
+                task.cancel()
+
+    async def _write(self, websocket, outbox):
+        while True:
+            payload = await outbox.get()
+            try:
+                await websocket.send(json.dumps(payload))
+            except ConnectionClosed:
+                return
+
+    def _handle_message(self, outbox, turns, raw, session_id):
+        try:
+            message = json.loads(raw)
+        except ValueError:
+            message = None
+        if not isinstance(message, dict):
+            outbox.put_nowait({"type": "error", "error": "Messages must be JSON objects"})
+            return
+
+        if message.get("type") == "ping":
+            outbox.put_nowait({"type": "pong"})
+            return
+
+        turn_id = message.get("turn_id")
+        # Turn IDs key the turns in flight and are echoed on every event, so only short strings will do
+        if turn_id is not None and (not isinstance(turn_id, str) or len(turn_id) > MAX_TURN_ID_LENGTH):
+            outbox.put_nowait({"type": "error",
+                               "error": f"turn_id must be a string of at most {MAX_TURN_ID_LENGTH} characters"})
+            return
+        if message.get("type") != "turn" or not turn_id or not isinstance(message.get("message"), str) \
+                or not message["message"]:
+            outbox.put_nowait({"type": "error", "turn_id": turn_id,
+                               "error": "Expected a turn with turn_id and message"})
+            return
+        session_id = message.get("session_id", session_id)
+        if not isinstance(session_id, str) or not REQUEST_ID_PATTERN.match(session_id):
+            outbox.put_nowait({"type": "error", "turn_id": turn_id, "error": "Invalid session_id"})
+            return
+        if turn_id in turns:
+            outbox.put_nowait({"type": "error", "turn_id": turn_id,
+                               "error": "Turn ID is already in flight"})
+            return
+        if len(turns) >= WS_MAX_TURNS_PER_CONNECTION:
+            outbox.put_nowait({"type": "error", "turn_id": turn_id,
+                               "error": "Too many turns in flight"})
+            return
+
+        turns[turn_id] = asyncio.create_task(self._run(outbox, turn_id, message["message"], session_id))
+        turns[turn_id].add_done_callback(lambda _: turns.pop(turn_id, None))
+        outbox.put_nowait({"type": "accepted", "turn_id": turn_id})
+
+    async def _run(self, outbox, turn_id, user_message, session_id):
+        def emit(event, data):
+            # Called from the executor thread; hand the event over to the event loop
+            payload = {"type": event, "turn_id": turn_id, **data}
+            self._loop.call_soon_threadsafe(outbox.put_nowait, payload)
+
+        await self._loop.run_in_executor(self._executor, self._run_turn, user_message, emit, session_id)
+        outbox.put_nowait({"type": "done", "turn_id": turn_id})
+
+
+if __name__ == "__main__":
+    # app starts a server of its own when WS_PORT is set; this process is the server instead
+    os.environ["WS_PORT"] = "0"
+    from app import run_turn
+
+    server = ConversationServer(run_turn, port=WS_PORT or 8765)
+    asyncio.run(server.serve_forever())